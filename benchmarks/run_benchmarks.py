@@ -0,0 +1,345 @@
+"""Benchmarks reproducibles de AudioApp
+
+Genera bibliotecas sintéticas con FFmpeg, sustituye yt-dlp por un descargador
+local y mide las operaciones críticas de la aplicación sobre la interfaz real
+(Tk oculto). Los resultados se guardan en JSON para compararlos con una línea base.
+
+Uso:
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --output resultados.json
+    python benchmarks/run_benchmarks.py --baseline base.json --output actual.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+sys.path.insert(0, SRC_DIR)
+
+# Formatos de las bibliotecas sintéticas (se reparten de forma cíclica)
+LIBRARY_FORMATS = ("mp3", "ogg", "flac", "wav", "m4a")
+SEARCH_QUERIES = ("track_00001", "track_1", "ogg", "zzz_sin_resultados")
+
+
+def ffmpeg_encode(output_file, duration, extra_args=()):
+    """Codifica un tono de prueba con FFmpeg"""
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi",
+               "-i", f"sine=frequency=440:duration={duration}", *extra_args, output_file]
+    subprocess.run(command, check=True)
+
+
+def generate_library(workdir, size):
+    """Crea (o reutiliza) una biblioteca sintética de `size` archivos pequeños"""
+    library_dir = os.path.join(workdir, f"library_{size}")
+    marker = os.path.join(library_dir, ".complete")
+    if os.path.exists(marker):
+        return library_dir
+
+    templates_dir = os.path.join(workdir, "templates")
+    os.makedirs(templates_dir, exist_ok=True)
+    templates = {}
+    for fmt in LIBRARY_FORMATS:
+        template = os.path.join(templates_dir, f"tone.{fmt}")
+        if not os.path.exists(template):
+            ffmpeg_encode(template, 2)
+        templates[fmt] = template
+
+    # Codificar una vez por formato y copiar: la generación es rápida y determinista
+    shutil.rmtree(library_dir, ignore_errors=True)
+    os.makedirs(library_dir)
+    for i in range(size):
+        fmt = LIBRARY_FORMATS[i % len(LIBRARY_FORMATS)]
+        shutil.copyfile(templates[fmt], os.path.join(library_dir, f"track_{i:06d}.{fmt}"))
+
+    open(marker, 'w').close()
+    return library_dir
+
+
+class FakeYoutubeDL:
+    """Sustituto local de yt_dlp.YoutubeDL que "descarga" un archivo generado"""
+    source_file = None
+
+    def __init__(self, params=None):
+        self.params = params or {}
+        self.downloaded = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def close(self):
+        pass
+
+    def extract_info(self, url, download=True):
+        video_id = url.rsplit("=", 1)[-1]
+        ext = os.path.splitext(self.source_file)[1][1:]
+        info = {"id": video_id, "title": f"Benchmark {video_id}", "ext": ext,
+                "uploader": "bench", "upload_date": "20240101", "duration": 30,
+                "filesize": os.path.getsize(self.source_file), "webpage_url": url}
+        if download:
+            return self.process_ie_result(info, download=True)
+        return info
+
+    def process_ie_result(self, info, download=True):
+        if download:
+            target = self.prepare_filename(info)
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            total = os.path.getsize(self.source_file)
+            for hook in self.params.get("progress_hooks", []):
+                hook({"status": "downloading", "downloaded_bytes": total // 2, "total_bytes": total})
+            shutil.copyfile(self.source_file, target)
+            for hook in self.params.get("progress_hooks", []):
+                hook({"status": "finished", "filename": target, "total_bytes": total})
+        return info
+
+    def prepare_filename(self, info):
+        template = self.params.get("outtmpl", "%(title)s.%(ext)s")
+        if isinstance(template, dict):
+            template = template.get("default", "%(title)s.%(ext)s")
+        return template % info
+
+
+def measure(function, repeat=5):
+    """Ejecuta `function` varias veces y devuelve estadísticas en segundos"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return {"min": min(samples), "median": statistics.median(samples), "samples": samples}
+
+
+def pump_events(root):
+    """Procesa los eventos pendientes de Tk"""
+    root.update_idletasks()
+    root.update()
+
+
+def run_size(app, root, library_dir, size, results):
+    """Ejecuta los benchmarks de biblioteca, búsqueda, colecciones y cola"""
+    app.config.set("download_path", library_dir)
+    files = sorted(os.path.join(library_dir, name) for name in os.listdir(library_dir)
+                   if not name.startswith("."))
+
+    # Escaneo en frío: índice vacío, se analiza cada archivo con mutagen
+    def cold_scan():
+        for filepath in list(app.library_index.tracks):
+            app.library_index.remove(filepath)
+        app.load_audio_files()
+    results[f"scan_cold[{size}]"] = measure(cold_scan, repeat=1)
+
+    # Escaneo en caliente: el índice ya está al día
+    results[f"scan_warm[{size}]"] = measure(app.load_audio_files, repeat=3)
+
+    # Análisis de metadatos de una muestra
+    sample = files[:min(len(files), 500)]
+    stats = measure(lambda: [app.probe_duration(filepath) for filepath in sample], repeat=3)
+    stats["files_per_sec"] = len(sample) / stats["median"]
+    results[f"metadata_probe[{size}]"] = stats
+
+    # Latencia de búsqueda
+    for query in SEARCH_QUERIES:
+        def search(query=query):
+            app.search_entry.delete(0, "end")
+            app.search_entry.insert(0, query)
+            app.search_audio_files()
+        results[f"search[{size}][{query}]"] = measure(search)
+
+    # Ordenación por columna (clic en la cabecera: ascendente y descendente)
+    for column in ("Nombre", "Duración", "Tamaño"):
+        def sort(column=column):
+            app.library_sort = []
+            app.sort_library(column)
+            app.sort_library(column)
+        stats = measure(sort)
+        stats["per_op"] = stats["median"] / 2
+        results[f"sort[{size}][{column}]"] = stats
+    app.library_sort = []
+    app.library_view.sort([])
+
+    # Pistas similares: vectores de características sintéticos y consulta de 50 vecinos
+    rng = random.Random(size)
+    for filepath in files:
+        app.library_index.update_extra(filepath, {"features": [rng.gauss(0, 1) for _ in range(app.similarity.FEATURE_COUNT)]})
+
+    def build_similarity():
+        app.similarity.invalidate()
+        app.similarity.build()
+    results[f"similar_build[{size}]"] = measure(build_similarity, repeat=3)
+    results[f"similar_query[{size}]"] = measure(lambda: app.similarity.similar(files[0], app.SIMILAR_COUNT))
+
+    # Carga de una colección con toda la biblioteca
+    collection_name = f"bench_{size}"
+    collection_file = os.path.join("collections", f"{collection_name}.json")
+    if os.path.exists(collection_file):
+        os.remove(collection_file)
+    app.add_files_to_collection(collection_name, files)
+    app.collections_listbox.insert("end", collection_name)
+    app.collections_listbox.selection_clear(0, "end")
+    app.collections_listbox.selection_set("end")
+    results[f"collection_load[{size}]"] = measure(lambda: app.load_collection_content(None), repeat=3)
+
+    # Cola: encolado masivo, reordenación y eliminación
+    app.play_queue.clear()
+    app.queue_tree.delete(*app.queue_tree.get_children())
+    results[f"queue_enqueue[{size}]"] = measure(lambda: app.enqueue_files(files), repeat=1)
+
+    middle_id = app.play_queue.ids()[len(app.play_queue) // 2]
+    app.queue_tree.selection_set(middle_id)
+
+    def reorder():
+        for _ in range(100):
+            app.move_in_queue(-1)
+            app.move_in_queue(1)
+    stats = measure(reorder)
+    stats["per_op"] = stats["median"] / 200
+    results[f"queue_reorder[{size}]"] = stats
+
+    def remove_head():
+        for _ in range(50):
+            # Las eliminaciones dejan huecos (None) al principio de la cola
+            app.queue_tree.selection_set(next(item_id for item_id in app.play_queue.order if item_id is not None))
+            app.remove_from_queue()
+    stats = measure(remove_head, repeat=1)
+    stats["per_op"] = stats["median"] / 50
+    results[f"queue_remove[{size}]"] = stats
+    pump_events(root)
+
+
+def run_conversion(app, musicapp, workdir, results, count=5):
+    """Mide el rendimiento de descarga y conversión con el descargador local"""
+    source_file = os.path.join(workdir, "templates", "source.m4a")
+    if not os.path.exists(source_file):
+        ffmpeg_encode(source_file, 30)
+    FakeYoutubeDL.source_file = source_file
+    musicapp.youtube_dl.YoutubeDL = FakeYoutubeDL
+
+    output_dir = os.path.join(workdir, "converted")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    app.config.set("download_path", output_dir)
+
+    # Un formato por descarga y, al final, varios perfiles a partir de una sola decodificación
+    app.profiles_var.set("")
+    for output_format in ("mp3", "ogg", "wav", "mp3@320k, ogg@192k, flac"):
+        if "@" in output_format:
+            app.profiles_var.set(output_format)
+        else:
+            app.format_var.set(output_format)
+        outputs = len(app.parse_export_profiles(app.profiles_var.get())) or 1
+        counter = iter(range(count * 100))
+
+        def convert():
+            app._download_and_convert_thread(f"https://bench.local/watch?v={next(counter)}", 0)
+        stats = measure(convert, repeat=count)
+        stats["files_per_sec"] = outputs / stats["median"]
+        stats["realtime_factor"] = 30 / stats["median"]
+        results[f"conversion[{output_format}]"] = stats
+    app.profiles_var.set("")
+
+
+def compare(results, baseline, threshold):
+    """Compara las medianas con la línea base y devuelve las regresiones"""
+    regressions = []
+    print(f"\n{'benchmark':45} {'base':>10} {'actual':>10} {'ratio':>7}")
+    for name, stats in sorted(results.items()):
+        if name not in baseline:
+            continue
+        base = baseline[name]["median"]
+        ratio = stats["median"] / base if base else float("inf")
+        flag = " <-- regresión" if ratio > 1 + threshold else ""
+        print(f"{name:45} {base:10.4f} {stats['median']:10.4f} {ratio:7.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=BENCH_DIR).stdout.strip()
+    except Exception:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de AudioApp")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Tamaños de biblioteca (p. ej. 1000 10000 100000)")
+    parser.add_argument("--workdir", default=os.path.join(BENCH_DIR, ".work"),
+                        help="Carpeta para bibliotecas generadas y estado de la aplicación")
+    parser.add_argument("--output", default="benchmark_results.json", help="Archivo JSON de resultados")
+    parser.add_argument("--baseline", help="Resultados anteriores con los que comparar")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Empeoramiento relativo tolerado antes de marcar regresión")
+    parser.add_argument("--skip-conversion", action="store_true", help="No medir la conversión")
+    args = parser.parse_args()
+
+    output_file = os.path.abspath(args.output)
+    baseline_file = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+
+    libraries = {size: generate_library(workdir, size) for size in args.sizes}
+
+    # La aplicación guarda configuración, colecciones e índice en el directorio actual
+    app_dir = os.path.join(workdir, "app")
+    shutil.rmtree(app_dir, ignore_errors=True)
+    os.makedirs(app_dir)
+    os.chdir(app_dir)
+
+    import MusicApp as musicapp
+    # Los diálogos bloquearían el benchmark
+    musicapp.messagebox.showinfo = lambda *a, **k: None
+    musicapp.messagebox.showwarning = lambda *a, **k: None
+    musicapp.messagebox.showerror = lambda title, message, **k: print(f"  error: {message}")
+    musicapp.messagebox.askyesno = lambda *a, **k: True
+
+    root = musicapp.tk.Tk()
+    root.withdraw()
+    app = musicapp.AudioManagerApp(root)
+
+    results = {}
+    for size, library_dir in libraries.items():
+        print(f"Biblioteca de {size} archivos...")
+        run_size(app, root, library_dir, size, results)
+    if not args.skip_conversion:
+        print("Conversión...")
+        run_conversion(app, musicapp, workdir, results)
+    root.destroy()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "revision": git_revision(),
+        },
+        "results": results,
+    }
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Resultados guardados en {output_file}")
+
+    if baseline_file:
+        with open(baseline_file, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regresión(es) por encima del {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
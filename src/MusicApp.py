@@ -6,9 +6,43 @@ import threading
 import sys
 from pathlib import Path
 from datetime import datetime
-import queue
 import warnings
 import subprocess
+import shutil
+import tempfile
+import io
+import base64
+import urllib.request
+import bisect
+import heapq
+import time
+import random
+import logging
+import cProfile
+import functools
+import socket
+import secrets
+import hashlib
+import unicodedata
+import difflib
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import escape
+from collections import OrderedDict, deque
+from urllib.parse import urlparse, quote, unquote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin reflinks, solo enlaces duros o copia
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
 
 def setup_environment():
     """Configura FFmpeg y VLC automáticamente"""
@@ -118,6 +152,55 @@ def setup_environment():
     
     return ffmpeg_configured, vlc_configured
 
+# Instancia única: puerto y token de la ventana ya abierta
+INSTANCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".instance.json")
+# Bloqueo que toma la primera ejecución antes de configurar nada (el sistema lo suelta al cerrarse)
+INSTANCE_LOCK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".instance.lock")
+# Tiempo que una ejecución posterior espera a que la primera abra su socket (s)
+INSTANCE_STARTUP_TIMEOUT = 30
+
+def acquire_instance_lock():
+    """Toma el bloqueo exclusivo de la instancia; devuelve el archivo abierto o None si lo tiene otra"""
+    handle = open(INSTANCE_LOCK_FILE, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+def forward_to_running_instance(args):
+    """Envía los argumentos a la instancia abierta; devuelve True si los ha recibido"""
+    try:
+        with open(INSTANCE_FILE, 'r', encoding='utf-8') as f:
+            instance = json.load(f)
+        args = [os.path.abspath(arg) if os.path.exists(arg) else arg for arg in args]
+        with socket.create_connection(("127.0.0.1", instance["port"]), timeout=1) as connection:
+            connection.sendall(json.dumps({"token": instance["token"], "args": args}).encode('utf-8') + b"\n")
+            return connection.makefile('r', encoding='utf-8').readline().strip() == "ok"
+    except (OSError, ValueError, KeyError):
+        # No hay otra instancia (o el archivo quedó de una sesión que se cerró mal)
+        return False
+
+# Una nueva ejecución solo pasa sus argumentos a la ventana abierta y termina, sin configurar nada.
+# La comprobación es el bloqueo, no la conexión: dos ejecuciones simultáneas no pueden pasar ambas
+instance_lock = None
+if __name__ == "__main__" and "--new-instance" not in sys.argv:
+    instance_lock = acquire_instance_lock()
+    if instance_lock is None:
+        # La otra instancia puede estar arrancando todavía: se reintenta hasta que abra su socket
+        deadline = time.monotonic() + INSTANCE_STARTUP_TIMEOUT
+        while not forward_to_running_instance(sys.argv[1:]):
+            if time.monotonic() > deadline:
+                print("La instancia abierta no responde; usa --new-instance para abrir otra ventana.")
+                sys.exit(1)
+            time.sleep(0.2)
+        sys.exit(0)
+
 # Ejecutar configuración al importar
 ffmpeg_ok, vlc_ok = setup_environment()
 
@@ -126,16 +209,18 @@ try:
     from pytube import YouTube
     from pytube.exceptions import VideoUnavailable, RegexMatchError
     from pydub import AudioSegment
-    from pydub.exceptions import CouldntDecodeError
-    from mutagen.easyid3 import EasyID3
     from mutagen.id3 import ID3, APIC
-    from mutagen.mp3 import MP3
+    from mutagen.flac import FLAC, Picture
+    from mutagen.mp4 import MP4, MP4Cover
+    from mutagen.oggvorbis import OggVorbis
+    from mutagen import File as MutagenFile
     from PIL import Image, ImageTk
     import vlc
     import yt_dlp as youtube_dl
+    import numpy as np
 except ImportError as e:
     print(f"Error: {e}. Por favor, instala las dependencias necesarias.")
-    print("Ejecuta: pip install pytube pydub mutagen Pillow python-vlc yt-dlp")
+    print("Ejecuta: pip install pytube pydub mutagen Pillow python-vlc yt-dlp numpy")
     sys.exit(1)
 
 # Configuración de la aplicación
@@ -151,7 +236,23 @@ class Config:
             "bitrate": "128k",
             "volume": 70,
             "recent_collections": [],
-            "window_size": "800x600"
+            "window_size": "800x600",
+            "log_max_lines": 500,
+            "download_log_file": "",
+            "instrumentation": False,
+            "metrics_port": 0,
+            "export_profiles": "",
+            "split_chapters": False,
+            "split_silence": False,
+            "scratch_path": "temp",
+            "scratch_budget_mb": 0,
+            "min_free_mb": 500,
+            "stage_in_scratch": False,
+            "media_cache_size": 8,
+            "max_concurrent_downloads": 3,
+            "per_host_downloads": 2,
+            "bandwidth_limit_kbps": 0,
+            "sync_targets": {}
         }
         self.load_config()
         
@@ -174,54 +275,2263 @@ class Config:
         self.data[key] = value
         self.save_config()
 
-# Clase principal de la aplicación
-class AudioManagerApp:
-    def __init__(self, root):
+# Instrumentación opcional
+class Metrics:
+    """Contadores, histogramas de duración y perfilado bajo demanda de operaciones"""
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    OPERATIONS = ("scan", "probe", "download", "convert", "playback_start", "ui_refresh")
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.profile_target = None
+        self.profile_dir = "profiles"
+        self.last_profile = None
+        self.http_server = None
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = {"buckets": [0] * (len(self.BUCKETS) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+                self.histograms[name] = histogram
+            histogram["buckets"][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["max"] = max(histogram["max"], seconds)
+
+    @contextmanager
+    def span(self, name):
+        """Mide la duración de un bloque y lo perfila si es la operación elegida"""
+        if not self.enabled and self.profile_target != name:
+            yield
+            return
+
+        profiler = None
+        if self.profile_target == name:
+            self.profile_target = None
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._save_profile(profiler, name)
+            if self.enabled:
+                self.observe(name, elapsed)
+
+    def timed(self, name):
+        """Decorador equivalente a span() para un método completo"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _save_profile(self, profiler, name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile_file = os.path.join(self.profile_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        profiler.dump_stats(profile_file)
+        self.last_profile = profile_file
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def _percentile(histogram, fraction):
+        """Estimación del percentil a partir de los límites de los cubos"""
+        target = histogram["count"] * fraction
+        cumulative = 0
+        for bound, count in zip(Metrics.BUCKETS + (histogram["max"],), histogram["buckets"]):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, histogram["max"])
+        return histogram["max"]
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {}
+            for name, histogram in self.histograms.items():
+                histograms[name] = {
+                    "count": histogram["count"],
+                    "sum": histogram["sum"],
+                    "mean": histogram["sum"] / histogram["count"],
+                    "p50": self._percentile(histogram, 0.5),
+                    "p95": self._percentile(histogram, 0.95),
+                    "max": histogram["max"],
+                    "buckets": dict(zip([str(bound) for bound in self.BUCKETS] + ["+Inf"], histogram["buckets"])),
+                }
+            return {"counters": dict(self.counters), "histograms": histograms}
+
+    def to_prometheus(self):
+        """Formato de texto de Prometheus"""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE audioapp_{name}_total counter")
+                lines.append(f"audioapp_{name}_total {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"audioapp_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in self.BUCKETS] + ["+Inf"], histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum {histogram['sum']}")
+                lines.append(f"{metric}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Guarda las métricas en JSON o en texto de Prometheus según la extensión"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith(".json"):
+                json.dump(self.snapshot(), f, indent=4)
+            else:
+                f.write(self.to_prometheus())
+
+    def start_http_server(self, port):
+        """Sirve /metrics (Prometheus) y /metrics.json en localhost"""
+        if self.http_server is not None or not port:
+            return
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.snapshot()), "application/json"
+                elif self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+metrics = Metrics()
+
+# Registro compacto de una pista
+class Track:
+    """Metadatos de una pista con __slots__; los textos de la interfaz solo se generan al mostrarla"""
+    __slots__ = ("path", "format", "size", "duration", "mtime", "added", "group", "extra", "name_key")
+    BASE_FIELDS = ("path", "name", "format", "size", "duration", "mtime", "added", "group")
+    # Etiquetas editables (claves de la interfaz "easy" de mutagen), guardadas en `extra`
+    TAG_FIELDS = ("title", "artist", "album", "genre", "date", "tracknumber")
+    # Datos de `extra` que describen el contenido exacto del archivo y dejan de valer al reescribirlo
+    CONTENT_FIELDS = ("checksum", "checksum_size", "checksum_mtime", "integrity", "analysis_error")
+
+    def __init__(self, path, size, mtime, duration=None, added=None, group=None, extra=None):
+        # La misma cadena de la ruta sirve de clave en el índice: no se duplica
+        self.path = path
+        self.format = sys.intern(os.path.splitext(path)[1][1:].upper())
+        self.size = int(size)
+        self.duration = int(round(duration)) if duration is not None else None
+        self.mtime = mtime
+        self.added = int(added) if added is not None else None
+        self.group = group
+        self.extra = extra
+        # Clave de ordenación precalculada: sin mayúsculas ni acentos
+        self.name_key = self.normalize(self.name)
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @staticmethod
+    def normalize(text):
+        decomposed = unicodedata.normalize("NFKD", text)
+        return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+    def get_extra(self, key, default=None):
+        return self.extra.get(key, default) if self.extra else default
+
+    def verified_checksum(self):
+        """Suma de verificación guardada, solo si se calculó para el tamaño y la fecha actuales"""
+        if self.get_extra("checksum_size") == self.size and self.get_extra("checksum_mtime") == self.mtime:
+            return self.get_extra("checksum")
+        return None
+
+    def kept_extra(self):
+        """Datos adicionales que siguen valiendo después de reescribir el archivo"""
+        if not self.extra:
+            return None
+        extra = {key: value for key, value in self.extra.items() if key not in self.CONTENT_FIELDS}
+        return extra or None
+
+    def set_extra(self, key, value):
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def tags(self):
+        return {field: self.extra[field] for field in self.TAG_FIELDS if self.extra and self.extra.get(field)}
+
+    def set_tags(self, tags):
+        """Aplica etiquetas; un valor vacío elimina la etiqueta"""
+        for field, value in tags.items():
+            if value:
+                self.set_extra(field, value)
+            elif self.extra:
+                self.extra.pop(field, None)
+        if self.extra is not None and not self.extra:
+            self.extra = None
+
+    def tag_text(self):
+        """Texto normalizado de las etiquetas para la búsqueda"""
+        return self.normalize("\n".join(self.tags().values()))
+
+    def to_dict(self):
+        data = {"path": self.path, "size": self.size, "mtime": self.mtime,
+                "duration": self.duration, "added": self.added}
+        if self.group:
+            data["group"] = self.group
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {key: value for key, value in data.items() if key not in cls.BASE_FIELDS}
+        return cls(data["path"], data["size"], data["mtime"], data.get("duration"),
+                   data.get("added"), data.get("group"), extra or None)
+
+# Índice de la biblioteca de audio
+class LibraryIndex:
+    """Metadatos de las pistas con índices secundarios para colecciones inteligentes"""
+    NUMERIC_FIELDS = ("duration", "size", "added", "mtime")
+    OPERATORS = ("=", "!=", ">", ">=", "<", "<=", "contiene", "últimos días")
+
+    def __init__(self, index_file="library_index.json"):
+        self.index_file = index_file
+        self.tracks = {}
+        self.by_format = {}
+        self.by_group = {}
+        self.sorted_keys = {field: [] for field in self.NUMERIC_FIELDS}
+        self.sorted_paths = {field: [] for field in self.NUMERIC_FIELDS}
+        self.tag_text = {}
+        self.smart_rules = {}
+        self.smart_members = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for record in data.get("tracks", []):
+                    self._add_to_indexes(Track.from_dict(record), insert_sorted=False)
+            except Exception as e:
+                print(f"Error al cargar el índice de la biblioteca: {e}")
+        self._rebuild_sorted()
+
+    def _rebuild_sorted(self):
+        """Reconstruye los índices ordenados de una sola vez (carga inicial)"""
+        for field in self.NUMERIC_FIELDS:
+            pairs = sorted((getattr(record, field), path) for path, record in self.tracks.items()
+                           if getattr(record, field) is not None)
+            self.sorted_keys[field] = [value for value, _ in pairs]
+            self.sorted_paths[field] = [path for _, path in pairs]
+
+    def save(self):
+        """Escribe el índice a disco si ha cambiado"""
+        if not self.dirty:
+            return
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"version": 2, "tracks": [record.to_dict() for record in self.tracks.values()]}, f)
+        os.replace(tmp_file, self.index_file)
+        self.dirty = False
+
+    def get(self, filepath):
+        return self.tracks.get(filepath)
+
+    def is_current(self, filepath, stat):
+        """Indica si la entrada del índice sigue siendo válida para el archivo"""
+        record = self.tracks.get(filepath)
+        return record is not None and record.size == stat.st_size and record.mtime == stat.st_mtime
+
+    def variants(self, filepath):
+        """Otras versiones (formatos) de la misma pista"""
+        record = self.tracks.get(filepath)
+        if record is None or not record.group:
+            return []
+        return sorted(path for path in self.by_group.get(record.group, ()) if path != filepath)
+
+    def sort_key(self, field):
+        """Función de clave para ordenar rutas por un campo ya calculado del registro"""
+        tracks = self.tracks
+        missing = -1 if field in self.NUMERIC_FIELDS else ""
+
+        def key(path):
+            record = tracks.get(path)
+            value = getattr(record, field) if record is not None else None
+            return missing if value is None else value
+        return key
+
+    def upsert(self, record):
+        """Añade o actualiza una pista y las colecciones inteligentes afectadas"""
+        previous = self.tracks.get(record.path)
+        if previous is not None:
+            if record.added is None:
+                record.added = previous.added
+            if record.group is None:
+                record.group = previous.group
+            self._remove_from_indexes(previous)
+        if record.added is None:
+            record.added = int(datetime.now().timestamp())
+        self._add_to_indexes(record)
+        self.dirty = True
+        self._update_smart_membership(record)
+
+    def update_tags(self, filepath, tags):
+        """Aplica etiquetas editadas al registro sin volver a analizar el archivo"""
+        record = self.tracks.get(filepath)
+        if record is None:
+            return
+        record.set_tags(tags)
+        text = record.tag_text()
+        if text:
+            self.tag_text[filepath] = text
+        else:
+            self.tag_text.pop(filepath, None)
+        self.dirty = True
+        self._update_smart_membership(record)
+
+    def update_extra(self, filepath, values):
+        """Guarda datos adicionales del registro (p. ej. el resultado de la verificación)"""
+        record = self.tracks.get(filepath)
+        if record is None:
+            return
+        for key, value in values.items():
+            record.set_extra(key, value)
+        self.dirty = True
+        self._update_smart_membership(record)
+
+    def broken(self):
+        """Pistas cuya última verificación de integridad falló"""
+        return sorted(path for path, record in self.tracks.items()
+                      if record.get_extra("integrity", "ok") != "ok")
+
+    @staticmethod
+    def fuzzy_key(text):
+        """Texto normalizado solo con letras y números, para comparar nombres aproximados"""
+        return " ".join("".join(c if c.isalnum() else " " for c in Track.normalize(text)).split())
+
+    def resolve(self, entries, cutoff=0.85):
+        """Asocia en bloque entradas de una lista (ubicación, título, duración) a pistas; devuelve (rutas, no encontradas)"""
+        # Copia de las pistas: se puede llamar desde otro hilo
+        tracks = list(self.tracks.items())
+        by_path = {}
+        by_name = {}
+        by_key = {}
+        for path, record in tracks:
+            by_path[os.path.normcase(os.path.normpath(path))] = path
+            by_name.setdefault(record.name_key, []).append(record)
+            by_key.setdefault(self.fuzzy_key(os.path.splitext(record.name)[0]), []).append(record)
+            title = record.get_extra("title")
+            if title:
+                artist = record.get_extra("artist")
+                by_key.setdefault(self.fuzzy_key(f"{artist} - {title}" if artist else title), []).append(record)
+        # Para la búsqueda aproximada solo se comparan claves con el mismo comienzo
+        prefixes = {}
+        for key in by_key:
+            prefixes.setdefault(key[:2], []).append(key)
+
+        def closest(candidates, duration):
+            if len(candidates) == 1 or not duration:
+                return candidates[0].path
+            return min(candidates, key=lambda record: abs((record.duration or 0) - duration)).path
+
+        resolved = []
+        missing = []
+        for location, title, duration in entries:
+            path = by_path.get(os.path.normcase(os.path.normpath(location)))
+            if path is None and "://" not in location and os.path.isfile(location):
+                path = location
+            if path is None:
+                # Archivo movido o con otra extensión: por nombre y después por título
+                candidates = by_name.get(Track.normalize(os.path.basename(location)))
+                keys = [self.fuzzy_key(os.path.splitext(os.path.basename(location))[0])]
+                if title:
+                    keys.append(self.fuzzy_key(title))
+                for key in keys:
+                    if candidates:
+                        break
+                    if not key:
+                        # Un nombre sin letras ni números no sirve para buscar: se prueba el título
+                        continue
+                    candidates = by_key.get(key)
+                    if not candidates:
+                        match = difflib.get_close_matches(key, prefixes.get(key[:2], ()), n=1, cutoff=cutoff)
+                        candidates = by_key[match[0]] if match else None
+                if candidates:
+                    path = closest(candidates, duration)
+            if path is None:
+                missing.append(location)
+            else:
+                resolved.append(path)
+        return resolved, missing
+
+    def search(self, query, paths):
+        """Rutas de `paths` cuyo nombre o etiquetas contienen el texto buscado"""
+        query = Track.normalize(query)
+        tracks = self.tracks
+        tag_text = self.tag_text
+        return [path for path in paths
+                if (path in tracks and query in tracks[path].name_key) or query in tag_text.get(path, "")]
+
+    def _update_smart_membership(self, record):
+        for name, rules in self.smart_rules.items():
+            if self.matches(record, rules):
+                self.smart_members[name].add(record.path)
+            else:
+                self.smart_members[name].discard(record.path)
+
+    def remove(self, filepath):
+        record = self.tracks.get(filepath)
+        if record is None:
+            return
+        self._remove_from_indexes(record)
+        self.dirty = True
+        for members in self.smart_members.values():
+            members.discard(filepath)
+
+    def _add_to_indexes(self, record, insert_sorted=True):
+        path = record.path
+        self.tracks[path] = record
+        self.by_format.setdefault(record.format, set()).add(path)
+        if record.group:
+            self.by_group.setdefault(record.group, set()).add(path)
+        if record.extra:
+            text = record.tag_text()
+            if text:
+                self.tag_text[path] = text
+        if not insert_sorted:
+            return
+        for field in self.NUMERIC_FIELDS:
+            value = getattr(record, field)
+            if value is None:
+                continue
+            keys = self.sorted_keys[field]
+            position = bisect.bisect_right(keys, value)
+            keys.insert(position, value)
+            self.sorted_paths[field].insert(position, path)
+
+    def _remove_from_indexes(self, record):
+        path = record.path
+        del self.tracks[path]
+        self.tag_text.pop(path, None)
+        self.by_format.get(record.format, set()).discard(path)
+        if record.group:
+            group = self.by_group.get(record.group, set())
+            group.discard(path)
+            if not group:
+                self.by_group.pop(record.group, None)
+        for field in self.NUMERIC_FIELDS:
+            value = getattr(record, field)
+            if value is None:
+                continue
+            keys = self.sorted_keys[field]
+            paths = self.sorted_paths[field]
+            start = bisect.bisect_left(keys, value)
+            end = bisect.bisect_right(keys, value)
+            for position in range(start, end):
+                if paths[position] == path:
+                    del keys[position]
+                    del paths[position]
+                    break
+
+    # Evaluación de reglas
+    @staticmethod
+    def _rule_value(rule):
+        if rule["op"] == "últimos días":
+            return datetime.now().timestamp() - float(rule["value"]) * 86400
+        return rule["value"]
+
+    def matches(self, record, rules):
+        """Comprueba si una pista cumple todas las reglas"""
+        for rule in rules:
+            field, op = rule["field"], rule["op"]
+            value = self._rule_value(rule)
+            actual = getattr(record, field, None)
+            if actual is None:
+                actual = record.get_extra(field)
+            if actual is None:
+                return False
+            if op == "contiene":
+                if str(value).lower() not in str(actual).lower():
+                    return False
+                continue
+            if field == "format":
+                actual, value = actual.upper(), str(value).upper()
+            if op == "=" and not actual == value:
+                return False
+            if op == "!=" and not actual != value:
+                return False
+            if op == ">" and not actual > value:
+                return False
+            if op in (">=", "últimos días") and not actual >= value:
+                return False
+            if op == "<" and not actual < value:
+                return False
+            if op == "<=" and not actual <= value:
+                return False
+        return True
+
+    def _candidates(self, rule):
+        """Conjunto de rutas que cumple una regla usando los índices, o None si no hay índice"""
+        field, op = rule["field"], rule["op"]
+        value = self._rule_value(rule)
+        if field == "format" and op == "=":
+            return set(self.by_format.get(str(value).upper(), ()))
+        if field not in self.NUMERIC_FIELDS or op not in (">", ">=", "<", "<=", "=", "últimos días"):
+            return None
+        keys = self.sorted_keys[field]
+        paths = self.sorted_paths[field]
+        if op == ">":
+            return set(paths[bisect.bisect_right(keys, value):])
+        if op in (">=", "últimos días"):
+            return set(paths[bisect.bisect_left(keys, value):])
+        if op == "<":
+            return set(paths[:bisect.bisect_left(keys, value)])
+        if op == "<=":
+            return set(paths[:bisect.bisect_right(keys, value)])
+        return set(paths[bisect.bisect_left(keys, value):bisect.bisect_right(keys, value)])
+
+    def query(self, rules):
+        """Devuelve las rutas que cumplen todas las reglas"""
+        indexed = []
+        remaining = []
+        for rule in rules:
+            candidates = self._candidates(rule)
+            if candidates is None:
+                remaining.append(rule)
+            else:
+                indexed.append(candidates)
+
+        if indexed:
+            indexed.sort(key=len)
+            result = indexed[0].intersection(*indexed[1:])
+        else:
+            result = set(self.tracks)
+
+        if remaining:
+            result = {path for path in result if self.matches(self.tracks[path], remaining)}
+        return result
+
+    # Colecciones inteligentes
+    def register_smart_collection(self, name, rules):
+        self.smart_rules[name] = rules
+        self.smart_members[name] = self.query(rules)
+
+    def unregister_smart_collection(self, name):
+        self.smart_rules.pop(name, None)
+        self.smart_members.pop(name, None)
+
+    def smart_collection_files(self, name):
+        """Rutas de una colección inteligente ordenadas por nombre"""
+        rules = self.smart_rules.get(name, [])
+        members = self.smart_members.get(name, set())
+        # Las reglas relativas a la fecha solo pueden expulsar pistas con el paso del tiempo
+        relative = [rule for rule in rules if rule["op"] == "últimos días"]
+        if relative:
+            members = {path for path in members if self.matches(self.tracks[path], relative)}
+        return sorted(members, key=lambda path: self.tracks[path].name.lower())
+
+# Características de audio y búsqueda de pistas parecidas
+class SimilarityIndex:
+    """Matriz de características normalizada: las pistas parecidas salen de un producto escalar"""
+    SAMPLE_RATE = 22050
+    FRAME_SIZE = 2048
+    HOP_SIZE = 512
+    MEL_BANDS = 26
+    MFCC_COUNT = 13
+    # Solo se analizan los primeros minutos de cada pista
+    ANALYSIS_SECONDS = 120
+    MIN_BPM, MAX_BPM = 60, 200
+    # Un pulso más rápido (1/2 o 2/3 del periodo) con esta fracción de la autocorrelación se prefiere
+    FASTER_PULSE_RATIO = 0.8
+    # Niveles métricos más rápidos que se comprueban: mitad del periodo y dos tercios (subdivisión ternaria)
+    FASTER_PULSES = ((1, 2), (2, 3))
+    # Tramas por bloque de la FFT: acota la memoria con pistas largas
+    CHUNK_FRAMES = 256
+    # tempo, centroide (media, desviación), volumen (media, desviación) y MFCC (medias, desviaciones)
+    FEATURE_COUNT = 5 + 2 * MFCC_COUNT
+
+    def __init__(self, library_index):
+        self.library_index = library_index
+        self.paths = []
+        self.positions = {}
+        self.matrix = None
+
+    def invalidate(self):
+        self.matrix = None
+
+    @classmethod
+    def extract(cls, filepath):
+        """Decodifica la pista con FFmpeg (mono, 22 kHz) y devuelve (características, BPM)"""
+        command = [AudioSegment.converter, "-nostdin", "-v", "error", "-i", filepath, "-map", "0:a:0",
+                   "-t", str(cls.ANALYSIS_SECONDS), "-ac", "1", "-ar", str(cls.SAMPLE_RATE), "-f", "f32le", "-"]
+        with metrics.span("analyze"):
+            result = subprocess.run(command, capture_output=True,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+            if result.returncode != 0:
+                stderr = result.stderr.decode(errors="replace").strip()
+                raise RuntimeError(stderr.splitlines()[-1] if stderr else "FFmpeg falló")
+            return cls.features(np.frombuffer(result.stdout, dtype=np.float32))
+
+    @classmethod
+    def features(cls, signal):
+        """Calcula el vector de características de una señal mono con operaciones vectorizadas"""
+        if len(signal) < cls.FRAME_SIZE * 8:
+            raise ValueError("Audio demasiado corto para analizarlo")
+        frames = np.lib.stride_tricks.sliding_window_view(signal, cls.FRAME_SIZE)[::cls.HOP_SIZE]
+        window = np.hanning(cls.FRAME_SIZE).astype(np.float32)
+        bins = cls.FRAME_SIZE // 2 + 1
+        weights = np.linspace(0, 1, bins)
+        mel_filters = cls._mel_filters(bins).T
+
+        # El espectro se calcula por bloques y solo se guardan los resúmenes de cada trama
+        loudness = np.empty(len(frames))
+        centroid = np.empty(len(frames))
+        log_mel = np.empty((len(frames), cls.MEL_BANDS))
+        for start in range(0, len(frames), cls.CHUNK_FRAMES):
+            chunk = frames[start:start + cls.CHUNK_FRAMES]
+            spectrum = np.abs(np.fft.rfft(chunk * window, axis=1))
+            # Volumen por trama (dBFS)
+            loudness[start:start + len(chunk)] = 20 * np.log10(np.sqrt(np.mean(chunk ** 2, axis=1)) + 1e-9)
+            # Centroide espectral, relativo a la frecuencia de Nyquist
+            centroid[start:start + len(chunk)] = (spectrum @ weights) / (spectrum.sum(axis=1) + 1e-9)
+            # Energía en bandas mel
+            log_mel[start:start + len(chunk)] = np.log((spectrum ** 2) @ mel_filters + 1e-10)
+        # Coeficientes cepstrales sobre bandas mel
+        mfcc = log_mel @ cls._dct_matrix().T
+        # Tempo a partir de los ataques (subidas de energía en las bandas mel)
+        onsets = np.maximum(np.diff(log_mel, axis=0), 0).sum(axis=1)
+        bpm = cls._tempo(onsets - onsets.mean())
+
+        vector = np.concatenate(([bpm, centroid.mean(), centroid.std(), loudness.mean(), loudness.std()],
+                                 mfcc.mean(axis=0), mfcc.std(axis=0)))
+        return [round(float(value), 4) for value in vector], round(bpm)
+
+    @classmethod
+    def _mel_filters(cls, bins):
+        """Banco de filtros triangulares en escala mel"""
+        mel_max = 2595 * np.log10(1 + cls.SAMPLE_RATE / 2 / 700)
+        edges = 700 * (10 ** (np.linspace(0, mel_max, cls.MEL_BANDS + 2) / 2595) - 1)
+        edges = edges / (cls.SAMPLE_RATE / 2) * (bins - 1)
+        positions = np.arange(bins)
+        lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+        return np.maximum(0, np.minimum((positions - lower) / (center - lower), (upper - positions) / (upper - center)))
+
+    @classmethod
+    def _dct_matrix(cls):
+        """Matriz de la DCT-II para pasar de bandas mel a coeficientes cepstrales"""
+        bands = np.arange(cls.MEL_BANDS) + 0.5
+        return np.cos(np.pi / cls.MEL_BANDS * np.outer(np.arange(cls.MFCC_COUNT), bands))
+
+    @classmethod
+    def _tempo(cls, onsets):
+        """BPM con la mayor autocorrelación de la envolvente de ataques"""
+        frame_rate = cls.SAMPLE_RATE / cls.HOP_SIZE
+        min_lag = int(frame_rate * 60 / cls.MAX_BPM)
+        max_lag = int(frame_rate * 60 / cls.MIN_BPM)
+        if len(onsets) <= max_lag:
+            return 0.0
+        # Autocorrelación con la FFT (relleno para que no sea circular)
+        transform = np.fft.rfft(onsets, 2 * len(onsets))
+        autocorrelation = np.fft.irfft(np.abs(transform) ** 2)[:len(onsets)]
+        # Un periodo no entero reparte el pico entre retardos vecinos, así que se comparan sumas de tres
+        strength = np.convolve(autocorrelation, np.ones(3), mode="same")
+        lags = np.arange(min_lag, max_lag + 1)
+        # Preferencia suave por tempos cercanos a 120 BPM para no elegir múltiplos del pulso
+        prior = np.exp(-0.5 * np.log2(60 * frame_rate / lags / 120) ** 2)
+        lag = lags[int(np.argmax(strength[lags] * prior))]
+        # Con acentos cada dos pulsos o corcheas seguidas gana un múltiplo del periodo: si un pulso
+        # más rápido es casi igual de fuerte, ese es el tempo (el retardo solo disminuye, así que termina)
+        faster = True
+        while faster:
+            faster = False
+            for numerator, denominator in cls.FASTER_PULSES:
+                candidate = round(lag * numerator / denominator)
+                if candidate - 1 >= min_lag and strength[candidate] >= cls.FASTER_PULSE_RATIO * strength[lag]:
+                    lag = candidate - 1 + int(np.argmax(autocorrelation[candidate - 1:candidate + 2]))
+                    faster = True
+                    break
+        return 60 * frame_rate / lag
+
+    def build(self):
+        """Estandariza cada característica y normaliza los vectores para comparar por coseno"""
+        paths = []
+        rows = []
+        for path, record in self.library_index.tracks.items():
+            features = record.get_extra("features")
+            if features and len(features) == self.FEATURE_COUNT:
+                paths.append(path)
+                rows.append(features)
+        self.paths = paths
+        self.positions = {path: position for position, path in enumerate(paths)}
+        if not rows:
+            self.matrix = np.zeros((0, self.FEATURE_COUNT), dtype=np.float32)
+            return
+        matrix = np.asarray(rows, dtype=np.float32)
+        matrix -= matrix.mean(axis=0)
+        matrix /= matrix.std(axis=0) + 1e-6
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-6
+        self.matrix = matrix
+
+    def similar(self, filepath, count):
+        """Las `count` pistas más parecidas a `filepath`, de la más a la menos parecida"""
+        if self.matrix is None:
+            self.build()
+        position = self.positions.get(filepath)
+        if position is None:
+            return []
+        scores = self.matrix @ self.matrix[position]
+        # Ni la propia pista ni sus versiones en otros formatos
+        scores[position] = -np.inf
+        for variant in self.library_index.variants(filepath):
+            if variant in self.positions:
+                scores[self.positions[variant]] = -np.inf
+        count = min(count, len(scores) - 1)
+        if count <= 0:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best])]
+        tracks = self.library_index.tracks
+        return [self.paths[index] for index in best
+                if scores[index] > -np.inf and self.paths[index] in tracks]
+
+# Detección de la calidad real (archivos recodificados a más bitrate del que tenía el origen)
+class BitrateDetector:
+    """Estima el bitrate real de un archivo con pérdida a partir de su frecuencia de corte"""
+    SAMPLE_RATE = 44100
+    WINDOW_SIZE = 8192
+    WINDOW_COUNT = 64
+    # Bins de la FFT que se promedian en cada banda (~86 Hz)
+    BAND_BINS = 16
+    # Caída respecto al nivel medio de 1-8 kHz a partir de la cual no se considera contenido
+    CUTOFF_DROP_DB = 70
+    ANALYSIS_SECONDS = 300
+    # Frecuencia de corte típica de los codificadores (LAME, AAC) para cada bitrate
+    CUTOFF_BITRATES = ((11000, 64), (15000, 96), (16500, 128), (17500, 160), (19500, 192), (20300, 256))
+    LOSSY_FORMATS = ("mp3", "m4a", "ogg")
+    # Margen antes de marcar un archivo como sobredimensionado
+    OVERSIZE_RATIO = 1.25
+
+    @classmethod
+    def extract(cls, filepath):
+        """Decodifica la pista con FFmpeg y devuelve (frecuencia de corte, bitrate real, bitrate nominal)"""
+        nominal = None
+        audio = MutagenFile(filepath)
+        if audio is not None and getattr(audio.info, "bitrate", 0):
+            nominal = round(audio.info.bitrate / 1000)
+        command = [AudioSegment.converter, "-nostdin", "-v", "error", "-i", filepath, "-map", "0:a:0",
+                   "-t", str(cls.ANALYSIS_SECONDS), "-ac", "1", "-ar", str(cls.SAMPLE_RATE), "-f", "f32le", "-"]
+        with metrics.span("quality"):
+            result = subprocess.run(command, capture_output=True,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+            if result.returncode != 0:
+                stderr = result.stderr.decode(errors="replace").strip()
+                raise RuntimeError(stderr.splitlines()[-1] if stderr else "FFmpeg falló")
+            cutoff = cls.cutoff(np.frombuffer(result.stdout, dtype=np.float32))
+        return cutoff, cls.effective_bitrate(cutoff), nominal
+
+    @classmethod
+    def cutoff(cls, signal):
+        """Frecuencia más alta con contenido, a partir del espectro medio de ventanas repartidas por la pista"""
+        if len(signal) < cls.WINDOW_SIZE * 4:
+            raise ValueError("Audio demasiado corto para analizarlo")
+        starts = np.linspace(0, len(signal) - cls.WINDOW_SIZE, cls.WINDOW_COUNT).astype(np.int64)
+        windows = signal[starts[:, None] + np.arange(cls.WINDOW_SIZE)]
+        # Las ventanas en silencio solo aportarían ruido
+        energy = np.mean(windows ** 2, axis=1)
+        windows = windows[energy > energy.max() * 1e-4]
+        if not len(windows):
+            raise ValueError("La pista está en silencio")
+
+        power = np.mean(np.abs(np.fft.rfft(windows * np.hanning(cls.WINDOW_SIZE), axis=1)) ** 2, axis=0)
+        bands = power[:len(power) // cls.BAND_BINS * cls.BAND_BINS].reshape(-1, cls.BAND_BINS).mean(axis=1)
+        level = 10 * np.log10(bands + 1e-20)
+        band_hz = cls.BAND_BINS * cls.SAMPLE_RATE / cls.WINDOW_SIZE
+        reference = level[int(1000 / band_hz):int(8000 / band_hz)].mean()
+        above = np.nonzero(level > reference - cls.CUTOFF_DROP_DB)[0]
+        return int(round(above[-1] * band_hz)) if len(above) else 0
+
+    @classmethod
+    def effective_bitrate(cls, cutoff):
+        for limit, bitrate in cls.CUTOFF_BITRATES:
+            if cutoff < limit:
+                return bitrate
+        return 320
+
+    @classmethod
+    def is_oversized(cls, record):
+        """Archivo con pérdida codificado con bastante más bitrate del que justifica su contenido"""
+        nominal = record.get_extra("bitrate")
+        effective = record.get_extra("effective_bitrate")
+        return (record.format.lower() in cls.LOSSY_FORMATS and nominal is not None and effective is not None
+                and nominal > effective * cls.OVERSIZE_RATIO)
+
+# Listas de reproducción en otros formatos
+class Playlists:
+    """Lectura y escritura por streaming de listas M3U/M3U8, PLS, XSPF y JSON"""
+    FILETYPES = [("Listas de reproducción", "*.m3u8 *.m3u *.pls *.xspf *.json"), ("M3U8", "*.m3u8"), ("M3U", "*.m3u"),
+                 ("PLS", "*.pls"), ("XSPF", "*.xspf"), ("JSON", "*.json")]
+    XSPF_NAMESPACE = "http://xspf.org/ns/0/"
+
+    @classmethod
+    def read(cls, playlist_file):
+        """Recorre las entradas (ubicación, título, duración) sin cargar el archivo entero"""
+        extension = os.path.splitext(playlist_file)[1].lower()
+        base_dir = os.path.dirname(os.path.abspath(playlist_file))
+        if extension in (".m3u", ".m3u8"):
+            return cls._read_m3u(playlist_file, base_dir)
+        if extension == ".pls":
+            return cls._read_pls(playlist_file, base_dir)
+        if extension == ".xspf":
+            return cls._read_xspf(playlist_file, base_dir)
+        if extension == ".json":
+            return cls._read_json(playlist_file, base_dir)
+        raise ValueError(f"Formato de lista no soportado: {extension}")
+
+    @staticmethod
+    def _lines(playlist_file):
+        """Líneas de una en una; las listas antiguas que no son UTF-8 se leen como Latin-1"""
+        with open(playlist_file, 'rb') as f:
+            for raw in f:
+                try:
+                    line = raw.decode('utf-8')
+                except UnicodeDecodeError:
+                    line = raw.decode('latin-1')
+                yield line.strip().lstrip('\ufeff')
+
+    @staticmethod
+    def location(raw, base_dir):
+        """Ruta absoluta de una entrada (relativa a la lista, absoluta o URL file://)"""
+        if raw.startswith("file:"):
+            return os.path.normpath(urllib.request.url2pathname(urlparse(raw).path))
+        if "://" in raw:
+            return raw
+        if os.sep != "\\":
+            # Listas creadas en Windows
+            raw = raw.replace("\\", "/")
+        return os.path.normpath(os.path.join(base_dir, raw))
+
+    @staticmethod
+    def _duration(text):
+        try:
+            duration = float(text)
+        except (TypeError, ValueError):
+            return None
+        return duration if duration >= 0 else None
+
+    @classmethod
+    def _read_m3u(cls, playlist_file, base_dir):
+        title = duration = None
+        for line in cls._lines(playlist_file):
+            if line.startswith("#EXTINF:"):
+                info, _, title = line[len("#EXTINF:"):].partition(",")
+                duration = cls._duration(info.split()[0] if info.split() else None)
+            elif line and not line.startswith("#"):
+                yield cls.location(line, base_dir), title or None, duration
+                title = duration = None
+
+    @classmethod
+    def _read_pls(cls, playlist_file, base_dir):
+        # Las claves FileN/TitleN/LengthN pueden venir en cualquier orden
+        entries = {}
+        for line in cls._lines(playlist_file):
+            key, separator, value = line.partition("=")
+            for field in ("File", "Title", "Length"):
+                if separator and key.startswith(field) and key[len(field):].isdigit():
+                    entries.setdefault(int(key[len(field):]), {})[field] = value.strip()
+        for number in sorted(entries):
+            entry = entries[number]
+            if entry.get("File"):
+                yield cls.location(entry["File"], base_dir), entry.get("Title"), cls._duration(entry.get("Length"))
+
+    @classmethod
+    def _read_xspf(cls, playlist_file, base_dir):
+        namespace = "{" + cls.XSPF_NAMESPACE + "}"
+        for _, element in ElementTree.iterparse(playlist_file, events=("end",)):
+            if element.tag != namespace + "track":
+                continue
+            location = (element.findtext(namespace + "location") or "").strip()
+            if location:
+                if not location.startswith("file:"):
+                    location = unquote(location)
+                duration = cls._duration(element.findtext(namespace + "duration"))
+                title = element.findtext(namespace + "title")
+                creator = element.findtext(namespace + "creator")
+                if title and creator:
+                    title = f"{creator} - {title}"
+                yield cls.location(location, base_dir), title, duration / 1000 if duration else None
+            # Liberar la pista ya leída: la memoria no crece con el tamaño de la lista
+            element.clear()
+
+    @classmethod
+    def _read_json(cls, playlist_file, base_dir):
+        # Formato de las colecciones ({"files": [...]}) o de la cola ({"items": [{"path": ...}]})
+        with open(playlist_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"files": data}
+        for path in data.get("files") or [item["path"] for item in data.get("items", [])]:
+            yield cls.location(path, base_dir), None, None
+
+    @classmethod
+    def write(cls, playlist_file, entries):
+        """Escribe las entradas (ruta, registro del índice o None) en el formato que indica la extensión"""
+        extension = os.path.splitext(playlist_file)[1].lower()
+        writers = {".m3u": cls._write_m3u, ".m3u8": cls._write_m3u, ".pls": cls._write_pls,
+                   ".xspf": cls._write_xspf, ".json": cls._write_json}
+        if extension not in writers:
+            raise ValueError(f"Formato de lista no soportado: {extension}")
+        base_dir = os.path.dirname(os.path.abspath(playlist_file))
+        tmp_file = playlist_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            writers[extension](f, entries, base_dir)
+        os.replace(tmp_file, playlist_file)
+
+    @staticmethod
+    def _relative(path, base_dir):
+        """Ruta relativa si la pista está dentro de la carpeta de la lista; si no, absoluta"""
+        path = os.path.abspath(path)
+        try:
+            relative = os.path.relpath(path, base_dir)
+        except ValueError:
+            # Otra unidad en Windows
+            return path
+        return path if relative.startswith(os.pardir) else relative
+
+    @staticmethod
+    def _describe(path, record):
+        """(artista, título, duración) de una entrada"""
+        title = os.path.splitext(os.path.basename(path))[0]
+        if record is None:
+            return None, title, None
+        return record.get_extra("artist"), record.get_extra("title") or title, record.duration
+
+    @classmethod
+    def _write_m3u(cls, f, entries, base_dir):
+        f.write("#EXTM3U\n")
+        for path, record in entries:
+            artist, title, duration = cls._describe(path, record)
+            f.write(f"#EXTINF:{int(round(duration)) if duration is not None else -1},{f'{artist} - {title}' if artist else title}\n")
+            f.write(cls._relative(path, base_dir) + "\n")
+
+    @classmethod
+    def _write_pls(cls, f, entries, base_dir):
+        f.write("[playlist]\n")
+        count = 0
+        for count, (path, record) in enumerate(entries, 1):
+            artist, title, duration = cls._describe(path, record)
+            f.write(f"File{count}={cls._relative(path, base_dir)}\n")
+            f.write(f"Title{count}={f'{artist} - {title}' if artist else title}\n")
+            f.write(f"Length{count}={int(round(duration)) if duration is not None else -1}\n")
+        f.write(f"NumberOfEntries={count}\nVersion=2\n")
+
+    @classmethod
+    def _write_xspf(cls, f, entries, base_dir):
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<playlist version="1" xmlns="{cls.XSPF_NAMESPACE}">\n  <trackList>\n')
+        for path, record in entries:
+            artist, title, duration = cls._describe(path, record)
+            location = cls._relative(path, base_dir)
+            location = Path(location).as_uri() if os.path.isabs(location) else quote(location.replace(os.sep, "/"))
+            f.write(f"    <track>\n      <location>{escape(location)}</location>\n      <title>{escape(title)}</title>\n")
+            if artist:
+                f.write(f"      <creator>{escape(artist)}</creator>\n")
+            if duration is not None:
+                f.write(f"      <duration>{int(round(duration * 1000))}</duration>\n")
+            f.write("    </track>\n")
+        f.write("  </trackList>\n</playlist>\n")
+
+    @staticmethod
+    def _write_json(f, entries, base_dir):
+        json.dump({"files": [os.path.abspath(path) for path, _ in entries]}, f, indent=4)
+
+# Cola de reproducción
+class PlayQueue:
+    """Cola con identificadores estables, mapa id -> posición y persistencia en disco"""
+    REPEAT_MODES = ("off", "all", "one")
+    # Huecos de elementos eliminados que se toleran antes de compactar las secuencias
+    COMPACT_MIN = 64
+
+    def __init__(self, queue_file="play_queue.json"):
+        self.queue_file = queue_file
+        self.items = {}
+        # Al eliminar queda un hueco (None) en `order` y `shuffle_order`: las posiciones no cambian
+        self.order = []
+        self.removed = 0
+        self.positions = {}
+        self.current_id = None
+        self.shuffle = False
+        self.repeat = "all"
+        self.shuffle_order = []
+        self.shuffle_positions = None
+        self.next_id = 1
+        self.dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self.items)
+
+    def ids(self):
+        """Identificadores en el orden de la cola, sin huecos"""
+        return [item_id for item_id in self.order if item_id is not None]
+
+    def load(self):
+        if not os.path.exists(self.queue_file):
+            return
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for item in data.get("items", []):
+                self.items[item["id"]] = item
+                self.order.append(item["id"])
+            self._reindex(0)
+            self.next_id = data.get("next_id", len(self.order) + 1)
+            self.current_id = data.get("current_id") if data.get("current_id") in self.items else None
+            self.repeat = data.get("repeat", "all")
+            self.set_shuffle(data.get("shuffle", False))
+            self.dirty = False
+        except Exception as e:
+            print(f"Error al cargar la cola de reproducción: {e}")
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {
+            "items": [self.items[item_id] for item_id in self.ids()],
+            "current_id": self.current_id,
+            "next_id": self.next_id,
+            "shuffle": self.shuffle,
+            "repeat": self.repeat,
+        }
+        tmp_file = self.queue_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.queue_file)
+        self.dirty = False
+
+    def _reindex(self, start):
+        """Actualiza el mapa de posiciones a partir de una posición"""
+        for position in range(start, len(self.order)):
+            self.positions[self.order[position]] = position
+
+    def _compact(self):
+        """Quita los huecos de las secuencias (coste repartido entre muchas eliminaciones)"""
+        self.order = self.ids()
+        self.positions = {}
+        self._reindex(0)
+        self.shuffle_order = [item_id for item_id in self.shuffle_order if item_id is not None]
+        self.shuffle_positions = None
+        self.removed = 0
+
+    @staticmethod
+    def _skip(sequence, index, direction):
+        """Primera posición ocupada desde `index` en el sentido indicado (puede quedar fuera de rango)"""
+        while 0 <= index < len(sequence) and sequence[index] is None:
+            index += direction
+        return index
+
+    # Modificación de la cola
+    def extend(self, entries):
+        """Añade varias entradas (path, name, duration) y devuelve los elementos creados"""
+        added = []
+        for path, name, duration in entries:
+            item_id = f"q{self.next_id}"
+            self.next_id += 1
+            item = {"id": item_id, "path": path, "name": name, "duration": duration}
+            self.items[item_id] = item
+            self.positions[item_id] = len(self.order)
+            self.order.append(item_id)
+            added.append(item)
+
+        if self.shuffle and added:
+            # Las nuevas entradas se reparten al azar entre las pendientes
+            start = self._shuffle_position(self.current_id) + 1 if self.current_id else 0
+            for item in added:
+                self.shuffle_order.insert(random.randint(start, len(self.shuffle_order)), item["id"])
+            self.shuffle_positions = None
+        self.dirty = True
+        return added
+
+    def remove(self, item_id):
+        """Elimina un elemento en tiempo constante dejando un hueco en su posición"""
+        if self.current_id == item_id:
+            # El anterior en el orden de reproducción pasa a ser el actual, para que el siguiente
+            # paso continúe justo después de la pista eliminada
+            sequence = self.shuffle_order if self.shuffle else self.order
+            index = self._shuffle_position(item_id) if self.shuffle else self.positions[item_id]
+            index = self._skip(sequence, index - 1, -1)
+            self.current_id = sequence[index] if index >= 0 else None
+
+        self.order[self.positions.pop(item_id)] = None
+        del self.items[item_id]
+        if self.shuffle:
+            self.shuffle_order[self._shuffle_position(item_id)] = None
+            del self.shuffle_positions[item_id]
+
+        self.removed += 1
+        if self.removed > max(self.COMPACT_MIN, len(self.items)):
+            self._compact()
+        self.dirty = True
+
+    def move(self, item_id, offset):
+        """Intercambia un elemento con su vecino y devuelve el identificador del vecino, o None"""
+        position = self.positions[item_id]
+        target = self._skip(self.order, position + offset, offset)
+        if target < 0 or target >= len(self.order):
+            return None
+        other_id = self.order[target]
+        self.order[position], self.order[target] = other_id, item_id
+        self.positions[item_id], self.positions[other_id] = target, position
+        self.dirty = True
+        return other_id
+
+    def clear(self):
+        self.items.clear()
+        self.order.clear()
+        self.removed = 0
+        self.positions.clear()
+        self.shuffle_order = []
+        self.shuffle_positions = None
+        self.current_id = None
+        self.dirty = True
+
+    # Navegación
+    def current(self):
+        return self.items.get(self.current_id)
+
+    def set_current(self, item_id):
+        self.current_id = item_id
+        self.dirty = True
+
+    def set_shuffle(self, enabled):
+        self.shuffle = enabled
+        self.shuffle_order = []
+        self.shuffle_positions = None
+        if enabled:
+            pending = [item_id for item_id in self.ids() if item_id != self.current_id]
+            random.shuffle(pending)
+            self.shuffle_order = ([self.current_id] if self.current_id else []) + pending
+        self.dirty = True
+
+    def set_repeat(self, mode):
+        self.repeat = mode
+        self.dirty = True
+
+    def _shuffle_position(self, item_id):
+        if self.shuffle_positions is None:
+            self.shuffle_positions = {i: n for n, i in enumerate(self.shuffle_order) if i is not None}
+        return self.shuffle_positions[item_id]
+
+    def _step(self, direction, auto):
+        if not self.items:
+            return None
+        if auto and self.repeat == "one" and self.current_id:
+            return self.current_id
+
+        sequence = self.shuffle_order if self.shuffle else self.order
+        if self.current_id is None:
+            index = 0 if direction > 0 else len(sequence) - 1
+        else:
+            positions = self._shuffle_position if self.shuffle else self.positions.__getitem__
+            index = positions(self.current_id) + direction
+        index = self._skip(sequence, index, direction)
+
+        if index >= len(sequence) or index < 0:
+            if self.repeat == "off":
+                return None
+            if self.shuffle and index >= len(sequence):
+                # Nueva vuelta: se baraja de nuevo con la pista actual en cabeza
+                self.set_shuffle(True)
+                sequence = self.shuffle_order
+                index = 1 if len(sequence) > 1 else 0
+            index = self._skip(sequence, index % len(sequence), direction)
+        return sequence[index]
+
+    def upcoming(self, count):
+        """Próximos elementos sin avanzar la cola (para precargarlos)"""
+        if not self.items:
+            return []
+        sequence = self.shuffle_order if self.shuffle else self.order
+        if self.current_id is None:
+            start = 0
+        else:
+            positions = self._shuffle_position if self.shuffle else self.positions.__getitem__
+            start = positions(self.current_id) + 1
+        result = []
+        index = start
+        while len(result) < count:
+            if index >= len(sequence):
+                # Tras una vuelta aleatoria el orden aún no se conoce
+                if self.repeat == "off" or self.shuffle:
+                    break
+                index = 0
+            if sequence[index] is not None:
+                result.append(self.items[sequence[index]])
+            index += 1
+        return result
+
+    def next_item(self, auto=False):
+        """Avanza al siguiente elemento según los modos aleatorio/repetición"""
+        item_id = self._step(1, auto)
+        if item_id is not None:
+            self.set_current(item_id)
+        return self.items.get(item_id)
+
+    def previous_item(self):
+        item_id = self._step(-1, False)
+        if item_id is not None:
+            self.set_current(item_id)
+        return self.items.get(item_id)
+
+# Contexto compartido de descargas
+class DownloadManager:
+    """Hilos de descarga con un YoutubeDL reutilizable, límite por host y ancho de banda global"""
+    # Ventana para calcular el caudal total (s)
+    THROUGHPUT_WINDOW = 5
+    # Bloques pequeños para que el límite de ancho de banda sea uniforme
+    THROTTLED_BUFFER_SIZE = 64 * 1024
+    # Tamaño del grupo de hilos: tope de descargas simultáneas configurable
+    POOL_SIZE = 16
+
+    def __init__(self, max_workers=3, per_host=2, bandwidth_kbps=0):
+        self.lock = threading.Lock()
+        # Los límites se pueden cambiar con descargas en curso sin recrear el grupo
+        self.slots = threading.Condition(self.lock)
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=self.POOL_SIZE, thread_name_prefix="download")
+        self.active = 0
+        self.host_active = {}
+        self.closed = False
+        self.samples = deque()
+        self.total_bytes = 0
+        self.generation = 0
+        self.configure(max_workers, per_host, bandwidth_kbps)
+
+    def configure(self, max_workers, per_host, bandwidth_kbps):
+        with self.lock:
+            self.max_workers = min(self.POOL_SIZE, max(1, int(max_workers)))
+            self.per_host = max(1, int(per_host))
+            self.rate = max(0, int(bandwidth_kbps)) * 1024
+            # Ráfaga máxima de un segundo
+            self.tokens = self.rate
+            self.last_refill = time.monotonic()
+            # Las instancias de YoutubeDL se recrean con las nuevas opciones
+            self.generation += 1
+            # Si los límites han subido, los trabajos en espera pueden empezar
+            self.slots.notify_all()
+
+    def submit(self, function, *args):
+        return self.executor.submit(self._run, function, *args)
+
+    def _run(self, function, *args):
+        """Ejecuta el trabajo cuando hay hueco según el límite actual de descargas simultáneas"""
+        with self.slots:
+            while not self.closed and self.active >= self.max_workers:
+                self.slots.wait()
+            if self.closed:
+                return None
+            self.active += 1
+        self.local.has_slot = True
+        try:
+            return function(*args)
+        finally:
+            self.local.has_slot = False
+            with self.slots:
+                self.active -= 1
+                self.slots.notify_all()
+
+    def _params(self):
+        params = {'format': 'bestaudio/best', 'quiet': True, 'no_warnings': True,
+                  'progress_hooks': [self._dispatch_hook]}
+        if self.rate:
+            params.update({'buffersize': self.THROTTLED_BUFFER_SIZE, 'noresizebuffer': True})
+        return params
+
+    @contextmanager
+    def session(self, outtmpl, hook, reuse=True):
+        """YoutubeDL del hilo actual: conserva sesiones HTTP y caché de extractores entre trabajos"""
+        cached = getattr(self.local, "ydl", None)
+        if reuse and cached is not None and cached[0] == self.generation:
+            ydl = cached[1]
+        else:
+            if reuse and cached is not None:
+                cached[1].close()
+            ydl = youtube_dl.YoutubeDL(self._params())
+            if reuse:
+                self.local.ydl = (self.generation, ydl)
+        ydl.params['outtmpl'] = {'default': outtmpl}
+        self.local.hook = hook
+        self.local.downloaded = 0
+        try:
+            yield ydl
+        finally:
+            self.local.hook = None
+            if not reuse:
+                ydl.close()
+
+    @staticmethod
+    def host_key(url):
+        host = (urlparse(url).hostname or "").lower()
+        for prefix in ("www.", "m.", "music."):
+            if host.startswith(prefix):
+                host = host[len(prefix):]
+        return "youtube.com" if host == "youtu.be" else host
+
+    @contextmanager
+    def host_slot(self, url, priority=False):
+        """Limita las descargas simultáneas contra un mismo host (un trabajo prioritario no espera, pero cuenta)"""
+        key = self.host_key(url)
+        with self.slots:
+            # Un trabajo que espera a su host devuelve su hueco global: solo cuentan los que pueden avanzar
+            released = False
+            if not priority and self.host_active.get(key, 0) >= self.per_host and getattr(self.local, "has_slot", False):
+                self.active -= 1
+                released = True
+                self.slots.notify_all()
+            while not priority and (self.host_active.get(key, 0) >= self.per_host or
+                                    (released and not self.closed and self.active >= self.max_workers)):
+                self.slots.wait()
+            if released:
+                self.active += 1
+            self.host_active[key] = self.host_active.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self.slots:
+                self.host_active[key] -= 1
+                if not self.host_active[key]:
+                    del self.host_active[key]
+                self.slots.notify_all()
+
+    def _dispatch_hook(self, d):
+        if d.get('status') == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            delta = downloaded - getattr(self.local, "downloaded", 0)
+            self.local.downloaded = downloaded
+            if delta > 0:
+                self.throttle(delta)
+        hook = getattr(self.local, "hook", None)
+        if hook:
+            hook(d)
+
+    def throttle(self, nbytes):
+        """Descuenta bytes del cubo de fichas global y espera si se ha agotado"""
+        wait = 0
+        with self.lock:
+            now = time.monotonic()
+            self.total_bytes += nbytes
+            self.samples.append((now, nbytes))
+            if self.rate:
+                self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                self.tokens -= nbytes
+                if self.tokens < 0:
+                    wait = -self.tokens / self.rate
+        metrics.inc("bytes_downloaded", nbytes)
+        if wait:
+            time.sleep(wait)
+
+    def throughput(self):
+        """Caudal agregado de todas las descargas en bytes por segundo"""
+        with self.lock:
+            limit = time.monotonic() - self.THROUGHPUT_WINDOW
+            while self.samples and self.samples[0][0] < limit:
+                self.samples.popleft()
+            return sum(nbytes for _, nbytes in self.samples) / self.THROUGHPUT_WINDOW
+
+    def shutdown(self):
+        with self.slots:
+            self.closed = True
+            self.slots.notify_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# Suscripciones a listas y canales
+class Subscriptions:
+    """Fuentes seguidas y, por cada una, un archivo con los videos ya descargados"""
+    DEFAULT_INTERVAL_HOURS = 6
+
+    def __init__(self, subscriptions_file="subscriptions.json", archive_dir="subscriptions"):
+        self.subscriptions_file = subscriptions_file
+        self.archive_dir = archive_dir
+        self.sources = {}
+        self.archives = {}
+        # Entradas ya enviadas a la cola de descargas pero aún sin terminar
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.subscriptions_file):
+            try:
+                with open(self.subscriptions_file, 'r', encoding='utf-8') as f:
+                    self.sources = json.load(f).get("subscriptions", {})
+            except Exception as e:
+                print(f"Error al cargar las suscripciones: {e}")
+        for name in self.sources:
+            self.archives[name] = set()
+            archive_file = self.archive_file(name)
+            if os.path.exists(archive_file):
+                with open(archive_file, 'r', encoding='utf-8') as f:
+                    self.archives[name] = {line.strip() for line in f if line.strip()}
+
+    def save(self):
+        tmp_file = self.subscriptions_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"subscriptions": self.sources}, f, indent=4)
+        os.replace(tmp_file, self.subscriptions_file)
+
+    def archive_file(self, name):
+        # Mismo formato que --download-archive de yt-dlp: "extractor id" por línea
+        return os.path.join(self.archive_dir, f"{name}.txt")
+
+    def add(self, name, url, collection=None, interval_hours=DEFAULT_INTERVAL_HOURS):
+        self.sources[name] = {"url": url, "collection": collection or name,
+                              "interval_hours": interval_hours, "last_checked": 0}
+        self.archives.setdefault(name, set())
+        self.save()
+
+    def remove(self, name):
+        self.sources.pop(name, None)
+        with self.lock:
+            self.archives.pop(name, None)
+            self.pending = {entry for entry in self.pending if entry[0] != name}
+        if os.path.exists(self.archive_file(name)):
+            os.remove(self.archive_file(name))
+        self.save()
+
+    def due(self, now=None):
+        """Fuentes cuya última comprobación es más antigua que su intervalo"""
+        now = now or time.time()
+        return [name for name, source in self.sources.items()
+                if now - source.get("last_checked", 0) >= source.get("interval_hours", self.DEFAULT_INTERVAL_HOURS) * 3600]
+
+    def touch(self, name):
+        if name in self.sources:
+            self.sources[name]["last_checked"] = int(time.time())
+            self.save()
+
+    @staticmethod
+    def entry_key(entry):
+        return f"{(entry.get('ie_key') or entry.get('extractor_key') or 'generic').lower()} {entry['id']}"
+
+    def new_entries(self, name, entries):
+        """Entradas que no están en el archivo ni en la cola; quedan marcadas como pendientes"""
+        result = []
+        with self.lock:
+            archive = self.archives.get(name, set())
+            for entry in entries:
+                key = self.entry_key(entry)
+                if key in archive or (name, key) in self.pending:
+                    continue
+                self.pending.add((name, key))
+                result.append((key, entry))
+        return result
+
+    def mark(self, name, key):
+        """Registra un video como descargado (llamado desde el hilo de descarga)"""
+        with self.lock:
+            self.pending.discard((name, key))
+            archive = self.archives.get(name)
+            if archive is None or key in archive:
+                return
+            archive.add(key)
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with open(self.archive_file(name), 'a', encoding='utf-8') as f:
+                f.write(key + "\n")
+
+    def forget(self, name, key):
+        """Quita una entrada pendiente cuya descarga falló para reintentarla en la próxima comprobación"""
+        with self.lock:
+            self.pending.discard((name, key))
+
+# Caché de objetos vlc.Media
+class MediaCache:
+    """vlc.Media ya creados y analizados para las próximas pistas y las recientes (LRU)"""
+
+    def __init__(self, instance, capacity=8):
+        self.instance = instance
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, path):
+        """Media de un archivo, reutilizado si estaba en la caché"""
+        media = self.entries.pop(path, None)
+        metrics.inc("media_cache_hits" if media is not None else "media_cache_misses")
+        if media is None:
+            media = self.instance.media_new(path)
+        self.entries[path] = media
+        self._evict()
+        return media
+
+    def preload(self, paths):
+        """Crea y analiza en segundo plano (de forma asíncrona en VLC) los medios indicados"""
+        for path in paths:
+            if path in self.entries:
+                continue
+            media = self.instance.media_new(path)
+            media.parse_with_options(vlc.MediaParseFlag.local, 0)
+            self.entries[path] = media
+        self._evict()
+
+    def discard(self, path):
+        media = self.entries.pop(path, None)
+        if media is not None:
+            media.release()
+
+    def _evict(self):
+        while len(self.entries) > self.capacity:
+            _, media = self.entries.popitem(last=False)
+            # El reproductor mantiene su propia referencia al medio en curso
+            media.release()
+
+# Despachador de mensajes entre hilos
+class MessagePump:
+    """Cola de mensajes con prioridades que despierta la interfaz solo cuando hay trabajo"""
+    HIGH, NORMAL, LOW = 0, 1, 2
+    # Prioridad por tipo de mensaje (por defecto NORMAL)
+    PRIORITIES = {"log": LOW, "job_finished": HIGH, "download_complete": HIGH}
+    WAKE_EVENT = "<<MessagePump>>"
+
+    def __init__(self, root, dispatch, flush=None, budget_ms=8):
         self.root = root
-        self.root.title("Audio Manager")
-        self.root.geometry("800x600")
-        
-        # Configuración
-        self.config = Config()
-        self.setup_directories()
-        
-        # Variables de estado
-        self.current_playing = None
-        self.current_position = 0
-        self.playlist = []
-        self.current_index = -1
-        self.is_playing = False
-        self.is_paused = False
-        self.volume = self.config.get("volume", 70) / 100
-        
-        # Reproductor VLC
-        self.vlc_instance = vlc.Instance()
-        self.player = self.vlc_instance.media_player_new()
-        
-        # Cola de mensajes entre hilos
-        self.message_queue = queue.Queue()
-        
-        # Interfaz
-        self.setup_ui()
-        self.apply_theme()
-        
-        # Verificar mensajes en la cola periódicamente
-        self.check_queue()
-        
-        # Cargar colecciones recientes
-        self.load_recent_collections()
-    
-    def setup_directories(self):
-        """Crea las carpetas necesarias para la aplicación"""
-        directories = ["downloads", "collections", "temp", "assets/backgrounds"]
-        for directory in directories:
-            os.makedirs(directory, exist_ok=True)
-    
-    def setup_ui(self):
-        """Configura la interfaz de usuario"""
-        # Configurar grid
-        self.root.grid_rowconfigure(0, weight=0)
-        self.root.grid_rowconfigure(1, weight=1)
+        self.dispatch = dispatch
+        self.flush = flush
+        self.budget = budget_ms / 1000
+        self.heap = []
+        self.counter = 0
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.main_thread = threading.current_thread()
+
+        # Sin Tcl multihilo no se puede despertar el bucle desde otros hilos
+        self.threaded = str(root.tk.eval("set tcl_platform(threaded)")) == "1"
+        root.bind(self.WAKE_EVENT, lambda event: self.pump())
+        if not self.threaded:
+            self._poll()
+
+    def put(self, message, priority=None):
+        """Publica un mensaje desde cualquier hilo"""
+        if priority is None:
+            priority = self.PRIORITIES.get(message[0], self.NORMAL)
+        with self.lock:
+            heapq.heappush(self.heap, (priority, self.counter, message))
+            self.counter += 1
+            if self.scheduled:
+                return
+            self.scheduled = True
+
+        if threading.current_thread() is self.main_thread:
+            self.root.after_idle(self.pump)
+        elif self.threaded:
+            self.root.event_generate(self.WAKE_EVENT, when="tail")
+
+    def _poll(self):
+        self.pump()
+        self.root.after(100, self._poll)
+
+    @metrics.timed("ui_refresh")
+    def pump(self):
+        """Procesa mensajes hasta agotar la cola o el presupuesto de tiempo del ciclo"""
+        deadline = time.perf_counter() + self.budget
+        while True:
+            with self.lock:
+                if not self.heap:
+                    self.scheduled = False
+                    break
+                _, _, message = heapq.heappop(self.heap)
+            metrics.inc("messages_dispatched")
+            try:
+                self.dispatch(message)
+            except Exception as e:
+                print(f"Error al procesar el mensaje {message[0]}: {e}")
+            if time.perf_counter() >= deadline:
+                # Ceder el control a la interfaz y continuar en el siguiente ciclo
+                self.root.after(1, self.pump)
+                break
+
+        if self.flush:
+            self.flush()
+
+# Escritura de etiquetas en segundo plano
+class TagWriter:
+    """Hilo que escribe etiquetas con mutagen agrupando las ediciones pendientes por archivo"""
+
+    def __init__(self, on_done):
+        # on_done(escritos, errores) se llama desde el hilo de escritura
+        self.on_done = on_done
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, edits):
+        """Encola {ruta: {campo: valor}}; las ediciones sobre un mismo archivo se combinan"""
+        with self.lock:
+            for path, tags in edits.items():
+                self.pending.setdefault(path, {}).update(tags)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.start()
+
+    def close(self, timeout=10):
+        """Termina las escrituras pendientes sin notificar a la interfaz"""
+        self.on_done = None
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                if not batch:
+                    self.thread = None
+                    return
+            written, errors = [], []
+            # Orden por ruta: los archivos de una misma carpeta se escriben seguidos
+            for path in sorted(batch):
+                try:
+                    self.write(path, batch[path])
+                    written.append(path)
+                except Exception as e:
+                    errors.append(f"{os.path.basename(path)}: {e}")
+            metrics.inc("tags_written", len(written))
+            if self.on_done:
+                self.on_done(written, errors)
+
+    @staticmethod
+    def keep_padding(info):
+        # Si las etiquetas caben en el relleno existente solo se reescribe la cabecera
+        return info.padding if info.padding >= 0 else info.get_default_padding()
+
+    @classmethod
+    def write(cls, path, tags):
+        audio = MutagenFile(path, easy=True)
+        if audio is None:
+            raise ValueError("formato no soportado")
+        if audio.tags is None:
+            audio.add_tags()
+        for field, value in tags.items():
+            if value:
+                audio[field] = value
+            elif field in audio:
+                del audio[field]
+        audio.save(padding=cls.keep_padding)
+
+    @staticmethod
+    def embed_cover(path, output_format, data, mime="image/jpeg"):
+        """Inserta una carátula en el contenedor del formato de salida"""
+        if output_format == "mp3":
+            tags = ID3(path)
+            tags.add(APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data))
+            tags.save(path)
+        elif output_format == "flac":
+            audio = FLAC(path)
+            picture = Picture()
+            picture.type, picture.mime, picture.data = 3, mime, data
+            audio.add_picture(picture)
+            audio.save()
+        elif output_format == "m4a":
+            audio = MP4(path)
+            audio["covr"] = [MP4Cover(data, imageformat=MP4Cover.FORMAT_JPEG)]
+            audio.save()
+        elif output_format == "ogg":
+            audio = OggVorbis(path)
+            picture = Picture()
+            picture.type, picture.mime, picture.data = 3, mime, data
+            audio["metadata_block_picture"] = [base64.b64encode(picture.write()).decode("ascii")]
+            audio.save()
+        # WAV: sin carátula
+
+# Presupuesto de espacio de la carpeta temporal
+class DiskBudget:
+    """Reservas de espacio por trabajo: una descarga solo empieza si cabe en el disco temporal"""
+    MB = 1024 * 1024
+
+    def __init__(self, path, budget_mb=0, min_free_mb=0):
+        self.condition = threading.Condition()
+        self.reservations = {}
+        self.configure(path, budget_mb, min_free_mb)
+
+    def configure(self, path, budget_mb, min_free_mb):
+        with self.condition:
+            self.path = path
+            self.budget = int(budget_mb) * self.MB
+            self.min_free = int(min_free_mb) * self.MB
+            self.condition.notify_all()
+
+    def reserved(self):
+        return sum(self.reservations.values())
+
+    def _fits(self, size, priority=False):
+        # Los trabajos prioritarios no respetan el límite ni las reservas ajenas, solo el espacio libre real
+        reserved = 0 if priority else self.reserved()
+        # Un trabajo solo siempre se admite si hay espacio libre, aunque supere el límite
+        if not priority and self.budget and self.reservations and reserved + size > self.budget:
+            return False
+        free = shutil.disk_usage(self.path).free
+        return free - reserved - size >= self.min_free
+
+    def reserve(self, job_id, size, on_wait=None, priority=False):
+        """Bloquea hasta que la reserva cabe; falla si no cabe ni con el disco sin otros trabajos"""
+        # Con `priority` (p. ej. "Reproducir Ya") no se espera: falla enseguida si el disco no tiene sitio
+        with self.condition:
+            waiting = False
+            while not self._fits(size, priority):
+                if priority or not self.reservations:
+                    raise OSError(f"Espacio insuficiente en {os.path.abspath(self.path)} "
+                                  f"(se necesitan {size // self.MB} MB)")
+                if not waiting and on_wait:
+                    on_wait()
+                    waiting = True
+                # El espacio libre también cambia fuera de la aplicación
+                self.condition.wait(timeout=5)
+            self.reservations[job_id] = size
+
+    def release(self, job_id):
+        with self.condition:
+            if self.reservations.pop(job_id, None) is not None:
+                self.condition.notify_all()
+
+# Reproducción mientras se descarga
+class StreamTee:
+    """Descarga un flujo una sola vez a disco y lo sirve a VLC por HTTP local mientras crece"""
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, opener, url, path, headers=None, on_progress=None):
+        # opener: función compatible con urlopen (p. ej. YoutubeDL.urlopen)
+        self.opener = opener
+        self.url = url
+        self.path = path
+        self.headers = headers or {}
+        self.on_progress = on_progress
+        self.total = None
+        self.written = 0
+        self.complete = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.server = None
+        # Lo usan la conversión y el reproductor: el último en terminar borra el archivo
+        self.users = 2
+
+    @property
+    def local_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/{os.path.basename(self.path)}"
+
+    def start(self):
+        tee = self
+
+        class StreamHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                tee._serve(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._download, daemon=True).start()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def release(self):
+        """Indica que un usuario ha terminado; True si ya nadie necesita el archivo"""
+        with self.condition:
+            self.users -= 1
+            return self.users == 0
+
+    def wait(self):
+        """Espera al final de la descarga; relanza el error si falló"""
+        with self.condition:
+            while not self.complete and self.error is None:
+                self.condition.wait()
+        if self.error is not None:
+            raise self.error
+
+    def _download(self):
+        try:
+            request = urllib.request.Request(self.url, headers=self.headers)
+            with self.opener(request) as response, open(self.path, 'wb') as f:
+                length = response.headers.get("Content-Length")
+                with self.condition:
+                    self.total = int(length) if length else None
+                    self.condition.notify_all()
+                while True:
+                    chunk = response.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    f.flush()
+                    with self.condition:
+                        self.written += len(chunk)
+                        self.condition.notify_all()
+                    if self.on_progress:
+                        self.on_progress(self.written, self.total)
+            with self.condition:
+                self.complete = True
+                self.condition.notify_all()
+        except Exception as e:
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+
+    def _available(self, offset):
+        """Bytes disponibles a partir de offset, esperando a que lleguen; 0 al final del flujo"""
+        with self.condition:
+            while self.written <= offset and not self.complete and self.error is None:
+                self.condition.wait(1)
+            return max(0, self.written - offset)
+
+    def _serve(self, handler):
+        # Las cabeceras de la respuesta remota indican el tamaño total
+        with self.condition:
+            while self.total is None and self.written == 0 and not self.complete and self.error is None:
+                self.condition.wait(1)
+            total = self.total
+
+        start = 0
+        range_header = handler.headers.get("Range", "")
+        if range_header.startswith("bytes="):
+            start = int(range_header[6:].split("-")[0] or 0)
+        if total is not None and start >= total:
+            handler.send_error(416)
+            return
+
+        handler.send_response(206 if start else 200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Accept-Ranges", "bytes")
+        if total is not None:
+            handler.send_header("Content-Length", str(total - start))
+            if start:
+                handler.send_header("Content-Range", f"bytes {start}-{total - 1}/{total}")
+        handler.end_headers()
+
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                position = start
+                while True:
+                    available = self._available(position)
+                    if not available:
+                        break
+                    data = f.read(min(available, self.CHUNK_SIZE))
+                    handler.wfile.write(data)
+                    position += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # VLC cierra la conexión al pausar, buscar o cambiar de pista
+            pass
+
+# Servidor de la instancia única
+class InstanceServer:
+    """Recibe por un socket local los argumentos de las ejecuciones posteriores"""
+
+    def __init__(self, on_arguments=None, instance_file=INSTANCE_FILE):
+        self.on_arguments = on_arguments
+        self.instance_file = instance_file
+        self.token = secrets.token_hex(16)
+        self.server = None
+        # Argumentos recibidos antes de que exista la ventana
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def set_handler(self, on_arguments):
+        """Fija el destino de los argumentos y le entrega los que llegaron antes"""
+        with self.lock:
+            self.on_arguments = on_arguments
+            pending, self.pending = self.pending, []
+        for args in pending:
+            on_arguments(args)
+
+    def start(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        threading.Thread(target=self._serve, daemon=True).start()
+        tmp_file = self.instance_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"port": self.server.getsockname()[1], "token": self.token, "pid": os.getpid()}, f)
+        os.replace(tmp_file, self.instance_file)
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                # Servidor cerrado
+                return
+            with connection:
+                try:
+                    connection.settimeout(2)
+                    request = json.loads(connection.makefile('r', encoding='utf-8').readline())
+                    # Solo procesos que pueden leer el archivo de la instancia
+                    if not secrets.compare_digest(str(request.get("token", "")), self.token):
+                        continue
+                    args = list(request.get("args", []))
+                    with self.lock:
+                        on_arguments = self.on_arguments
+                        if on_arguments is None:
+                            self.pending.append(args)
+                    if on_arguments is not None:
+                        on_arguments(args)
+                    connection.sendall(b"ok\n")
+                except (OSError, ValueError, AttributeError):
+                    pass
+
+    def close(self):
+        if self.server is None:
+            return
+        self.server.close()
+        # El archivo se borra solo si sigue siendo el de esta instancia
+        try:
+            with open(self.instance_file, 'r', encoding='utf-8') as f:
+                if json.load(f).get("token") == self.token:
+                    os.remove(self.instance_file)
+        except (OSError, ValueError):
+            pass
+
+# Vista virtualizada de la biblioteca
+class LibraryView:
+    """Treeview con solo las filas visibles; la lista completa y la selección viven en Python"""
+    DEFAULT_ROW_HEIGHT = 20
+
+    def __init__(self, tree, scrollbar, format_row):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.format_row = format_row
+        self.rows = []
+        self.positions = None
+        self.offset = 0
+        self.visible = int(tree.cget("height"))
+        self.row_ids = []
+        self.selected = set()
+        self.anchor = None
+        self.sort_keys = []
+
+        scrollbar.configure(command=self.yview)
+        tree.bind("<Configure>", self._on_configure)
+        # Solo cuenta el sentido: en Windows delta va de 120 en 120 y en macOS de 1 en 1
+        tree.bind("<MouseWheel>", lambda event: self.scroll(-3 if event.delta > 0 else 3 if event.delta < 0 else 0))
+        tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        tree.bind("<Button-5>", lambda event: self.scroll(3))
+        tree.bind("<Button-1>", self._on_click)
+        tree.bind("<Shift-Button-1>", lambda event: self._on_click(event, extend=True))
+        tree.bind("<Control-Button-1>", lambda event: self._on_click(event, toggle=True))
+        tree.bind("<Up>", lambda event: self._move_cursor(-1))
+        tree.bind("<Down>", lambda event: self._move_cursor(1))
+        tree.bind("<Prior>", lambda event: self._move_cursor(-self.visible))
+        tree.bind("<Next>", lambda event: self._move_cursor(self.visible))
+        tree.bind("<Control-a>", lambda event: self.select(self.rows) or "break")
+
+    # Contenido
+    def set_rows(self, rows):
+        self.rows = list(rows)
+        self._apply_sort()
+        if self.selected:
+            present = set(self.rows)
+            self.selected &= present
+        self.render()
+
+    def append(self, rows):
+        self.rows.extend(rows)
+        self._apply_sort()
+        self.render()
+
+    def sort(self, sort_keys):
+        """Ordena por [(clave, descendente), ...]; el primer criterio es el principal"""
+        self.sort_keys = list(sort_keys)
+        self._apply_sort()
+        self.render()
+
+    def _apply_sort(self):
+        # Ordenación estable: se aplica del criterio menos importante al principal
+        for key, descending in reversed(self.sort_keys):
+            self.rows.sort(key=key, reverse=descending)
+        self.positions = None
+
+    def remove(self, rows):
+        removed = set(rows)
+        self.rows = [row for row in self.rows if row not in removed]
+        self.selected -= removed
+        self.positions = None
+        self.render()
+
+    def position(self, row):
+        if self.positions is None:
+            self.positions = {value: position for position, value in enumerate(self.rows)}
+        return self.positions.get(row)
+
+    # Selección
+    def selection(self):
+        """Filas seleccionadas en el orden en que se muestran"""
+        return sorted(self.selected, key=self.position)
+
+    def select(self, rows):
+        self.selected = set(rows)
+        self.anchor = rows[0] if rows else None
+        self.render()
+
+    def see(self, row):
+        position = self.position(row)
+        if position is None:
+            return
+        if position < self.offset or position >= self.offset + self.visible:
+            self.offset = position - self.visible // 2
+        self.render()
+
+    # Desplazamiento
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.rows))
+            self.render()
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            self.scroll(amount * self.visible if args[2] == "pages" else amount)
+
+    def scroll(self, rows):
+        self.offset += rows
+        self.render()
+        return "break"
+
+    def _on_configure(self, event):
+        row_height = self.DEFAULT_ROW_HEIGHT
+        heading = 0
+        if self.row_ids:
+            bbox = self.tree.bbox(self.row_ids[0])
+            if bbox:
+                heading, row_height = bbox[1], bbox[3]
+        visible = max(1, -(-(event.height - heading) // row_height))
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def _on_click(self, event, extend=False, toggle=False):
+        # Los clics en cabeceras y separadores siguen el comportamiento normal
+        if self.tree.identify_region(event.x, event.y) not in ("cell", "tree"):
+            return None
+        item = self.tree.identify_row(event.y)
+        if not item:
+            return "break"
+
+        row = self.rows[self.offset + self.row_ids.index(item)]
+        if extend and self.anchor is not None and self.position(self.anchor) is not None:
+            start, end = sorted((self.position(self.anchor), self.position(row)))
+            self.selected = set(self.rows[start:end + 1])
+        elif toggle:
+            self.selected ^= {row}
+            self.anchor = row
+        else:
+            self.selected = {row}
+            self.anchor = row
+        self.tree.focus_set()
+        self.render()
+        return "break"
+
+    def _move_cursor(self, delta):
+        if not self.rows:
+            return "break"
+        position = self.position(self.anchor) if self.anchor is not None else None
+        position = 0 if position is None else min(max(position + delta, 0), len(self.rows) - 1)
+        self.anchor = self.rows[position]
+        self.selected = {self.anchor}
+        self.see(self.anchor)
+        return "break"
+
+    def render(self):
+        """Rellena las filas visibles con los valores formateados de la ventana actual"""
+        self.offset = max(0, min(self.offset, len(self.rows) - self.visible))
+        count = min(self.visible, len(self.rows) - self.offset)
+
+        while len(self.row_ids) < count:
+            self.row_ids.append(self.tree.insert("", tk.END))
+        while len(self.row_ids) > count:
+            self.tree.delete(self.row_ids.pop())
+
+        selected_ids = []
+        for i, item in enumerate(self.row_ids):
+            row = self.rows[self.offset + i]
+            self.tree.item(item, values=self.format_row(row, self.offset + i + 1))
+            if row in self.selected:
+                selected_ids.append(item)
+        self.tree.selection_set(selected_ids)
+
+        total = len(self.rows)
+        if total:
+            self.scrollbar.set(self.offset / total, (self.offset + count) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+# Clase principal de la aplicación
+class AudioManagerApp:
+    # Intervalo de refresco de las barras de progreso de descarga (ms)
+    PROGRESS_REFRESH_MS = 250
+    # Estado del último trabajo de transcodificación (para reanudarlo)
+    TRANSCODE_STATE_FILE = "transcode_job.json"
+    # Columna de la biblioteca -> campo del registro por el que se ordena
+    LIBRARY_SORT_FIELDS = {
+        "#": "added",
+        "Nombre": "name_key",
+        "Duración": "duration",
+        "Tamaño": "size",
+        "Formato": "format",
+        "Ruta": "path",
+    }
+    # Criterios de ordenación que se recuerdan (el resto se descarta)
+    LIBRARY_SORT_DEPTH = 3
+    # Pistas de la cola que se precargan después de la actual
+    PRELOAD_COUNT = 3
+    # Filas de la cola renumeradas en cada pasada en segundo plano
+    QUEUE_RENUMBER_BATCH = 500
+    # ioctl de Linux para clonar un archivo (reflink) en Btrfs/XFS
+    FICLONE = 0x40049409
+    # Pistas que añade "Encolar Similares"
+    SIMILAR_COUNT = 50
+    # División por silencios: duración mínima del audio y de cada pista (ms)
+    SILENCE_MIN_DURATION = 10 * 60 * 1000
+    SILENCE_MIN_SEGMENT = 30 * 1000
+    # Cada cuánto se buscan suscripciones pendientes de comprobar (ms)
+    SUBSCRIPTION_TICK_MS = 60 * 1000
+    # Formato de salida -> (formato de FFmpeg, códec)
+    EXPORT_FORMATS = {
+        "mp3": ("mp3", "libmp3lame"),
+        "ogg": ("ogg", "libvorbis"),
+        "m4a": ("ipod", "aac"),
+        "wav": ("wav", None),
+        "flac": ("flac", None),
+    }
+    # Formatos de salida cuyo contenedor guarda la portada como imagen adjunta
+    COVER_FORMATS = ("mp3", "m4a", "flac")
+    
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Audio Manager")
+        self.root.geometry("800x600")
+        
+        # Configuración
+        self.config = Config()
+        self.setup_directories()
+        
+        # Instrumentación opcional
+        metrics.enabled = self.config.get("instrumentation", False)
+        if metrics.enabled:
+            self.start_metrics_server()
+        
+        # Índice de la biblioteca
+        self.library_index = LibraryIndex()
+        self.similarity = SimilarityIndex(self.library_index)
+        
+        # Variables de estado
+        self.current_playing = None
+        self.active_stream = None
+        self.current_position = 0
+        self.play_queue = PlayQueue()
+        self.is_playing = False
+        self.is_paused = False
+        self.progress_update_scheduled = False
+        self.volume = self.config.get("volume", 70) / 100
+        
+        # Reproductor VLC
+        self.vlc_instance = vlc.Instance()
+        self.player = self.vlc_instance.media_player_new()
+        self.media_cache = MediaCache(self.vlc_instance, self.config.get("media_cache_size", 8))
+        
+        # Tiempo hasta el primer audio: desde la orden de reproducir hasta que VLC empieza a sonar
+        self.play_requested_at = None
+        self.player.event_manager().event_attach(vlc.EventType.MediaPlayerPlaying, self.on_player_playing)
+        
+        # Cola de mensajes entre hilos
+        self.pending_log_lines = []
+        self.message_queue = MessagePump(self.root, self.handle_message, self.flush_log_lines)
+        
+        # Escritura de etiquetas en segundo plano
+        self.tag_writer = TagWriter(lambda written, errors: self.message_queue.put(("tags_written", (written, errors))))
+        
+        # Trabajos de descarga: los hilos solo guardan el último progreso y la
+        # interfaz lo refresca a intervalos fijos
+        self.download_jobs = {}
+        self.job_progress = {}
+        self.job_progress_lock = threading.Lock()
+        self.next_job_id = 1
+        self.progress_refresh_scheduled = False
+        
+        # Descargas compartidas: concurrencia, límite por host y ancho de banda global
+        self.downloads = DownloadManager(self.config.get("max_concurrent_downloads", 3),
+                                         self.config.get("per_host_downloads", 2),
+                                         self.config.get("bandwidth_limit_kbps", 0))
+        
+        # Nombres finales en la biblioteca: se eligen de uno en uno para que no coincidan
+        self.library_names_lock = threading.Lock()
+        
+        # Espacio temporal: cada descarga reserva lo que ocupará antes de empezar
+        self.disk_budget = DiskBudget(self.config.get("scratch_path", "temp"),
+                                      self.config.get("scratch_budget_mb", 0),
+                                      self.config.get("min_free_mb", 500))
+        
+        # Log de descargas acotado y rotación opcional a disco
+        self.log_line_count = 0
+        self.download_logger = None
+        self.setup_download_logger()
+        
+        # Interfaz
+        self.setup_ui()
+        self.apply_theme()
+        
+        # Guardar el índice y la cola periódicamente
+        self.save_pending_state()
+        
+        # Cargar colecciones recientes
+        self.load_recent_collections()
+        
+        # Suscripciones: la primera comprobación se hace al arrancar
+        self.subscriptions = Subscriptions()
+        self.checking_subscriptions = set()
+        self.root.after(5000, self.check_subscriptions)
+    
+    def setup_directories(self):
+        """Crea las carpetas necesarias para la aplicación"""
+        directories = ["downloads", "collections", self.config.get("scratch_path", "temp"), "assets/backgrounds"]
+        for directory in directories:
+            os.makedirs(directory, exist_ok=True)
+    
+    def setup_ui(self):
+        """Configura la interfaz de usuario"""
+        # Configurar grid
+        self.root.grid_rowconfigure(0, weight=0)
+        self.root.grid_rowconfigure(1, weight=1)
         self.root.grid_columnconfigure(0, weight=1)
         
         # Barra de menú
@@ -282,6 +2592,13 @@ class AudioManagerApp:
         
         config_menu.add_separator()
         config_menu.add_command(label="Preferencias de descarga", command=self.download_preferences)
+        config_menu.add_command(label="Panel de rendimiento", command=self.show_metrics_panel)
+        
+        # Menú Suscripciones
+        subscriptions_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Suscripciones", menu=subscriptions_menu)
+        subscriptions_menu.add_command(label="Gestionar suscripciones", command=self.subscriptions_dialog)
+        subscriptions_menu.add_command(label="Comprobar ahora", command=lambda: self.check_subscriptions(force=True))
     
     def setup_download_tab(self):
         """Configura la pestaña de descarga"""
@@ -320,24 +2637,45 @@ class AudioManagerApp:
         bitrate_combo = ttk.Combobox(format_frame, textvariable=self.bitrate_var, values=["64k", "96k", "128k", "192k", "256k", "320k"], state="readonly", width=10)
         bitrate_combo.grid(row=0, column=3, sticky="w", padx=10, pady=5)
         
+        # Varios destinos a partir de una sola descarga, p. ej. "mp3@320k, ogg@192k, flac"
+        ttk.Label(format_frame, text="Perfiles:").grid(row=1, column=0, sticky="w", padx=10, pady=5)
+        self.profiles_var = tk.StringVar(value=self.config.get("export_profiles", ""))
+        ttk.Entry(format_frame, textvariable=self.profiles_var, width=40).grid(row=1, column=1, columnspan=3, sticky="ew", padx=10, pady=5)
+        
+        # Álbumes y mezclas: una pista por capítulo
+        self.split_var = tk.BooleanVar(value=self.config.get("split_chapters", False))
+        ttk.Checkbutton(format_frame, text="Dividir en pistas por capítulos", variable=self.split_var,
+                        command=lambda: self.config.set("split_chapters", self.split_var.get())).grid(row=2, column=0, columnspan=4, sticky="w", padx=10, pady=5)
+        
+        # Mezclas largas sin capítulos: una pista por cada silencio
+        self.split_silence_var = tk.BooleanVar(value=self.config.get("split_silence", False))
+        ttk.Checkbutton(format_frame, text="Dividir por silencios si no hay capítulos", variable=self.split_silence_var,
+                        command=lambda: self.config.set("split_silence", self.split_silence_var.get())).grid(row=3, column=0, columnspan=4, sticky="w", padx=10, pady=5)
+        
         # Botones de acción
         button_frame = ttk.Frame(self.download_frame)
         button_frame.grid(row=4, column=0, columnspan=3, padx=10, pady=20)
         
         ttk.Button(button_frame, text="Obtener Información", command=self.get_video_info).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Descargar y Convertir", command=self.download_and_convert).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Reproducir Ya", command=self.play_while_downloading).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Limpiar", command=self.clear_download_fields).pack(side=tk.LEFT, padx=5)
         
         # Barra de progreso
         self.progress_bar = ttk.Progressbar(self.download_frame, mode='indeterminate')
         self.progress_bar.grid(row=5, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
         
+        # Descargas en curso (una barra de progreso por trabajo)
+        self.jobs_frame = ttk.LabelFrame(self.download_frame, text="Descargas en curso")
+        self.jobs_frame.grid(row=6, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+        self.jobs_frame.grid_columnconfigure(1, weight=1)
+        
         # Log de descargas
         self.download_log = scrolledtext.ScrolledText(self.download_frame, height=8, state=tk.DISABLED)
-        self.download_log.grid(row=6, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="nsew")
+        self.download_log.grid(row=7, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="nsew")
         
         # Configurar grid weights
-        self.download_frame.grid_rowconfigure(6, weight=1)
+        self.download_frame.grid_rowconfigure(7, weight=1)
         self.download_frame.grid_columnconfigure(0, weight=1)
     
     def setup_library_tab(self):
@@ -356,22 +2694,24 @@ class AudioManagerApp:
         
         ttk.Button(search_frame, text="Explorar", command=self.browse_audio_files).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(search_frame, text="Actualizar", command=self.load_audio_files).pack(side=tk.LEFT)
+        ttk.Button(search_frame, text="Encolar Resultados", command=self.enqueue_search_results).pack(side=tk.LEFT, padx=(5, 0))
         
         # Lista de archivos de audio
         columns = ("#", "Nombre", "Duración", "Tamaño", "Formato", "Ruta")
         self.audio_tree = ttk.Treeview(self.library_frame, columns=columns, show="headings", height=15)
         
         for col in columns:
-            self.audio_tree.heading(col, text=col)
+            self.audio_tree.heading(col, text=col, command=lambda c=col: self.sort_library(c))
             self.audio_tree.column(col, width=100)
         
         self.audio_tree.column("#", width=50)
         self.audio_tree.column("Nombre", width=200)
         self.audio_tree.column("Ruta", width=300)
         
-        # Scrollbar para la lista
-        scrollbar = ttk.Scrollbar(self.library_frame, orient=tk.VERTICAL, command=self.audio_tree.yview)
-        self.audio_tree.configure(yscrollcommand=scrollbar.set)
+        # Scrollbar para la lista: la vista virtualizada solo crea las filas visibles
+        scrollbar = ttk.Scrollbar(self.library_frame, orient=tk.VERTICAL)
+        self.library_view = LibraryView(self.audio_tree, scrollbar, self.library_row_values)
+        self.library_sort = []
         
         # Empaquetar Treeview y Scrollbar
         self.audio_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0), pady=(0, 10))
@@ -384,7 +2724,13 @@ class AudioManagerApp:
         ttk.Button(control_frame, text="Reproducir", command=self.play_selected_audio).pack(side=tk.LEFT, padx=2)
         ttk.Button(control_frame, text="Añadir a Cola", command=self.add_to_queue).pack(side=tk.LEFT, padx=2)
         ttk.Button(control_frame, text="Añadir a Colección", command=self.add_to_collection).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Editar Etiquetas...", command=self.tag_editor_dialog).pack(side=tk.LEFT, padx=2)
         ttk.Button(control_frame, text="Eliminar", command=self.delete_audio_file).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Transcodificar...", command=self.transcode_dialog).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Verificar", command=self.start_verify_job).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Analizar", command=self.start_analysis_job).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Calidad Real", command=self.start_quality_job).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="Encolar Similares", command=self.enqueue_similar).pack(side=tk.LEFT, padx=2)
     
     def setup_collections_tab(self):
         """Configura la pestaña de colecciones"""
@@ -401,6 +2747,12 @@ class AudioManagerApp:
         
         ttk.Button(manage_frame, text="Crear Colección", command=self.create_collection).grid(row=0, column=2, padx=10, pady=10)
         ttk.Button(manage_frame, text="Eliminar Colección", command=self.delete_collection).grid(row=0, column=3, padx=10, pady=10)
+        ttk.Button(manage_frame, text="Colección Inteligente", command=self.create_smart_collection).grid(row=0, column=4, padx=10, pady=10)
+        ttk.Button(manage_frame, text="Encolar Colección", command=self.enqueue_collection).grid(row=1, column=2, padx=10, pady=(0, 10))
+        ttk.Button(manage_frame, text="Reproducir Colección", command=self.play_collection).grid(row=1, column=3, padx=10, pady=(0, 10))
+        ttk.Button(manage_frame, text="Sincronizar...", command=self.sync_collection_dialog).grid(row=1, column=4, padx=10, pady=(0, 10))
+        ttk.Button(manage_frame, text="Importar Lista...", command=self.import_playlist).grid(row=2, column=2, padx=10, pady=(0, 10))
+        ttk.Button(manage_frame, text="Exportar Lista...", command=self.export_collection_playlist).grid(row=2, column=3, padx=10, pady=(0, 10))
         
         # Lista de colecciones
         collections_list_frame = ttk.Frame(self.collections_frame)
@@ -429,6 +2781,14 @@ class AudioManagerApp:
         scrollbar2 = ttk.Scrollbar(content_frame, orient=tk.VERTICAL, command=self.collection_tree.yview)
         self.collection_tree.configure(yscrollcommand=scrollbar2.set)
         
+        # Controles para las pistas seleccionadas de la colección
+        content_controls = ttk.Frame(content_frame)
+        content_controls.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        
+        ttk.Button(content_controls, text="Reproducir Selección", command=self.play_collection_selection).pack(side=tk.LEFT, padx=2)
+        ttk.Button(content_controls, text="Añadir Selección a Cola", command=self.enqueue_collection_selection).pack(side=tk.LEFT, padx=2)
+        ttk.Button(content_controls, text="Quitar de la Colección", command=self.remove_from_collection).pack(side=tk.LEFT, padx=2)
+        
         self.collection_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar2.pack(side=tk.RIGHT, fill=tk.Y)
         
@@ -464,6 +2824,9 @@ class AudioManagerApp:
         self.queue_tree.column("Nombre", width=300)
         self.queue_tree.column("Duración", width=100)
         
+        # Primera posición con el número "#" desactualizado (se corrige poco a poco)
+        self.queue_renumber_from = None
+        
         scrollbar = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL, command=self.queue_tree.yview)
         self.queue_tree.configure(yscrollcommand=scrollbar.set)
         
@@ -478,6 +2841,23 @@ class AudioManagerApp:
         ttk.Button(queue_controls, text="Bajar", command=self.move_down_in_queue).pack(side=tk.LEFT, padx=2)
         ttk.Button(queue_controls, text="Eliminar", command=self.remove_from_queue).pack(side=tk.LEFT, padx=2)
         ttk.Button(queue_controls, text="Limpiar Cola", command=self.clear_queue).pack(side=tk.LEFT, padx=2)
+        ttk.Button(queue_controls, text="Exportar Cola...", command=self.export_queue_playlist).pack(side=tk.LEFT, padx=2)
+        
+        # Modos de reproducción
+        self.repeat_labels = {"off": "Sin repetición", "all": "Repetir todo", "one": "Repetir una"}
+        self.repeat_var = tk.StringVar(value=self.repeat_labels[self.play_queue.repeat])
+        repeat_combo = ttk.Combobox(queue_controls, textvariable=self.repeat_var, values=list(self.repeat_labels.values()), state="readonly", width=14)
+        repeat_combo.pack(side=tk.RIGHT, padx=2)
+        repeat_combo.bind("<<ComboboxSelected>>", self.change_repeat_mode)
+        
+        self.shuffle_var = tk.BooleanVar(value=self.play_queue.shuffle)
+        ttk.Checkbutton(queue_controls, text="Aleatorio", variable=self.shuffle_var, command=self.toggle_shuffle).pack(side=tk.RIGHT, padx=2)
+        
+        # Restaurar la cola de la sesión anterior
+        for position, item_id in enumerate(self.play_queue.ids()):
+            item = self.play_queue.items[item_id]
+            self.queue_tree.insert("", tk.END, iid=item_id, values=self.queue_row_values(item, position))
+        self.highlight_current_in_queue()
     
     def setup_player_controls(self):
         """Configura los controles del reproductor (barra inferior fija)"""
@@ -503,9 +2883,6 @@ class AudioManagerApp:
         self.volume_scale = ttk.Scale(control_frame, from_=0, to=100, orient=tk.HORIZONTAL, 
                                       value=self.config.get("volume", 70), command=self.change_volume, length=100)
         self.volume_scale.pack(side=tk.LEFT, padx=5)
-        
-        # Actualizar la barra de progreso periódicamente
-        self.update_progress()
     
     def apply_theme(self):
         """Aplica el tema seleccionado"""
@@ -558,37 +2935,175 @@ class AudioManagerApp:
                 print(f"Error al cargar fondo personalizado: {e}")
     
     # Funciones de utilidad
-    def check_queue(self):
-        """Verifica mensajes en la cola desde otros hilos"""
-        try:
-            while True:
-                message = self.message_queue.get_nowait()
-                if message[0] == "log":
-                    self.log_message(message[1])
-                elif message[0] == "progress_start":
-                    self.progress_bar.start()
-                elif message[0] == "progress_stop":
-                    self.progress_bar.stop()
-                elif message[0] == "video_info":
-                    self.update_video_info(message[1])
-                elif message[0] == "download_complete":
-                    self.on_download_complete(message[1])
-        except queue.Empty:
-            pass
-        finally:
-            self.root.after(100, self.check_queue)
+    def handle_message(self, message):
+        """Procesa un mensaje de otro hilo (llamado por el despachador)"""
+        if message[0] == "log":
+            # Los mensajes de log se acumulan y se escriben juntos al final del ciclo
+            self.pending_log_lines.append(f"{datetime.now().strftime('%H:%M:%S')} - {message[1]}")
+        elif message[0] == "progress_start":
+            self.progress_bar.start()
+        elif message[0] == "progress_stop":
+            self.progress_bar.stop()
+        elif message[0] == "video_info":
+            self.update_video_info(message[1])
+        elif message[0] == "download_complete":
+            self.on_download_complete(message[1])
+        elif message[0] == "job_finished":
+            self.remove_download_job(message[1])
+        elif message[0] == "transcoded":
+            self.on_file_transcoded(*message[1])
+        elif message[0] == "transcode_complete":
+            self.load_audio_files()
+        elif message[0] == "subscription_entries":
+            self.on_subscription_entries(*message[1])
+        elif message[0] == "play_stream":
+            self.on_stream_ready(*message[1])
+        elif message[0] == "tags_written":
+            self.on_tags_written(*message[1])
+        elif message[0] == "verified":
+            self.on_file_verified(*message[1])
+        elif message[0] == "verify_complete":
+            self.on_verify_complete(*message[1])
+        elif message[0] == "analyzed":
+            self.on_file_analyzed(*message[1])
+        elif message[0] == "analysis_failed":
+            self.on_analysis_failed(*message[1])
+        elif message[0] == "analysis_complete":
+            self.on_analysis_complete(*message[1])
+        elif message[0] == "quality_measured":
+            self.on_quality_measured(*message[1])
+        elif message[0] == "quality_complete":
+            self.on_quality_complete(*message[1])
+        elif message[0] == "reencoded":
+            self.on_file_reencoded(*message[1])
+        elif message[0] == "reencode_complete":
+            self.on_reencode_complete(*message[1])
+        elif message[0] == "sync_complete":
+            self.on_sync_complete(*message[1])
+        elif message[0] == "playlist_imported":
+            self.on_playlist_imported(*message[1])
+        elif message[0] == "open_arguments":
+            self.open_arguments(message[1])
+    
+    def flush_log_lines(self):
+        """Escribe en el log las líneas acumuladas durante el ciclo"""
+        if self.pending_log_lines:
+            lines, self.pending_log_lines = self.pending_log_lines, []
+            self.write_log_lines(lines)
     
     def log_message(self, message):
         """Añade un mensaje al log de descargas"""
+        self.write_log_lines([f"{datetime.now().strftime('%H:%M:%S')} - {message}"])
+    
+    def write_log_lines(self, lines):
+        """Añade líneas al log conservando solo las últimas"""
+        if self.download_logger:
+            for line in lines:
+                self.download_logger.info(line)
+        
         self.download_log.config(state=tk.NORMAL)
-        self.download_log.insert(tk.END, f"{datetime.now().strftime('%H:%M:%S')} - {message}\n")
+        self.download_log.insert(tk.END, "\n".join(lines) + "\n")
+        self.log_line_count += len(lines)
+        
+        # Descartar las líneas más antiguas (búfer circular)
+        excess = self.log_line_count - self.config.get("log_max_lines", 500)
+        if excess > 0:
+            self.download_log.delete("1.0", f"{excess + 1}.0")
+            self.log_line_count -= excess
+        
         self.download_log.see(tk.END)
         self.download_log.config(state=tk.DISABLED)
     
+    def setup_download_logger(self):
+        """Configura la rotación del log de descargas a un archivo, si está activada"""
+        logger = logging.getLogger("AudioManager.downloads")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        
+        log_file = self.config.get("download_log_file", "")
+        if not log_file:
+            self.download_logger = None
+            return
+        
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        handler = RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=3, encoding='utf-8')
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self.download_logger = logger
+    
     def update_status(self, message):
         """Actualiza la barra de estado"""
         self.status_bar.config(text=message)
     
+    def save_pending_state(self):
+        """Guarda el índice de la biblioteca y la cola si hay cambios pendientes"""
+        try:
+            self.library_index.save()
+            self.play_queue.save()
+        except Exception as e:
+            print(f"Error al guardar el estado: {e}")
+        finally:
+            self.root.after(5000, self.save_pending_state)
+    
+    def format_duration(self, duration_sec):
+        """Formatea una duración en segundos como m:ss"""
+        if duration_sec is None:
+            return "Desconocida"
+        return f"{int(duration_sec // 60)}:{int(duration_sec % 60):02d}"
+    
+    @metrics.timed("probe")
+    def probe_duration(self, filepath):
+        """Obtiene la duración de un archivo de audio con mutagen"""
+        metrics.inc("tracks_probed")
+        try:
+            audio = MutagenFile(filepath)
+            if audio is not None and audio.info:
+                return audio.info.length
+        except Exception:
+            pass
+        return None
+    
+    def index_audio_file(self, filepath, stat=None, group=None):
+        """Actualiza la entrada del índice de un archivo y la devuelve"""
+        if stat is None:
+            stat = os.stat(filepath)
+        if self.library_index.is_current(filepath, stat) and group is None:
+            return self.library_index.get(filepath)
+        
+        record = Track(filepath, stat.st_size, stat.st_mtime, self.probe_duration(filepath), group=group)
+        self.library_index.upsert(record)
+        return record
+    
+    def library_row_values(self, filepath, number):
+        """Valores de una fila visible de la biblioteca, formateados al mostrarla"""
+        record = self.library_index.get(filepath)
+        if record is None:
+            return (number, os.path.basename(filepath), "", "", "", filepath)
+        return (number, record.name, self.format_duration(record.duration),
+                f"{record.size / (1024 * 1024):.2f} MB", record.format, filepath)
+    
+    def sort_library(self, column):
+        """Ordena la biblioteca por una columna; las anteriores quedan como criterios secundarios"""
+        if self.library_sort and self.library_sort[0][0] == column:
+            # Segundo clic en la misma columna: invertir el orden
+            self.library_sort[0] = (column, not self.library_sort[0][1])
+        else:
+            previous = [entry for entry in self.library_sort if entry[0] != column]
+            self.library_sort = [(column, False)] + previous[:self.LIBRARY_SORT_DEPTH - 1]
+        
+        # Indicar el criterio principal en la cabecera
+        for col in self.LIBRARY_SORT_FIELDS:
+            text = col
+            if col == column:
+                text += " ▼" if self.library_sort[0][1] else " ▲"
+            self.audio_tree.heading(col, text=text)
+        
+        self.library_view.sort([(self.library_index.sort_key(self.LIBRARY_SORT_FIELDS[col]), descending)
+                                for col, descending in self.library_sort])
+    
     # Funciones del menú y configuración
     def change_background(self, theme):
         """Cambia el tema de fondo"""
@@ -613,7 +3128,7 @@ class AudioManagerApp:
         """Muestra el diálogo de preferencias de descarga"""
         dialog = tk.Toplevel(self.root)
         dialog.title("Preferencias de Descarga")
-        dialog.geometry("400x300")
+        dialog.geometry("520x600")
         dialog.transient(self.root)
         dialog.grab_set()
         
@@ -642,10 +3157,66 @@ class AudioManagerApp:
         default_bitrate = tk.StringVar(value=self.config.get("bitrate", "128k"))
         ttk.Combobox(dialog, textvariable=default_bitrate, values=["64k", "96k", "128k", "192k", "256k", "320k"], state="readonly").pack(anchor="w", padx=20, pady=5)
         
+        ttk.Label(dialog, text="Perfiles de exportación (p. ej. mp3@320k, flac):").pack(anchor="w", padx=20, pady=(10, 5))
+        profiles = tk.StringVar(value=self.config.get("export_profiles", ""))
+        ttk.Entry(dialog, textvariable=profiles).pack(fill=tk.X, padx=20, pady=5)
+        
+        ttk.Label(dialog, text="Carpeta temporal (p. ej. en un SSD o tmpfs):").pack(anchor="w", padx=20, pady=(10, 5))
+        scratch_var = tk.StringVar(value=self.config.get("scratch_path", "temp"))
+        ttk.Entry(dialog, textvariable=scratch_var).pack(fill=tk.X, padx=20, pady=5)
+        
+        space_frame = ttk.Frame(dialog)
+        space_frame.pack(fill=tk.X, padx=20, pady=5)
+        ttk.Label(space_frame, text="Límite temporal (MB, 0 = sin límite):").pack(side=tk.LEFT)
+        budget_var = tk.StringVar(value=str(self.config.get("scratch_budget_mb", 0)))
+        ttk.Entry(space_frame, textvariable=budget_var, width=7).pack(side=tk.LEFT, padx=5)
+        ttk.Label(space_frame, text="Libre mínimo (MB):").pack(side=tk.LEFT, padx=(10, 0))
+        min_free_var = tk.StringVar(value=str(self.config.get("min_free_mb", 500)))
+        ttk.Entry(space_frame, textvariable=min_free_var, width=7).pack(side=tk.LEFT, padx=5)
+        
+        limits_frame = ttk.Frame(dialog)
+        limits_frame.pack(fill=tk.X, padx=20, pady=5)
+        ttk.Label(limits_frame, text="Descargas simultáneas:").pack(side=tk.LEFT)
+        workers_var = tk.StringVar(value=str(self.config.get("max_concurrent_downloads", 3)))
+        ttk.Entry(limits_frame, textvariable=workers_var, width=4).pack(side=tk.LEFT, padx=5)
+        ttk.Label(limits_frame, text="Por host:").pack(side=tk.LEFT, padx=(10, 0))
+        per_host_var = tk.StringVar(value=str(self.config.get("per_host_downloads", 2)))
+        ttk.Entry(limits_frame, textvariable=per_host_var, width=4).pack(side=tk.LEFT, padx=5)
+        ttk.Label(limits_frame, text="Límite KB/s (0 = sin límite):").pack(side=tk.LEFT, padx=(10, 0))
+        bandwidth_var = tk.StringVar(value=str(self.config.get("bandwidth_limit_kbps", 0)))
+        ttk.Entry(limits_frame, textvariable=bandwidth_var, width=7).pack(side=tk.LEFT, padx=5)
+        
+        stage_var = tk.BooleanVar(value=self.config.get("stage_in_scratch", False))
+        ttk.Checkbutton(dialog, text="Convertir en la carpeta temporal y mover a la biblioteca al terminar", variable=stage_var).pack(anchor="w", padx=20, pady=(5, 0))
+        
+        save_log_var = tk.BooleanVar(value=bool(self.config.get("download_log_file", "")))
+        ttk.Checkbutton(dialog, text="Guardar el log de descargas en logs/downloads.log", variable=save_log_var).pack(anchor="w", padx=20, pady=(10, 5))
+        
         def save_preferences():
+            try:
+                budget_mb, min_free_mb = int(budget_var.get()), int(min_free_var.get())
+                workers, per_host, bandwidth = int(workers_var.get()), int(per_host_var.get()), int(bandwidth_var.get())
+            except ValueError:
+                messagebox.showwarning("Advertencia", "Los límites de espacio y de descarga deben ser números enteros.", parent=dialog)
+                return
+            self.config.set("max_concurrent_downloads", workers)
+            self.config.set("per_host_downloads", per_host)
+            self.config.set("bandwidth_limit_kbps", bandwidth)
+            self.downloads.configure(workers, per_host, bandwidth)
+            scratch_path = scratch_var.get().strip() or "temp"
+            os.makedirs(scratch_path, exist_ok=True)
+            self.config.set("scratch_path", scratch_path)
+            self.config.set("scratch_budget_mb", budget_mb)
+            self.config.set("min_free_mb", min_free_mb)
+            self.config.set("stage_in_scratch", stage_var.get())
+            self.disk_budget.configure(scratch_path, budget_mb, min_free_mb)
             self.config.set("download_path", path_var.get())
             self.config.set("default_format", default_format.get())
             self.config.set("bitrate", default_bitrate.get())
+            self.config.set("export_profiles", profiles.get().strip())
+            self.profiles_var.set(profiles.get().strip())
+            self.config.set("download_log_file", os.path.join("logs", "downloads.log") if save_log_var.get() else "")
+            self.setup_download_logger()
             dialog.destroy()
             messagebox.showinfo("Preferencias", "Preferencias guardadas correctamente.")
         
@@ -655,6 +3226,90 @@ class AudioManagerApp:
         ttk.Button(button_frame, text="Guardar", command=save_preferences).pack(side=tk.LEFT, padx=10)
         ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
     
+    def start_metrics_server(self):
+        """Arranca el servidor local de métricas si hay un puerto configurado"""
+        port = self.config.get("metrics_port", 0)
+        if port:
+            try:
+                metrics.start_http_server(port)
+            except OSError as e:
+                print(f"No se pudo iniciar el servidor de métricas en el puerto {port}: {e}")
+    
+    def show_metrics_panel(self):
+        """Muestra el panel de rendimiento con las métricas de instrumentación"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Panel de Rendimiento")
+        dialog.geometry("640x420")
+        dialog.transient(self.root)
+        
+        top_frame = ttk.Frame(dialog)
+        top_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        enabled_var = tk.BooleanVar(value=metrics.enabled)
+        
+        def toggle_instrumentation():
+            metrics.enabled = enabled_var.get()
+            self.config.set("instrumentation", metrics.enabled)
+            if metrics.enabled:
+                self.start_metrics_server()
+        
+        ttk.Checkbutton(top_frame, text="Instrumentación activa", variable=enabled_var, command=toggle_instrumentation).pack(side=tk.LEFT)
+        
+        # Perfilado de la siguiente ejecución de una operación
+        ttk.Label(top_frame, text="Perfilar:").pack(side=tk.LEFT, padx=(20, 5))
+        operation_var = tk.StringVar(value=Metrics.OPERATIONS[0])
+        ttk.Combobox(top_frame, textvariable=operation_var, values=Metrics.OPERATIONS, state="readonly", width=14).pack(side=tk.LEFT)
+        
+        def arm_profiler():
+            metrics.profile_target = operation_var.get()
+            self.update_status(f"Se perfilará la próxima operación '{operation_var.get()}' (carpeta {metrics.profile_dir})")
+        
+        ttk.Button(top_frame, text="Perfilar siguiente", command=arm_profiler).pack(side=tk.LEFT, padx=5)
+        
+        columns = ("Métrica", "Recuento", "Media (ms)", "p50 (ms)", "p95 (ms)", "Máx (ms)")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings", height=12)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=90)
+        tree.column("Métrica", width=180)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10)
+        
+        profile_label = ttk.Label(dialog, text="")
+        profile_label.pack(anchor="w", padx=10, pady=5)
+        
+        def refresh():
+            if not dialog.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            snapshot = metrics.snapshot()
+            for name, histogram in sorted(snapshot["histograms"].items()):
+                tree.insert("", tk.END, values=(
+                    name, histogram["count"], f"{histogram['mean'] * 1000:.1f}",
+                    f"{histogram['p50'] * 1000:.1f}", f"{histogram['p95'] * 1000:.1f}", f"{histogram['max'] * 1000:.1f}"
+                ))
+            for name, value in sorted(snapshot["counters"].items()):
+                tree.insert("", tk.END, values=(name, value, "", "", "", ""))
+            if metrics.last_profile:
+                profile_label.config(text=f"Último perfil: {metrics.last_profile}")
+            dialog.after(1000, refresh)
+        
+        def export(extension, filetypes):
+            path = filedialog.asksaveasfilename(parent=dialog, defaultextension=extension, filetypes=filetypes,
+                                                initialfile=f"metrics{extension}")
+            if path:
+                metrics.dump(path)
+                self.update_status(f"Métricas exportadas: {path}")
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(side=tk.BOTTOM, pady=10)
+        
+        ttk.Button(button_frame, text="Exportar JSON", command=lambda: export(".json", [("JSON", "*.json")])).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Exportar Prometheus", command=lambda: export(".prom", [("Prometheus", "*.prom *.txt")])).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Reiniciar", command=metrics.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cerrar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+        
+        refresh()
+    
     # Funciones de la pestaña de descarga
     def paste_from_clipboard(self):
         """Pega el contenido del portapapeles en el campo de URL"""
@@ -713,7 +3368,7 @@ class AudioManagerApp:
         self.video_title_label.config(text=f"Título: {info['title']}")
         self.video_duration_label.config(text=f"Duración: {info['duration']}")
     
-    def download_and_convert(self):
+    def download_and_convert(self, stream=False):
         """Descarga y convierte el video de YouTube"""
         url = self.url_entry.get().strip()
         
@@ -721,74 +3376,644 @@ class AudioManagerApp:
             messagebox.showwarning("Advertencia", "Por favor, introduce una URL de YouTube.")
             return
         
-        # Ejecutar en un hilo separado
-        threading.Thread(target=self._download_and_convert_thread, args=(url,), daemon=True).start()
+        try:
+            self.parse_export_profiles(self.profiles_var.get())
+        except ValueError as e:
+            messagebox.showwarning("Advertencia", str(e))
+            return
+        
+        self.queue_download(url, stream)
     
-    def _download_and_convert_thread(self, url):
-        """Hilo para descargar y convertir el video"""
-        self.message_queue.put(("progress_start",))
+    def queue_download(self, url, stream=False, subscription=None, collection=None):
+        """Crea un trabajo de descarga y lo ejecuta en un hilo separado"""
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        self.add_download_job(job_id, url)
+        
+        # "Reproducir ya" no espera turno; el resto pasa por el grupo de hilos de descarga
+        args = (url, job_id, stream, subscription, collection)
+        if stream:
+            threading.Thread(target=self._download_and_convert_thread, args=args, daemon=True).start()
+        else:
+            self.downloads.submit(self._download_and_convert_thread, *args)
+    
+    def play_while_downloading(self):
+        """Reproduce el audio en cuanto llegan los primeros datos y lo añade a la biblioteca al terminar"""
+        self.download_and_convert(stream=True)
+    
+    def add_download_job(self, job_id, url):
+        """Añade la fila de progreso de un trabajo de descarga"""
+        row = job_id  # Las filas vacías de trabajos terminados no ocupan espacio
+        label = ttk.Label(self.jobs_frame, text=url[:50], width=40)
+        label.grid(row=row, column=0, sticky="w", padx=5, pady=2)
+        bar = ttk.Progressbar(self.jobs_frame, mode='determinate', maximum=100)
+        bar.grid(row=row, column=1, sticky="ew", padx=5, pady=2)
+        status = ttk.Label(self.jobs_frame, text="En espera", width=20)
+        status.grid(row=row, column=2, sticky="w", padx=5, pady=2)
+        self.download_jobs[job_id] = (label, bar, status)
+        
+        if not self.progress_refresh_scheduled:
+            self.progress_refresh_scheduled = True
+            self.root.after(self.PROGRESS_REFRESH_MS, self.refresh_download_progress)
+    
+    def remove_download_job(self, job_id):
+        """Quita la fila de progreso de un trabajo terminado"""
+        widgets = self.download_jobs.pop(job_id, None)
+        if widgets:
+            for widget in widgets:
+                widget.destroy()
+        with self.job_progress_lock:
+            self.job_progress.pop(job_id, None)
+    
+    @metrics.timed("ui_refresh")
+    def refresh_download_progress(self):
+        """Aplica el último progreso de cada trabajo a un ritmo fijo"""
+        with self.job_progress_lock:
+            updates, self.job_progress = self.job_progress, {}
+        
+        for job_id, (percent, text) in updates.items():
+            widgets = self.download_jobs.get(job_id)
+            if widgets:
+                widgets[1].config(value=percent)
+                widgets[2].config(text=text)
+        
+        # Caudal agregado de todas las descargas
+        rate = self.downloads.throughput()
+        self.jobs_frame.config(text=f"Descargas en curso ({len(self.download_jobs)}) - {rate / 1024:.0f} KB/s" if self.download_jobs else "Descargas en curso")
+        
+        # Solo se sigue refrescando mientras haya trabajos activos
+        if self.download_jobs:
+            self.root.after(self.PROGRESS_REFRESH_MS, self.refresh_download_progress)
+        else:
+            self.progress_refresh_scheduled = False
+    
+    def _download_and_convert_thread(self, url, job_id, stream=False, subscription=None, collection=None):
+        """Hilo para descargar y convertir el video (subscription: (fuente, clave del archivo))"""
         self.message_queue.put(("log", f"Iniciando descarga: {url}"))
         
+        # Carpeta temporal propia del trabajo: descargas simultáneas con el mismo título no chocan
+        job_dir = os.path.join(self.config.get("scratch_path", "temp"), f"job-{os.getpid()}-{job_id}")
+        # Si el reproductor lee la descarga, la carpeta se comparte con él
+        tee = None
+        # Sin almacenamiento por niveles se convierte en una carpeta oculta del trabajo dentro de la biblioteca
+        library_job_dir = None
         try:
-            # Configurar opciones de yt-dlp
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': 'temp/%(title)s.%(ext)s',
-                'quiet': True,
-                'no_warnings': True,
-                'progress_hooks': [self.download_progress_hook],
-            }
+            os.makedirs(job_dir, exist_ok=True)
             
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                info_dict = ydl.extract_info(url, download=True)
-                audio_file = ydl.prepare_filename(info_dict)
+            # yt-dlp compartido por los trabajos del mismo hilo
+            outtmpl = os.path.join(job_dir, '%(id)s.%(ext)s')
+            hook = lambda d: self.download_progress_hook(job_id, d)
+            
+            with self.downloads.session(outtmpl, hook, reuse=not stream) as ydl:
+                # "Reproducir Ya" no espera a las descargas en curso contra el mismo host ni al espacio temporal
+                with self.downloads.host_slot(url, priority=stream):
+                    info_dict = ydl.extract_info(url, download=False)
+                
+                # Formatos de salida: perfiles o formato/calidad seleccionados
+                targets = self.parse_export_profiles(self.profiles_var.get())
+                if not targets:
+                    targets = [(self.format_var.get(), self.bitrate_var.get())]
+                library_path = self.config.get("download_path", "downloads")
                 
-                # Convertir al formato deseado
-                output_format = self.format_var.get()
-                output_path = self.config.get("download_path", "downloads")
+                # Con el almacenamiento por niveles se convierte en la carpeta temporal y se mueve al final
+                staged = self.config.get("stage_in_scratch", False)
+                if staged:
+                    output_path = job_dir
+                else:
+                    # Misma unidad que la biblioteca: mover al final es solo renombrar
+                    output_path = library_job_dir = os.path.join(library_path, f".job-{os.getpid()}-{job_id}")
+                    os.makedirs(library_job_dir, exist_ok=True)
+                
+                # Admisión: esperar a que haya espacio temporal para el trabajo
+                def on_wait():
+                    with self.job_progress_lock:
+                        self.job_progress[job_id] = (0, "Esperando espacio...")
+                    self.message_queue.put(("log", "Sin espacio temporal suficiente, la descarga espera..."))
+                self.disk_budget.reserve(job_id, self.estimate_scratch_bytes(info_dict, targets, staged), on_wait,
+                                         priority=stream)
+                
+                with metrics.span("download"), self.downloads.host_slot(url, priority=stream):
+                    if stream:
+                        tee = self.start_stream(ydl, info_dict, job_id, job_dir)
+                        tee.wait()
+                        audio_file = tee.path
+                    else:
+                        info_dict = ydl.process_ie_result(info_dict, download=True)
+                        audio_file = ydl.prepare_filename(info_dict)
                 
                 # Crear nombre de archivo seguro
-                safe_title = "".join(c for c in info_dict['title'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                output_file = os.path.join(output_path, f"{safe_title}.{output_format}")
+                safe_title = self.safe_filename(info_dict['title'])
+                formats = [output_format for output_format, _ in targets]
                 
-                # Convertir usando pydub
-                self.message_queue.put(("log", f"Convirtiendo a {output_format}..."))
+                def output_names(base):
+                    # Si un formato se repite con distinta calidad, la calidad forma parte del nombre
+                    return [os.path.join(output_path, f"{base}{f' ({bitrate})' if formats.count(output_format) > 1 else ''}.{output_format}")
+                            for output_format, bitrate in targets]
                 
-                audio = AudioSegment.from_file(audio_file)
+                # Etiquetas y carátula a partir de la información del video
+                tags = self.download_tags(info_dict)
+                cover = self.fetch_cover(ydl, info_dict)
+                source = info_dict.get('webpage_url', url)
                 
-                # Aplicar configuración de calidad
-                bitrate = self.bitrate_var.get()
+                # Las salidas se enlazan en el índice como variantes de la misma pista
+                group = f"{info_dict.get('extractor_key', 'web')}:{info_dict.get('id', safe_title)}"
                 
-                # Exportar al formato deseado
-                if output_format == "mp3":
-                    audio.export(output_file, format="mp3", bitrate=bitrate)
-                else:
-                    audio.export(output_file, format=output_format)
+                # Convertir usando pydub: se decodifica una vez (solo si hay que recodificar) y se codifica en paralelo
+                self.message_queue.put(("log", f"Convirtiendo a {', '.join(formats)}..."))
+                
+                with metrics.span("convert"):
+                    # La duración sale de la cabecera del archivo o de la información del video, sin decodificar
+                    duration = self.probe_duration(audio_file) or info_dict.get('duration')
+                    audio = None
+                    if not duration:
+                        audio = AudioSegment.from_file(audio_file)
+                        duration = len(audio) / 1000
+                    length = int(round(duration * 1000))
+                    source_kbps = info_dict.get('abr') or info_dict.get('tbr')
+                    
+                    # Pistas a generar: (inicio ms, fin ms, etiquetas, archivos, grupo)
+                    segments = self.split_segments(audio_file, length, info_dict,
+                                                   self.split_var.get(), self.split_silence_var.get())
+                    if segments:
+                        album = tags.get("title", safe_title)
+                        tracks = []
+                        for number, (start, end, title) in enumerate(segments, 1):
+                            title = title or f"{album} ({number})"
+                            track_tags = dict(tags, title=title, album=album, tracknumber=f"{number}/{len(segments)}")
+                            base = f"{safe_title} - {number:02d} {self.safe_filename(title)}".rstrip()
+                            tracks.append((start, end, track_tags, output_names(base), f"{group}#{number}"))
+                        self.message_queue.put(("log", f"Dividiendo en {len(tracks)} pistas..."))
+                    else:
+                        tracks = [(0, length, tags, output_names(safe_title), group)]
+                    
+                    with ThreadPoolExecutor(max_workers=min(len(targets) * len(tracks), os.cpu_count() or 1)) as executor:
+                        futures = []
+                        for start, end, track_tags, files, _ in tracks:
+                            for output_file, (output_format, bitrate) in zip(files, targets):
+                                if self.can_stream_copy(audio_file, output_format, bitrate, source_kbps):
+                                    # Mismo códec que la descarga: se corta sin recodificar
+                                    futures.append(executor.submit(self.cut_stream_copy, audio_file, output_file, output_format,
+                                                                   start, end if segments else None, track_tags, cover))
+                                else:
+                                    # Los tramos se toman del audio decodificado, que se decodifica la primera vez que hace falta
+                                    if audio is None:
+                                        audio = AudioSegment.from_file(audio_file)
+                                    segment = audio[start:end] if segments else audio
+                                    futures.append(executor.submit(self.export_audio, segment, output_file, output_format,
+                                                                   bitrate, track_tags, cover))
+                        for future in futures:
+                            future.result()
                 
-                # Limpiar archivo temporal
-                os.remove(audio_file)
+                # Limpiar archivo temporal (el flujo en reproducción lo sigue usando)
+                if not stream:
+                    os.remove(audio_file)
                 
-                self.message_queue.put(("log", f"Conversión completada: {output_file}"))
-                self.message_queue.put(("download_complete", output_file))
+                # Mover las salidas a la biblioteca (p. ej. de un SSD a un disco más lento) con un nombre libre
+                tracks = [(start, end, track_tags, self.move_to_library(files, library_path), track_group)
+                          for start, end, track_tags, files, track_group in tracks]
+                
+                # Todo lo necesario para el índice ya se conoce: no hace falta analizar los archivos
+                results = []
+                for start, end, track_tags, files, track_group in tracks:
+                    metadata = {"duration": (end - start) / 1000, "tags": track_tags, "source": source}
+                    if not segments:
+                        chapters = [{"start": chapter.get("start_time", 0), "end": chapter.get("end_time"),
+                                     "title": chapter.get("title", "")} for chapter in info_dict.get('chapters') or []]
+                        if chapters:
+                            metadata["chapters"] = chapters
+                    results.append((files, track_group, metadata))
+                
+                # Las pistas de un video dividido se agrupan en una colección
+                if collection is None and segments:
+                    collection = safe_title
+                output_files = [file for files, _, _ in results for file in files]
+                
+                if subscription:
+                    self.subscriptions.mark(*subscription)
+                metrics.inc("downloads_completed")
+                self.message_queue.put(("log", f"Conversión completada: {len(output_files)} archivo(s)"))
+                # Las descargas de suscripciones no abren diálogos
+                self.message_queue.put(("download_complete", (results, collection, subscription is None)))
                 
         except Exception as e:
+            metrics.inc("downloads_failed")
             self.message_queue.put(("log", f"Error: {str(e)}"))
-            messagebox.showerror("Error", f"Ocurrió un error: {str(e)}")
+            if subscription:
+                self.subscriptions.forget(*subscription)
+            else:
+                messagebox.showerror("Error", f"Ocurrió un error: {str(e)}")
         finally:
-            self.message_queue.put(("progress_stop",))
+            if tee is None or tee.release():
+                shutil.rmtree(job_dir, ignore_errors=True)
+            if library_job_dir:
+                shutil.rmtree(library_job_dir, ignore_errors=True)
+            self.disk_budget.release(job_id)
+            self.message_queue.put(("job_finished", job_id))
+    
+    def start_stream(self, ydl, info_dict, job_id, job_dir):
+        """Empieza a descargar el mejor flujo de audio y avisa a la interfaz para reproducirlo"""
+        if not info_dict.get('url'):
+            raise ValueError("El video no ofrece un flujo de audio directo")
+        
+        last_written = [0]
+        
+        def on_progress(written, total):
+            # El flujo también cuenta para el límite de ancho de banda global
+            self.downloads.throttle(written - last_written[0])
+            last_written[0] = written
+            percent = written * 100 / total if total else 0
+            with self.job_progress_lock:
+                self.job_progress[job_id] = (percent, f"{percent:.1f}% (reproduciendo)")
+        
+        path = os.path.join(job_dir, f"{info_dict.get('id', job_id)}.{info_dict.get('ext', 'audio')}")
+        tee = StreamTee(ydl.urlopen, info_dict['url'], path, info_dict.get('http_headers'), on_progress)
+        tee.start()
+        self.message_queue.put(("play_stream", (tee, job_dir, info_dict.get('title', ''), info_dict.get('duration'))),
+                               MessagePump.HIGH)
+        return tee
+    
+    def on_stream_ready(self, tee, job_dir, title, duration):
+        """Reproduce el flujo local de una descarga en curso"""
+        self.play_audio(tee.local_url, title=title, duration=duration)
+        if self.current_playing == tee.local_url:
+            self.active_stream = (tee, job_dir)
+        else:
+            tee.close()
+            if tee.release():
+                shutil.rmtree(job_dir, ignore_errors=True)
+    
+    def close_stream(self):
+        """Detiene el servidor del flujo y borra su archivo temporal"""
+        if self.active_stream is None:
+            return
+        tee, job_dir = self.active_stream
+        self.active_stream = None
+        tee.close()
+        # Si la conversión sigue en marcha, la carpeta se borra cuando termine
+        if tee.release():
+            shutil.rmtree(job_dir, ignore_errors=True)
+    
+    def estimate_scratch_bytes(self, info_dict, targets, staged):
+        """Espacio temporal estimado de un trabajo: la descarga y, si se convierte allí, las salidas"""
+        duration = info_dict.get('duration') or 600
+        size = info_dict.get('filesize') or info_dict.get('filesize_approx') or duration * 320 * 1000 // 8
+        if staged:
+            for output_format, bitrate in targets:
+                if output_format in ("wav", "flac"):
+                    # PCM de 16 bits estéreo a 44,1 kHz (FLAC suele ocupar bastante menos)
+                    size += duration * 176400
+                else:
+                    size += duration * int((bitrate or "320k").rstrip("k")) * 1000 // 8
+        return int(size)
     
-    def download_progress_hook(self, d):
-        """Hook para el progreso de descarga"""
+    def move_to_library(self, files, library_path):
+        """Mueve las salidas terminadas a la biblioteca y devuelve sus nuevas rutas"""
+        moved = []
+        for file_path in files:
+            base, extension = os.path.splitext(os.path.basename(file_path))
+            target = os.path.join(library_path, base + extension)
+            number = 2
+            # Dos descargas con el mismo título no se pisan: el nombre se reserva creando el archivo
+            with self.library_names_lock:
+                while True:
+                    try:
+                        os.close(os.open(target, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                        break
+                    except FileExistsError:
+                        target = os.path.join(library_path, f"{base} ({number}){extension}")
+                        number += 1
+            try:
+                os.replace(file_path, target)
+            except OSError:
+                # Otra unidad: se copia sobre el archivo reservado
+                shutil.move(file_path, target)
+            moved.append(target)
+        return moved
+    
+    # Suscripciones
+    def check_subscriptions(self, force=False):
+        """Lanza la comprobación de las fuentes pendientes y se vuelve a programar"""
+        names = list(self.subscriptions.sources) if force else self.subscriptions.due()
+        for name in names:
+            if name not in self.checking_subscriptions:
+                self.check_subscription(name)
+        if not force:
+            self.root.after(self.SUBSCRIPTION_TICK_MS, self.check_subscriptions)
+    
+    def check_subscription(self, name, mark_only=False):
+        """Lista en segundo plano las entradas de una fuente (mark_only: solo archivarlas)"""
+        self.checking_subscriptions.add(name)
+        url = self.subscriptions.sources[name]["url"]
+        threading.Thread(target=self._list_subscription_thread, args=(name, url, mark_only), daemon=True).start()
+    
+    def _list_subscription_thread(self, name, url, mark_only):
+        """Extracción plana: solo metadatos, sin resolver ni descargar cada video"""
+        ydl_opts = {'extract_flat': 'in_playlist', 'quiet': True, 'no_warnings': True}
+        try:
+            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+            entries = []
+            pending = list(info.get('entries') or [])
+            while pending:
+                entry = pending.pop(0)
+                if not entry:
+                    continue
+                if entry.get('entries'):
+                    pending.extend(entry['entries'])
+                elif entry.get('id') and not (entry.get('ie_key') or "").endswith("Tab"):
+                    entries.append({"id": entry['id'], "ie_key": entry.get('ie_key') or info.get('extractor_key'),
+                                    "url": entry.get('webpage_url') or entry.get('url') or entry['id'],
+                                    "title": entry.get('title', '')})
+            self.message_queue.put(("subscription_entries", (name, entries, mark_only, None)))
+        except Exception as e:
+            self.message_queue.put(("subscription_entries", (name, [], mark_only, str(e))))
+    
+    def on_subscription_entries(self, name, entries, mark_only, error):
+        """Encola las entradas nuevas de una fuente en su colección"""
+        self.checking_subscriptions.discard(name)
+        if name not in self.subscriptions.sources:
+            return
+        if error:
+            self.log_message(f"Error al comprobar la suscripción '{name}': {error}")
+            return
+        
+        new_entries = self.subscriptions.new_entries(name, entries)
+        if mark_only:
+            # Al suscribirse sin descargar lo existente, todo lo actual queda archivado
+            for key, _ in new_entries:
+                self.subscriptions.mark(name, key)
+        else:
+            collection = self.subscriptions.sources[name]["collection"]
+            for key, entry in new_entries:
+                self.queue_download(entry["url"], subscription=(name, key), collection=collection)
+        self.subscriptions.touch(name)
+        
+        if new_entries and not mark_only:
+            self.log_message(f"Suscripción '{name}': {len(new_entries)} video(s) nuevo(s) en cola")
+            self.update_status(f"Suscripción '{name}': {len(new_entries)} nuevo(s)")
+    
+    def subscriptions_dialog(self):
+        """Gestiona las listas y canales seguidos"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Suscripciones")
+        dialog.geometry("560x420")
+        dialog.transient(self.root)
+        
+        columns = ("Nombre", "URL", "Cada (h)", "Descargados", "Última comprobación")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings", height=8)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=90)
+        tree.column("URL", width=180)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            for name, source in sorted(self.subscriptions.sources.items()):
+                checked = source.get("last_checked")
+                checked = datetime.fromtimestamp(checked).strftime("%Y-%m-%d %H:%M") if checked else "Nunca"
+                tree.insert("", tk.END, iid=name, values=(name, source["url"], source["interval_hours"],
+                                                          len(self.subscriptions.archives.get(name, ())), checked))
+        
+        form = ttk.Frame(dialog)
+        form.pack(fill=tk.X, padx=10)
+        ttk.Label(form, text="URL:").grid(row=0, column=0, sticky="w")
+        url_var = tk.StringVar()
+        ttk.Entry(form, textvariable=url_var, width=50).grid(row=0, column=1, columnspan=3, sticky="ew", pady=2)
+        ttk.Label(form, text="Nombre / colección:").grid(row=1, column=0, sticky="w")
+        name_var = tk.StringVar()
+        ttk.Entry(form, textvariable=name_var, width=25).grid(row=1, column=1, sticky="w", pady=2)
+        ttk.Label(form, text="Cada (horas):").grid(row=1, column=2, sticky="e")
+        interval_var = tk.StringVar(value=str(Subscriptions.DEFAULT_INTERVAL_HOURS))
+        ttk.Entry(form, textvariable=interval_var, width=5).grid(row=1, column=3, sticky="w", padx=5)
+        skip_existing_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(form, text="Descargar solo los videos que se publiquen a partir de ahora",
+                        variable=skip_existing_var).grid(row=2, column=0, columnspan=4, sticky="w", pady=2)
+        
+        def add():
+            url = url_var.get().strip()
+            name = self.safe_filename(name_var.get().strip())
+            if not url or not name:
+                messagebox.showwarning("Advertencia", "Introduce la URL y un nombre para la suscripción.", parent=dialog)
+                return
+            if name in self.subscriptions.sources:
+                messagebox.showwarning("Advertencia", f"La suscripción '{name}' ya existe.", parent=dialog)
+                return
+            try:
+                interval = float(interval_var.get())
+            except ValueError:
+                messagebox.showwarning("Advertencia", "El intervalo debe ser un número de horas.", parent=dialog)
+                return
+            self.subscriptions.add(name, url, name, interval)
+            self.check_subscription(name, mark_only=skip_existing_var.get())
+            url_var.set("")
+            name_var.set("")
+            refresh()
+        
+        def remove():
+            for name in tree.selection():
+                self.subscriptions.remove(name)
+            refresh()
+        
+        def check_now():
+            for name in tree.selection() or self.subscriptions.sources:
+                if name not in self.checking_subscriptions:
+                    self.check_subscription(name)
+            self.update_status("Comprobando suscripciones...")
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Añadir", command=add).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Eliminar", command=remove).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Comprobar ahora", command=check_now).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cerrar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+        
+        refresh()
+    
+    def parse_export_profiles(self, text):
+        """Convierte "mp3@320k, flac" en [("mp3", "320k"), ("flac", None)]"""
+        targets = []
+        for profile in text.replace(";", ",").split(","):
+            profile = profile.strip().lower()
+            if not profile:
+                continue
+            output_format, _, bitrate = profile.partition("@")
+            if output_format not in self.EXPORT_FORMATS:
+                raise ValueError(f"Formato no soportado en los perfiles: {output_format}")
+            targets.append((output_format, bitrate or None))
+        return targets
+    
+    def safe_filename(self, text):
+        """Nombre de archivo sin caracteres problemáticos"""
+        return "".join(c for c in text if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    
+    def split_segments(self, audio_file, length, info_dict, by_chapters=True, by_silence=False):
+        """Tramos (inicio ms, fin ms, título) por capítulos o, si no hay, por silencios"""
+        chapters = info_dict.get('chapters') or []
+        if by_chapters and len(chapters) > 1:
+            return [(int(chapter.get("start_time", 0) * 1000),
+                     int(chapter["end_time"] * 1000) if chapter.get("end_time") else length,
+                     chapter.get("title", "")) for chapter in chapters]
+        
+        # Los silencios solo se buscan en mezclas largas y si se ha pedido expresamente
+        if not by_silence or length < self.SILENCE_MIN_DURATION:
+            return []
+        cuts = [0]
+        for cut in self.silence_cuts(audio_file):
+            # Las pistas demasiado cortas se unen a la siguiente
+            if cut - cuts[-1] >= self.SILENCE_MIN_SEGMENT and length - cut >= self.SILENCE_MIN_SEGMENT:
+                cuts.append(cut)
+        if len(cuts) < 2:
+            return []
+        cuts.append(length)
+        return [(cuts[i], cuts[i + 1], "") for i in range(len(cuts) - 1)]
+    
+    def silence_cuts(self, audio_file, noise_db=-40, min_silence=2):
+        """Puntos de corte (ms) en medio de cada silencio, detectados por FFmpeg sin decodificar en memoria"""
+        command = [AudioSegment.converter, "-nostdin", "-hide_banner", "-nostats", "-i", audio_file, "-map", "0:a:0",
+                   "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"]
+        with metrics.span("silence"):
+            result = subprocess.run(command, capture_output=True, text=True, errors="replace",
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "FFmpeg falló")
+        
+        # El silencio se reparte entre la pista anterior y la siguiente
+        cuts = []
+        start = None
+        for line in result.stderr.splitlines():
+            if "silence_start:" in line:
+                start = float(line.split("silence_start:")[1].split()[0])
+            elif "silence_end:" in line and start is not None:
+                end = float(line.split("silence_end:")[1].split()[0])
+                cuts.append(int((max(start, 0) + end) / 2 * 1000))
+                start = None
+        return cuts
+    
+    def can_stream_copy(self, source_file, output_format, bitrate, source_kbps=None):
+        """Indica si la salida puede copiar el flujo de la descarga sin recodificar"""
+        if os.path.splitext(source_file)[1][1:].lower() != output_format:
+            return False
+        if not bitrate:
+            return True
+        # La descarga ya alcanza la calidad pedida (con margen para el bitrate medio de los flujos VBR)
+        try:
+            return bool(source_kbps) and source_kbps >= int(bitrate.rstrip("k")) * 0.95
+        except ValueError:
+            return False
+    
+    def cut_stream_copy(self, source_file, output_file, output_format, start, end, tags, cover=None):
+        """Extrae un tramo de la descarga copiando el flujo de audio (sin `end`, hasta el final)"""
+        command = [AudioSegment.converter, "-y", "-loglevel", "error", "-ss", f"{start / 1000:.3f}"]
+        if end is not None:
+            command += ["-to", f"{end / 1000:.3f}"]
+        command += ["-i", source_file, "-map", "0:a", "-map_metadata", "-1", "-c", "copy"]
+        for field, value in tags.items():
+            command += ["-metadata", f"{'track' if field == 'tracknumber' else field}={value}"]
+        command += ["-f", self.EXPORT_FORMATS[output_format][0], output_file]
+        
+        with metrics.span("encode"):
+            result = subprocess.run(command, capture_output=True, text=True,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "FFmpeg falló")
+        if cover:
+            try:
+                TagWriter.embed_cover(output_file, output_format, cover)
+            except Exception as e:
+                self.message_queue.put(("log", f"No se pudo insertar la carátula en {os.path.basename(output_file)}: {e}"))
+        return output_file
+    
+    def download_tags(self, info_dict):
+        """Etiquetas de la pista a partir de la información de yt-dlp"""
+        upload_date = info_dict.get('upload_date') or ""
+        tags = {
+            "title": info_dict.get('track') or info_dict.get('title'),
+            "artist": info_dict.get('artist') or info_dict.get('creator') or info_dict.get('uploader'),
+            "album": info_dict.get('album'),
+            "genre": info_dict.get('genre'),
+            "date": str(info_dict.get('release_year') or upload_date[:4]),
+            "tracknumber": str(info_dict.get('track_number') or ""),
+        }
+        return {field: value for field, value in tags.items() if value}
+    
+    def fetch_cover(self, ydl, info_dict):
+        """Descarga la miniatura del video como JPEG; None si no hay o falla"""
+        thumbnail = info_dict.get('thumbnail')
+        if not thumbnail:
+            return None
+        try:
+            with ydl.urlopen(thumbnail) as response:
+                data = response.read()
+            # Las miniaturas suelen ser WebP, que muchos reproductores no muestran
+            image = Image.open(io.BytesIO(data)).convert("RGB")
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=90)
+            return output.getvalue()
+        except Exception as e:
+            self.message_queue.put(("log", f"No se pudo obtener la carátula: {e}"))
+            return None
+    
+    def export_audio(self, audio, output_file, output_format, bitrate, tags=None, cover=None):
+        """Codifica un AudioSegment ya decodificado en un formato de salida"""
+        # FFmpeg escribe las etiquetas en la misma pasada de codificación
+        ffmpeg_tags = {("track" if field == "tracknumber" else field): value for field, value in (tags or {}).items()}
+        with metrics.span("encode"):
+            ffmpeg_format, codec = self.EXPORT_FORMATS[output_format]
+            if output_format in ("wav", "flac") or not bitrate:
+                # Formatos sin pérdida: la calidad no se aplica
+                audio.export(output_file, format=ffmpeg_format, codec=codec, tags=ffmpeg_tags or None)
+            else:
+                audio.export(output_file, format=ffmpeg_format, codec=codec, bitrate=bitrate, tags=ffmpeg_tags or None)
+        if cover:
+            try:
+                TagWriter.embed_cover(output_file, output_format, cover)
+            except Exception as e:
+                self.message_queue.put(("log", f"No se pudo insertar la carátula en {os.path.basename(output_file)}: {e}"))
+        return output_file
+    
+    def download_progress_hook(self, job_id, d):
+        """Hook para el progreso de descarga (el último valor sustituye al anterior)"""
         if d['status'] == 'downloading':
-            percent = d.get('_percent_str', '0%').strip()
-            self.message_queue.put(("log", f"Descargando: {percent}"))
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            percent = d.get('downloaded_bytes', 0) * 100 / total if total else 0
+            speed = (d.get('_speed_str') or '').strip()
+            with self.job_progress_lock:
+                self.job_progress[job_id] = (percent, f"{percent:.1f}% {speed}")
         elif d['status'] == 'finished':
+            with self.job_progress_lock:
+                self.job_progress[job_id] = (100, "Convirtiendo...")
             self.message_queue.put(("log", "Descarga completada, convirtiendo..."))
     
-    def on_download_complete(self, file_path):
+    def on_download_complete(self, result):
         """Maneja la finalización de la descarga"""
-        messagebox.showinfo("Éxito", f"Audio descargado y convertido:\n{file_path}")
-        self.load_audio_files()  # Actualizar la biblioteca
+        tracks, collection, notify = result
+        
+        # Actualizar la biblioteca sin volver a escanear ni analizar los archivos
+        output_files = []
+        for files, group, metadata in tracks:
+            extra = dict(metadata["tags"], source=metadata["source"])
+            if "chapters" in metadata:
+                extra["chapters"] = metadata["chapters"]
+            for file_path in files:
+                stat = os.stat(file_path)
+                self.library_index.upsert(Track(file_path, stat.st_size, stat.st_mtime, metadata["duration"],
+                                                group=group if len(files) > 1 else None, extra=dict(extra)))
+                output_files.append(file_path)
+        
+        # Las pistas de un video dividido forman una colección (primer formato de cada pista)
+        if collection:
+            self.add_files_to_collection(collection, [files[0] for files, _, _ in tracks])
+            if collection not in self.collections_listbox.get(0, tk.END):
+                self.collections_listbox.insert(tk.END, collection)
+        
+        self.library_view.append([file_path for file_path in output_files if self.library_view.position(file_path) is None])
+        if not notify:
+            self.update_status(f"Descargado: {os.path.basename(output_files[0])}" if output_files else "Descarga completada")
+        elif collection and len(tracks) > 1:
+            messagebox.showinfo("Éxito", f"Audio descargado y dividido en {len(tracks)} pistas.\nColección creada: {collection}")
+        else:
+            messagebox.showinfo("Éxito", "Audio descargado y convertido:\n" + "\n".join(output_files))
     
     def clear_download_fields(self):
         """Limpia los campos de descarga"""
@@ -798,38 +4023,32 @@ class AudioManagerApp:
         self.download_log.config(state=tk.NORMAL)
         self.download_log.delete(1.0, tk.END)
         self.download_log.config(state=tk.DISABLED)
+        self.log_line_count = 0
     
     # Funciones de la pestaña de biblioteca
+    @metrics.timed("scan")
     def load_audio_files(self):
         """Carga los archivos de audio de la carpeta de descargas"""
-        # Limpiar lista actual
-        for item in self.audio_tree.get_children():
-            self.audio_tree.delete(item)
-        
         # Obtener archivos de audio
         download_path = self.config.get("download_path", "downloads")
         audio_extensions = ('.mp3', '.wav', '.m4a', '.ogg', '.flac')
         
+        rows = []
         if os.path.exists(download_path):
-            for i, filename in enumerate(os.listdir(download_path), 1):
-                if filename.lower().endswith(audio_extensions):
-                    filepath = os.path.join(download_path, filename)
-                    size = os.path.getsize(filepath) / (1024 * 1024)  # MB
-                    
-                    # Obtener duración si es posible
-                    duration = "Desconocida"
-                    try:
-                        audio = MP3(filepath)
-                        duration_sec = audio.info.length
-                        duration = f"{int(duration_sec // 60)}:{int(duration_sec % 60):02d}"
-                    except:
-                        pass
-                    
-                    # Añadir a la lista
-                    self.audio_tree.insert("", tk.END, values=(
-                        i, filename, duration, f"{size:.2f} MB", 
-                        os.path.splitext(filename)[1][1:].upper(), filepath
-                    ))
+            for entry in os.scandir(download_path):
+                if entry.is_file() and entry.name.lower().endswith(audio_extensions):
+                    # Solo se analizan con mutagen los archivos nuevos o modificados
+                    record = self.index_audio_file(entry.path, entry.stat())
+                    rows.append(record.path)
+        
+        # Quitar del índice los archivos que ya no existen
+        seen = set(rows)
+        for filepath in list(self.library_index.tracks):
+            if filepath not in seen and os.path.dirname(filepath) == download_path:
+                self.library_index.remove(filepath)
+        
+        # La vista solo formatea las filas visibles
+        self.library_view.set_rows(rows)
         
         self.update_status(f"Biblioteca cargada: {download_path}")
     
@@ -837,12 +4056,30 @@ class AudioManagerApp:
         """Busca archivos de audio en la biblioteca"""
         query = self.search_entry.get().lower()
         
-        for item in self.audio_tree.get_children():
-            values = self.audio_tree.item(item, "values")
-            if query in values[1].lower():  # Buscar en el nombre
-                self.audio_tree.selection_set(item)
-                self.audio_tree.see(item)
-                break
+        if not query:
+            self.library_view.select([])
+            return
+        
+        # Seleccionar todas las coincidencias para poder operar sobre ellas en bloque
+        matches = self.library_index.search(query, self.library_view.rows)  # Buscar en el nombre y las etiquetas
+        self.library_view.select(matches)
+        if matches:
+            self.library_view.see(matches[0])
+    
+    def enqueue_search_results(self):
+        """Añade a la cola todos los resultados de la búsqueda actual"""
+        self.search_audio_files()
+        filepaths = self.get_selected_library_files()
+        if not filepaths:
+            messagebox.showwarning("Advertencia", "La búsqueda no tiene resultados.")
+            return
+        
+        added = self.enqueue_files(filepaths)
+        self.update_status(f"Añadidos {len(added)} resultados a la cola")
+    
+    def get_selected_library_files(self):
+        """Rutas de los archivos seleccionados en la biblioteca"""
+        return self.library_view.selection()
     
     def browse_audio_files(self):
         """Permite explorar y añadir archivos de audio desde cualquier ubicación"""
@@ -873,26 +4110,44 @@ class AudioManagerApp:
     
     def play_selected_audio(self):
         """Reproduce el archivo de audio seleccionado"""
-        selection = self.audio_tree.selection()
+        selection = self.get_selected_library_files()
         if not selection:
             messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
             return
         
-        item = selection[0]
-        values = self.audio_tree.item(item, "values")
-        filepath = values[5]  # La ruta está en la columna 6
+        if len(selection) == 1:
+            self.play_audio(selection[0])
+        else:
+            # Varias pistas: se encolan y se reproduce la primera
+            self.play_files(selection)
+    
+    def play_files(self, filepaths):
+        """Encola varios archivos y empieza a reproducir el primero"""
+        added = self.enqueue_files(filepaths)
+        if not added:
+            return
         
-        self.play_audio(filepath)
+        self.play_queue.set_current(added[0]["id"])
+        self.play_audio(added[0]["path"])
+        self.highlight_current_in_queue()
+        self.update_status(f"Reproduciendo {len(added)} pistas")
     
-    def play_audio(self, filepath):
-        """Reproduce un archivo de audio"""
+    @metrics.timed("playback_start")
+    def play_audio(self, filepath, title=None, duration=None):
+        """Reproduce un archivo de audio (o un flujo local con su título y duración)"""
         try:
             # Detener reproducción actual
             if self.is_playing:
                 self.player.stop()
+            if self.active_stream and filepath != self.active_stream[0].local_url:
+                self.close_stream()
             
-            # Configurar y reproducir
-            media = self.vlc_instance.media_new(filepath)
+            # Configurar y reproducir (los archivos locales se reutilizan de la caché)
+            self.play_requested_at = time.perf_counter()
+            if os.path.exists(filepath):
+                media = self.media_cache.get(filepath)
+            else:
+                media = self.vlc_instance.media_new(filepath)
             self.player.set_media(media)
             self.player.play()
             self.player.audio_set_volume(int(self.volume * 100))
@@ -901,44 +4156,75 @@ class AudioManagerApp:
             self.current_playing = filepath
             self.is_playing = True
             self.is_paused = False
+            self.schedule_progress_update()
             
             # Actualizar interfaz
-            filename = os.path.basename(filepath)
+            filename = title or os.path.basename(filepath)
             self.current_song_label.config(text=filename)
             self.play_button.config(text="⏸")
             
-            # Actualizar tiempo de la canción
-            self.update_song_duration()
+            # Actualizar tiempo de la canción: primero la duración conocida, sin analizar el medio
+            if duration is None:
+                record = self.library_index.get(filepath)
+                duration = record.duration if record is not None else None
+            if duration:
+                self.time_label.config(text=f"00:00 / {int(duration // 60)}:{int(duration % 60):02d}")
+            else:
+                self.update_song_duration()
             
             self.update_status(f"Reproduciendo: {filename}")
             
+            # Preparar las siguientes pistas cuando la interfaz quede libre
+            self.root.after_idle(self.preload_upcoming)
+            
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo reproducir el archivo: {str(e)}")
     
+    def on_player_playing(self, event):
+        """Evento de VLC (en su propio hilo): la pista ha empezado a sonar"""
+        requested_at, self.play_requested_at = self.play_requested_at, None
+        if requested_at is not None and metrics.enabled:
+            metrics.observe("time_to_first_audio", time.perf_counter() - requested_at)
+    
+    def preload_upcoming(self):
+        """Precarga los medios de las próximas pistas de la cola"""
+        paths = [item["path"] for item in self.play_queue.upcoming(self.PRELOAD_COUNT)]
+        self.media_cache.preload([path for path in paths if os.path.exists(path)])
+    
     def add_to_queue(self):
         """Añade el archivo seleccionado a la cola de reproducción"""
-        selection = self.audio_tree.selection()
+        selection = self.get_selected_library_files()
         if not selection:
             messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
             return
         
-        item = selection[0]
-        values = self.audio_tree.item(item, "values")
-        filepath = values[5]
-        filename = values[1]
-        
-        # Obtener duración
-        duration = values[2]
-        
         # Añadir a la cola
-        self.playlist.append(filepath)
-        self.queue_tree.insert("", tk.END, values=(len(self.playlist), filename, duration))
+        added = self.enqueue_files(selection)
+        
+        if len(added) == 1:
+            self.update_status(f"Añadido a la cola: {added[0]['name']}")
+        else:
+            self.update_status(f"Añadidas {len(added)} pistas a la cola")
+    
+    def enqueue_files(self, filepaths):
+        """Añade varios archivos a la cola en una sola operación"""
+        entries = []
+        for filepath in filepaths:
+            record = self.library_index.get(filepath)
+            if record is None:
+                entries.append((filepath, os.path.basename(filepath), None))
+            else:
+                entries.append((filepath, record.name, record.duration))
         
-        self.update_status(f"Añadido a la cola: {filename}")
+        start = len(self.play_queue)
+        added = self.play_queue.extend(entries)
+        for position, item in enumerate(added, start):
+            self.queue_tree.insert("", tk.END, iid=item["id"], values=self.queue_row_values(item, position))
+        return added
     
     def add_to_collection(self):
         """Añade el archivo seleccionado a una colección"""
-        selection = self.audio_tree.selection()
+        selection = self.get_selected_library_files()
         if not selection:
             messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
             return
@@ -947,92 +4233,736 @@ class AudioManagerApp:
         collections = []
         collections_path = "collections"
         if os.path.exists(collections_path):
-            collections = [f for f in os.listdir(collections_path) if f.endswith('.json')]
+            collections = [f for f in os.listdir(collections_path) if f.endswith('.json')
+                           and f.replace('.json', '') not in self.library_index.smart_rules]
         
         if not collections:
             messagebox.showwarning("Advertencia", "No hay colecciones disponibles. Crea una colección primero.")
             return
-        
-        # Diálogo para seleccionar colección
+        
+        # Diálogo para seleccionar colección
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Seleccionar Colección")
+        dialog.geometry("300x200")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text="Selecciona una colección:").pack(pady=20)
+        
+        collection_var = tk.StringVar()
+        collection_combo = ttk.Combobox(dialog, textvariable=collection_var, values=[c.replace('.json', '') for c in collections], state="readonly")
+        collection_combo.pack(pady=10)
+        
+        def add_to_selected():
+            collection_name = collection_var.get()
+            if not collection_name:
+                messagebox.showwarning("Advertencia", "Por favor, selecciona una colección.")
+                return
+            
+            # Añadir a la colección
+            added = self.add_files_to_collection(collection_name, selection)
+            
+            if added:
+                messagebox.showinfo("Éxito", f"{added} archivo(s) añadido(s) a la colección '{collection_name}'.")
+            else:
+                messagebox.showinfo("Información", "Los archivos ya están en esta colección.")
+            
+            dialog.destroy()
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(side=tk.BOTTOM, pady=20)
+        
+        ttk.Button(button_frame, text="Añadir", command=add_to_selected).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
+    
+    def add_files_to_collection(self, collection_name, filepaths):
+        """Añade varios archivos a una colección con una sola escritura y devuelve cuántos se añadieron"""
+        collection_file = os.path.join("collections", f"{collection_name}.json")
+        if os.path.exists(collection_file):
+            with open(collection_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
+            data = {"name": collection_name, "files": []}
+        
+        # Verificar si ya existen
+        existing = set(data["files"])
+        new_files = []
+        for filepath in filepaths:
+            if filepath not in existing:
+                existing.add(filepath)
+                new_files.append(filepath)
+        
+        if new_files:
+            data["files"].extend(new_files)
+            with open(collection_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+        return len(new_files)
+    
+    def tag_editor_dialog(self):
+        """Edita las etiquetas de las pistas seleccionadas (una o varias a la vez)"""
+        filepaths = self.get_selected_library_files()
+        if not filepaths:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
+            return
+        
+        # Con una sola pista se leen las etiquetas del archivo; con varias, las del índice
+        if len(filepaths) == 1:
+            try:
+                audio = MutagenFile(filepaths[0], easy=True)
+                if audio is not None and audio.tags is not None:
+                    self.library_index.update_tags(filepaths[0], {field: audio.get(field, [""])[0] for field in Track.TAG_FIELDS})
+            except Exception:
+                pass
+        records = [self.library_index.get(filepath) for filepath in filepaths]
+        current = [record.tags() if record is not None else {} for record in records]
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Editar Etiquetas" if len(filepaths) == 1 else f"Editar Etiquetas ({len(filepaths)} pistas)")
+        dialog.geometry("420x320")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        labels = {"title": "Título:", "artist": "Artista:", "album": "Álbum:",
+                  "genre": "Género:", "date": "Año:", "tracknumber": "Pista:"}
+        initial = {}
+        variables = {}
+        for row, field in enumerate(Track.TAG_FIELDS):
+            values = {tags.get(field, "") for tags in current}
+            # Si las pistas tienen valores distintos el campo queda vacío y solo se aplica si se escribe algo
+            initial[field] = values.pop() if len(values) == 1 else None
+            ttk.Label(dialog, text=labels[field]).grid(row=row, column=0, sticky="w", padx=20, pady=5)
+            variables[field] = tk.StringVar(value=initial[field] or "")
+            entry = ttk.Entry(dialog, textvariable=variables[field], width=35)
+            entry.grid(row=row, column=1, padx=(0, 20), pady=5)
+            if initial[field] is None:
+                ttk.Label(dialog, text="(varios)").grid(row=row, column=2, sticky="w")
+        
+        def save():
+            changes = {}
+            for field, variable in variables.items():
+                value = variable.get().strip()
+                if initial[field] is None and not value:
+                    continue
+                if value != (initial[field] or ""):
+                    changes[field] = value
+            dialog.destroy()
+            if not changes:
+                return
+            
+            # El índice se actualiza al momento; el archivo se escribe en segundo plano
+            for filepath in filepaths:
+                self.library_index.update_tags(filepath, changes)
+            self.tag_writer.submit({filepath: changes for filepath in filepaths})
+            self.update_status(f"Guardando etiquetas de {len(filepaths)} archivo(s)...")
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.grid(row=len(Track.TAG_FIELDS), column=0, columnspan=3, pady=15)
+        ttk.Button(button_frame, text="Guardar", command=save).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
+    
+    def on_tags_written(self, written, errors):
+        """Actualiza tamaño y fecha de los archivos escritos para no volver a analizarlos"""
+        for filepath in written:
+            record = self.library_index.get(filepath)
+            if record is None or not os.path.exists(filepath):
+                continue
+            stat = os.stat(filepath)
+            # El archivo se reescribió: la suma y la verificación anteriores ya no valen
+            self.library_index.upsert(Track(filepath, stat.st_size, stat.st_mtime, record.duration,
+                                            record.added, record.group, record.kept_extra()))
+        self.library_view.render()
+        
+        for error in errors:
+            self.log_message(f"Error al guardar etiquetas: {error}")
+        if errors:
+            self.update_status(f"Etiquetas guardadas en {len(written)} archivo(s), {len(errors)} con errores")
+        else:
+            self.update_status(f"Etiquetas guardadas en {len(written)} archivo(s)")
+    
+    def delete_audio_file(self):
+        """Elimina los archivos de audio seleccionados"""
+        selection = self.get_selected_library_files()
+        if not selection:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
+            return
+        
+        if len(selection) == 1:
+            question = f"¿Estás seguro de que quieres eliminar '{os.path.basename(selection[0])}'?"
+        else:
+            question = f"¿Estás seguro de que quieres eliminar {len(selection)} archivos?"
+        
+        # Confirmar eliminación
+        if not messagebox.askyesno("Confirmar", question):
+            return
+        
+        deleted, errors = self.remove_audio_files(selection)
+        self.update_status(f"Archivos eliminados: {len(deleted)}")
+        
+        if errors:
+            messagebox.showerror("Error", "No se pudieron eliminar algunos archivos:\n" + "\n".join(errors[:10]))
+    
+    def remove_audio_files(self, filepaths):
+        """Borra archivos del disco, del índice y de la vista; devuelve (eliminados, errores)"""
+        deleted = []
+        errors = []
+        for filepath in filepaths:
+            try:
+                self.media_cache.discard(filepath)
+                os.remove(filepath)
+                deleted.append(filepath)
+                self.library_index.remove(filepath)
+                
+                # Si estaba en reproducción, detener
+                if self.current_playing == filepath:
+                    self.player.stop()
+                    self.current_playing = None
+                    self.is_playing = False
+                    self.play_button.config(text="▶")
+                    self.current_song_label.config(text="No hay ninguna canción en reproducción")
+            except Exception as e:
+                errors.append(f"{os.path.basename(filepath)}: {str(e)}")
+        
+        self.library_view.remove(deleted)
+        return deleted, errors
+    
+    # Transcodificación por lotes
+    def transcode_dialog(self):
+        """Muestra el diálogo para convertir archivos existentes de la biblioteca"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Transcodificar Biblioteca")
+        dialog.geometry("400x360")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text="Archivos a convertir:").pack(anchor="w", padx=20, pady=(20, 5))
+        scope_var = tk.StringVar(value="selection" if self.library_view.selected else "library")
+        ttk.Radiobutton(dialog, text=f"Selección ({len(self.library_view.selected)} archivos)", variable=scope_var, value="selection").pack(anchor="w", padx=30)
+        
+        collection_frame = ttk.Frame(dialog)
+        collection_frame.pack(fill=tk.X, padx=30)
+        ttk.Radiobutton(collection_frame, text="Colección:", variable=scope_var, value="collection").pack(side=tk.LEFT)
+        collection_var = tk.StringVar()
+        ttk.Combobox(collection_frame, textvariable=collection_var, values=self.collections_listbox.get(0, tk.END), state="readonly", width=20).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Radiobutton(dialog, text=f"Biblioteca completa ({len(self.library_index.tracks)} archivos)", variable=scope_var, value="library").pack(anchor="w", padx=30)
+        
+        options_frame = ttk.Frame(dialog)
+        options_frame.pack(fill=tk.X, padx=20, pady=10)
+        ttk.Label(options_frame, text="Formato:").pack(side=tk.LEFT)
+        format_var = tk.StringVar(value="mp3")
+        ttk.Combobox(options_frame, textvariable=format_var, values=list(self.EXPORT_FORMATS), state="readonly", width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Label(options_frame, text="Calidad:").pack(side=tk.LEFT, padx=(10, 0))
+        bitrate_var = tk.StringVar(value=self.config.get("bitrate", "128k"))
+        ttk.Combobox(options_frame, textvariable=bitrate_var, values=["64k", "96k", "128k", "192k", "256k", "320k"], state="readonly", width=6).pack(side=tk.LEFT, padx=5)
+        
+        delete_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dialog, text="Eliminar los originales después de convertir", variable=delete_var).pack(anchor="w", padx=20)
+        
+        def start():
+            scope = scope_var.get()
+            if scope == "selection":
+                sources = self.get_selected_library_files()
+            elif scope == "collection":
+                sources = self.get_collection_files(collection_var.get()) if collection_var.get() else []
+            else:
+                sources = list(self.library_index.tracks)
+            sources = [source for source in sources if os.path.exists(source)]
+            
+            if not sources:
+                messagebox.showwarning("Advertencia", "No hay archivos que convertir.", parent=dialog)
+                return
+            if delete_var.get() and not messagebox.askyesno("Confirmar", f"Se eliminarán hasta {len(sources)} archivos originales. ¿Continuar?", parent=dialog):
+                return
+            
+            dialog.destroy()
+            state = {"sources": sources, "format": format_var.get(), "bitrate": bitrate_var.get(),
+                     "delete_originals": delete_var.get(), "done": []}
+            self.start_transcode_job(state)
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(side=tk.BOTTOM, pady=20)
+        ttk.Button(button_frame, text="Convertir", command=start).pack(side=tk.LEFT, padx=10)
+        
+        # Trabajo interrumpido en una sesión anterior
+        state = self.load_transcode_state()
+        if state and len(state["done"]) < len(state["sources"]):
+            def resume():
+                dialog.destroy()
+                self.start_transcode_job(state)
+            
+            ttk.Button(button_frame, text=f"Reanudar ({len(state['done'])}/{len(state['sources'])})", command=resume).pack(side=tk.LEFT, padx=10)
+        
+        ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
+    
+    def load_transcode_state(self):
+        """Carga el estado del último trabajo de transcodificación, si existe"""
+        if os.path.exists(self.TRANSCODE_STATE_FILE):
+            try:
+                with open(self.TRANSCODE_STATE_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error al cargar el trabajo de transcodificación: {e}")
+        return None
+    
+    def save_transcode_state(self, state):
+        tmp_file = self.TRANSCODE_STATE_FILE + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.TRANSCODE_STATE_FILE)
+    
+    def is_converted(self, source, output_file):
+        """Indica si `output_file` ya es la conversión de `source`: una variante suya en el índice o más reciente que él"""
+        if not os.path.exists(output_file):
+            return False
+        if output_file in self.library_index.variants(source):
+            return True
+        return os.path.getmtime(output_file) >= os.path.getmtime(source)
+    
+    def plan_transcode_targets(self, sources, output_format):
+        """Asigna a cada origen un archivo de salida propio, sin pisar otros archivos ni otras salidas"""
+        targets = {}
+        taken = set()
+        for source in sources:
+            if os.path.splitext(source)[1][1:].lower() == output_format:
+                targets[source] = source
+                taken.add(os.path.normcase(source))
+        for source in sources:
+            if source in targets:
+                continue
+            base = os.path.splitext(source)[0]
+            output_file = f"{base}.{output_format}"
+            # Una conversión anterior de este mismo origen se reutiliza (el trabajo la omitirá)
+            if os.path.normcase(output_file) not in taken and self.is_converted(source, output_file):
+                taken.add(os.path.normcase(output_file))
+                targets[source] = output_file
+                continue
+            number = 2
+            # x.wav y x.flac no pueden acabar ambos en x.mp3, ni sobrescribir un x.mp3 ajeno que ya existía
+            while os.path.normcase(output_file) in taken or os.path.exists(output_file):
+                output_file = f"{base} ({number}).{output_format}"
+                number += 1
+            taken.add(os.path.normcase(output_file))
+            targets[source] = output_file
+        return targets
+    
+    def start_transcode_job(self, state):
+        """Guarda el estado del trabajo y lo lanza en segundo plano"""
+        # Las salidas se fijan al crear el trabajo y se guardan para poder reanudarlo
+        if "targets" not in state:
+            state["targets"] = self.plan_transcode_targets(state["sources"], state["format"])
+        self.save_transcode_state(state)
+        
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        self.add_download_job(job_id, f"Transcodificar {len(state['sources'])} → {state['format']}")
+        threading.Thread(target=self._transcode_thread, args=(state, job_id), daemon=True).start()
+    
+    def _transcode_thread(self, state, job_id):
+        """Hilo que reparte la conversión entre tantos procesos de FFmpeg como núcleos"""
+        done = set(state["done"])
+        pending = [source for source in state["sources"] if source not in done]
+        total = len(state["sources"])
+        workers = os.cpu_count() or 1
+        self.message_queue.put(("log", f"Transcodificando {len(pending)} archivos a {state['format']} con {workers} procesos"))
+        
+        start_time = time.perf_counter()
+        last_save = start_time
+        converted = skipped = failed = 0
+        processed_bytes = 0
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self.transcode_file, source, state["targets"][source],
+                                           state["format"], state["bitrate"]): source
+                           for source in pending}
+                for future in as_completed(futures):
+                    source = futures[future]
+                    output_file = state["targets"][source]
+                    try:
+                        size = os.path.getsize(source)
+                        was_written = future.result()
+                    except Exception as e:
+                        failed += 1
+                        metrics.inc("transcodes_failed")
+                        self.message_queue.put(("log", f"Error al convertir {os.path.basename(source)}: {e}"))
+                        continue
+                    
+                    # Solo se borra el original cuyo resultado ha escrito este trabajo
+                    deleted = False
+                    if state["delete_originals"] and was_written:
+                        os.remove(source)
+                        deleted = True
+                    
+                    if was_written:
+                        converted += 1
+                        processed_bytes += size
+                    else:
+                        skipped += 1
+                    state["done"].append(source)
+                    self.message_queue.put(("transcoded", (source, output_file, deleted)))
+                    
+                    # Progreso y rendimiento
+                    elapsed = max(time.perf_counter() - start_time, 1e-6)
+                    with self.job_progress_lock:
+                        self.job_progress[job_id] = (
+                            len(state["done"]) * 100 / total,
+                            f"{converted / elapsed:.1f} arch/s {processed_bytes / elapsed / (1024 * 1024):.1f} MB/s"
+                        )
+                    
+                    # Guardar el estado cada pocos segundos para poder reanudar
+                    if time.perf_counter() - last_save > 2:
+                        self.save_transcode_state(state)
+                        last_save = time.perf_counter()
+        finally:
+            self.save_transcode_state(state)
+            if len(state["done"]) >= total:
+                os.remove(self.TRANSCODE_STATE_FILE)
+            
+            elapsed = max(time.perf_counter() - start_time, 1e-6)
+            self.message_queue.put(("log", (
+                f"Transcodificación terminada: {converted} convertidos, {skipped} omitidos, {failed} con error "
+                f"({converted / elapsed:.2f} arch/s, {processed_bytes / elapsed / (1024 * 1024):.2f} MB/s)"
+            )))
+            self.message_queue.put(("transcode_complete",))
+            self.message_queue.put(("job_finished", job_id))
+    
+    def transcode_file(self, source, output_file, output_format, bitrate):
+        """Convierte un archivo con FFmpeg conservando las etiquetas; devuelve si se escribió la salida"""
+        if output_file == source or self.is_converted(source, output_file):
+            # Ya está en el formato pedido o convertido por un trabajo anterior
+            return False
+        self.convert_file(source, output_file, output_format, bitrate)
+        return True
+    
+    def convert_file(self, source, output_file, output_format, bitrate):
+        """Convierte un archivo con FFmpeg a `output_file`, que solo aparece cuando está completo"""
+        ffmpeg_format, codec = self.EXPORT_FORMATS[output_format]
+        command = [AudioSegment.converter, "-y", "-loglevel", "error", "-i", source,
+                   "-map", "0:a", "-map_metadata", "0"]
+        if output_format in self.COVER_FORMATS:
+            # Conservar la portada incrustada si el contenedor de destino admite imágenes
+            command += ["-map", "0:v?", "-c:v", "copy", "-disposition:v", "attached_pic"]
+        if codec:
+            command += ["-c:a", codec]
+        if output_format not in ("wav", "flac") and bitrate:
+            command += ["-b:a", bitrate]
+        if output_format == "mp3":
+            command += ["-id3v2_version", "3"]
+        
+        # Se escribe en un temporal único de la misma carpeta para no dejar salidas a medias
+        # ni compartirlo con otra conversión en paralelo
+        fd, tmp_file = tempfile.mkstemp(suffix=".part", prefix=".", dir=os.path.dirname(output_file) or ".")
+        os.close(fd)
+        command += ["-f", ffmpeg_format, tmp_file]
+        
+        try:
+            with metrics.span("transcode"):
+                result = subprocess.run(command, capture_output=True, text=True,
+                                        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "FFmpeg falló")
+            os.replace(tmp_file, output_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    
+    def on_file_transcoded(self, source, output_file, deleted):
+        """Refleja en el índice un archivo convertido"""
+        if os.path.exists(output_file):
+            self.index_audio_file(output_file)
+        if deleted:
+            self.library_index.remove(source)
+    
+    # Trabajos sobre los archivos de la biblioteca
+    def start_file_job(self, description, filepaths, function, result_kind, complete_kind, failure_kind=None):
+        """Aplica `function` a cada archivo en segundo plano y envía cada resultado (y cada error) como mensaje"""
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        self.add_download_job(job_id, f"{description} {len(filepaths)} archivos")
+        threading.Thread(target=self._file_job_thread,
+                         args=(description, filepaths, function, result_kind, complete_kind, job_id, failure_kind),
+                         daemon=True).start()
+    
+    def _file_job_thread(self, description, filepaths, function, result_kind, complete_kind, job_id, failure_kind=None):
+        """Hilo que reparte el trabajo entre tantos procesos de FFmpeg como núcleos"""
+        workers = os.cpu_count() or 1
+        self.message_queue.put(("log", f"{description}: {len(filepaths)} archivos con {workers} procesos"))
+        
+        start_time = time.perf_counter()
+        done = failed = 0
+        processed_bytes = 0
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(function, filepath): filepath for filepath in filepaths}
+                for future in as_completed(futures):
+                    filepath = futures[future]
+                    done += 1
+                    try:
+                        result = future.result()
+                        processed_bytes += os.path.getsize(filepath)
+                    except Exception as e:
+                        failed += 1
+                        self.message_queue.put(("log", f"{description}: error en {os.path.basename(filepath)}: {e}"))
+                        if failure_kind:
+                            self.message_queue.put((failure_kind, (filepath, str(e))))
+                        continue
+                    self.message_queue.put((result_kind, (filepath,) + tuple(result)))
+                    
+                    elapsed = max(time.perf_counter() - start_time, 1e-6)
+                    with self.job_progress_lock:
+                        self.job_progress[job_id] = (
+                            done * 100 / len(filepaths),
+                            f"{done / elapsed:.1f} arch/s {processed_bytes / elapsed / (1024 * 1024):.1f} MB/s"
+                        )
+        finally:
+            elapsed = max(time.perf_counter() - start_time, 1e-6)
+            self.message_queue.put(("log", (
+                f"{description}: {done - failed} archivos procesados, {failed} con error "
+                f"({done / elapsed:.2f} arch/s, {processed_bytes / elapsed / (1024 * 1024):.2f} MB/s)"
+            )))
+            self.message_queue.put((complete_kind, (done - failed, failed)))
+            self.message_queue.put(("job_finished", job_id))
+    
+    # Verificación de integridad
+    def start_verify_job(self):
+        """Verifica en segundo plano las pistas nuevas o modificadas desde la última verificación"""
+        pending = []
+        for filepath, record in list(self.library_index.tracks.items()):
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            if record.verified_checksum() is None or not self.library_index.is_current(filepath, stat):
+                pending.append(filepath)
+        
+        if not pending:
+            self.on_verify_complete(0, 0)
+            return
+        
+        self.start_file_job("Verificar", pending, self.verify_file, "verified", "verify_complete")
+    
+    def verify_file(self, filepath):
+        """Calcula la suma SHA-256 y decodifica el archivo entero; devuelve (tamaño, fecha, suma, error)"""
+        stat = os.stat(filepath)
+        with metrics.span("verify"):
+            checksum = self.file_checksum(filepath)
+            
+            # Cabecera y etiquetas
+            try:
+                if MutagenFile(filepath) is None:
+                    return stat.st_size, stat.st_mtime, checksum, "Formato no reconocido"
+            except Exception as e:
+                return stat.st_size, stat.st_mtime, checksum, f"Cabecera dañada: {e}"
+            
+            # Decodificación completa: detecta archivos truncados o con tramas corruptas
+            command = [AudioSegment.converter, "-nostdin", "-v", "error", "-i", filepath,
+                       "-map", "0:a", "-f", "null", "-"]
+            result = subprocess.run(command, capture_output=True, text=True, errors="replace",
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        error = None
+        if result.returncode != 0 or result.stderr.strip():
+            lines = result.stderr.strip().splitlines()
+            error = lines[0] if lines else "FFmpeg no pudo decodificar el archivo"
+        return stat.st_size, stat.st_mtime, checksum, error
+    
+    @staticmethod
+    def file_checksum(filepath):
+        """Suma SHA-256 del contenido de un archivo"""
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def on_file_verified(self, filepath, size, mtime, checksum, error):
+        """Guarda en el índice la suma y el resultado de la verificación"""
+        record = self.library_index.get(filepath)
+        if record is None:
+            return
+        if record.size != size or record.mtime != mtime:
+            # El archivo cambió desde el último escaneo
+            self.library_index.upsert(Track(filepath, size, mtime, self.probe_duration(filepath),
+                                            record.added, record.group, record.kept_extra()))
+        self.library_index.update_extra(filepath, {"checksum": checksum, "checksum_size": size,
+                                                   "checksum_mtime": mtime, "integrity": error or "ok"})
+        if error:
+            metrics.inc("tracks_broken")
+            self.log_message(f"Archivo dañado: {os.path.basename(filepath)}: {error}")
+    
+    def on_verify_complete(self, verified, failed):
+        """Informa del resultado y muestra los archivos dañados, si los hay"""
+        self.library_index.save()
+        broken = self.library_index.broken()
+        self.update_status(f"Verificación terminada: {verified} archivos comprobados, {len(broken)} dañados en la biblioteca")
+        if broken:
+            self.verify_report_dialog()
+    
+    def verify_report_dialog(self):
+        """Lista los archivos dañados con acciones para volver a descargarlos o eliminarlos"""
         dialog = tk.Toplevel(self.root)
-        dialog.title("Seleccionar Colección")
-        dialog.geometry("300x200")
+        dialog.title("Archivos Dañados")
+        dialog.geometry("680x380")
         dialog.transient(self.root)
-        dialog.grab_set()
         
-        ttk.Label(dialog, text="Selecciona una colección:").pack(pady=20)
-        
-        collection_var = tk.StringVar()
-        collection_combo = ttk.Combobox(dialog, textvariable=collection_var, values=[c.replace('.json', '') for c in collections], state="readonly")
-        collection_combo.pack(pady=10)
+        columns = ("Archivo", "Error", "Origen")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings", height=10)
+        for col in columns:
+            tree.heading(col, text=col)
+        tree.column("Archivo", width=200)
+        tree.column("Error", width=280)
+        tree.column("Origen", width=160)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        for filepath in self.library_index.broken():
+            record = self.library_index.get(filepath)
+            tree.insert("", tk.END, iid=filepath, values=(os.path.basename(filepath), record.get_extra("integrity"),
+                                                           record.get_extra("source") or "Desconocido"))
+        
+        def redownload():
+            sources = [self.library_index.get(filepath).get_extra("source") for filepath in tree.selection()
+                       if self.library_index.get(filepath) is not None]
+            sources = [source for source in sources if source]
+            if not sources:
+                messagebox.showwarning("Advertencia", "Las pistas seleccionadas no tienen URL de origen.", parent=dialog)
+                return
+            for source in sources:
+                self.queue_download(source)
+            self.update_status(f"Volviendo a descargar {len(sources)} archivo(s)")
         
-        def add_to_selected():
-            collection_name = collection_var.get()
-            if not collection_name:
-                messagebox.showwarning("Advertencia", "Por favor, selecciona una colección.")
+        def remove():
+            filepaths = list(tree.selection())
+            if not filepaths or not messagebox.askyesno("Confirmar", f"¿Eliminar {len(filepaths)} archivo(s) dañado(s)?", parent=dialog):
                 return
-            
-            item = selection[0]
-            values = self.audio_tree.item(item, "values")
-            filepath = values[5]
-            filename = values[1]
-            
-            # Añadir a la colección
-            collection_file = os.path.join(collections_path, f"{collection_name}.json")
-            if os.path.exists(collection_file):
-                with open(collection_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            else:
-                data = {"name": collection_name, "files": []}
-            
-            # Verificar si ya existe
-            if filepath not in data["files"]:
-                data["files"].append(filepath)
-                
-                with open(collection_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=4)
-                
-                messagebox.showinfo("Éxito", f"Archivo añadido a la colección '{collection_name}'.")
-            else:
-                messagebox.showinfo("Información", "El archivo ya está en esta colección.")
-            
-            dialog.destroy()
+            deleted, errors = self.remove_audio_files(filepaths)
+            if deleted:
+                tree.delete(*deleted)
+            self.update_status(f"Archivos eliminados: {len(deleted)}")
+            if errors:
+                messagebox.showerror("Error", "No se pudieron eliminar algunos archivos:\n" + "\n".join(errors[:10]), parent=dialog)
         
         button_frame = ttk.Frame(dialog)
-        button_frame.pack(side=tk.BOTTOM, pady=20)
+        button_frame.pack(pady=(0, 10))
+        ttk.Button(button_frame, text="Volver a Descargar", command=redownload).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Eliminar", command=remove).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cerrar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    # Análisis de audio y pistas similares
+    def start_analysis_job(self):
+        """Calcula en segundo plano las características de las pistas que aún no las tienen"""
+        pending = [filepath for filepath, record in list(self.library_index.tracks.items())
+                   if record.get_extra("features") is None and record.get_extra("analysis_error") is None
+                   and os.path.exists(filepath)]
+        if not pending:
+            self.update_status("Todas las pistas de la biblioteca están analizadas")
+            return
         
-        ttk.Button(button_frame, text="Añadir", command=add_to_selected).pack(side=tk.LEFT, padx=10)
-        ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
+        self.start_file_job("Analizar", pending, SimilarityIndex.extract, "analyzed", "analysis_complete",
+                            failure_kind="analysis_failed")
     
-    def delete_audio_file(self):
-        """Elimina el archivo de audio seleccionado"""
-        selection = self.audio_tree.selection()
-        if not selection:
+    def on_file_analyzed(self, filepath, features, bpm):
+        """Guarda las características en el índice"""
+        self.library_index.update_extra(filepath, {"features": features, "bpm": bpm})
+        self.similarity.invalidate()
+    
+    def on_analysis_failed(self, filepath, error):
+        """Marca la pista para no volver a decodificarla en cada análisis (se reintenta si cambia)"""
+        self.library_index.update_extra(filepath, {"analysis_error": error})
+    
+    def on_analysis_complete(self, analyzed, failed):
+        self.library_index.save()
+        self.update_status(f"Análisis terminado: {analyzed} archivos analizados, {failed} con error")
+    
+    def enqueue_similar(self):
+        """Encola las pistas más parecidas a la seleccionada (o a la que suena)"""
+        selection = self.get_selected_library_files()
+        seed = selection[0] if selection else self.current_playing
+        if not seed:
             messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
             return
         
-        item = selection[0]
-        values = self.audio_tree.item(item, "values")
-        filepath = values[5]
-        filename = values[1]
+        start_time = time.perf_counter()
+        similar = self.similarity.similar(seed, self.SIMILAR_COUNT)
+        if metrics.enabled:
+            metrics.observe("similar_query", time.perf_counter() - start_time)
+        if not similar:
+            messagebox.showinfo("Información", "La pista no está analizada. Usa \"Analizar\" para calcular sus características.")
+            return
+        self.enqueue_files(similar)
+        self.update_status(f"{len(similar)} pistas similares a {os.path.basename(seed)} añadidas a la cola "
+                           f"({(time.perf_counter() - start_time) * 1000:.0f} ms)")
+    
+    # Calidad real de los archivos
+    def start_quality_job(self):
+        """Estima el bitrate real de las pistas con pérdida que aún no se han medido"""
+        pending = [filepath for filepath, record in list(self.library_index.tracks.items())
+                   if record.format.lower() in BitrateDetector.LOSSY_FORMATS
+                   and record.get_extra("cutoff_hz") is None and os.path.exists(filepath)]
+        if not pending:
+            self.on_quality_complete(0, 0)
+            return
+        self.start_file_job("Medir calidad", pending, BitrateDetector.extract, "quality_measured", "quality_complete")
+    
+    def on_quality_measured(self, filepath, cutoff, effective, nominal):
+        """Guarda en el índice la frecuencia de corte y los bitrates real y nominal"""
+        self.library_index.update_extra(filepath, {"cutoff_hz": cutoff, "effective_bitrate": effective, "bitrate": nominal})
+    
+    def on_quality_complete(self, measured, failed):
+        """Ofrece recodificar los archivos con más bitrate del que justifica su contenido"""
+        self.library_index.save()
+        oversized = {filepath: record.get_extra("effective_bitrate")
+                     for filepath, record in self.library_index.tracks.items() if BitrateDetector.is_oversized(record)}
+        self.update_status(f"Calidad medida en {measured} archivos, {len(oversized)} sobredimensionados")
+        if not oversized:
+            return
         
-        # Confirmar eliminación
-        if messagebox.askyesno("Confirmar", f"¿Estás seguro de que quieres eliminar '{filename}'?"):
-            try:
-                os.remove(filepath)
-                self.audio_tree.delete(item)
-                self.update_status(f"Archivo eliminado: {filename}")
-                
-                # Si estaba en reproducción, detener
-                if self.current_playing == filepath:
-                    self.player.stop()
-                    self.current_playing = None
-                    self.is_playing = False
-                    self.play_button.config(text="▶")
-                    self.current_song_label.config(text="No hay ninguna canción en reproducción")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"No se pudo eliminar el archivo: {str(e)}")
+        wasted = sum(self.library_index.get(filepath).size * (1 - bitrate / self.library_index.get(filepath).get_extra("bitrate"))
+                     for filepath, bitrate in oversized.items())
+        if messagebox.askyesno("Calidad Real", (
+                f"{len(oversized)} archivo(s) tienen más bitrate que la calidad real de su origen "
+                f"(se liberarían unos {wasted / (1024 * 1024):.0f} MB).\n\n¿Recodificarlos a su calidad real?")):
+            self.start_file_job("Recodificar", list(oversized),
+                                lambda filepath: self.reencode_file(filepath, oversized[filepath]),
+                                "reencoded", "reencode_complete")
+    
+    def reencode_file(self, filepath, bitrate):
+        """Recodifica un archivo en su mismo formato con menos bitrate; devuelve (tamaño, fecha, bitrate)"""
+        output_format = os.path.splitext(filepath)[1][1:].lower()
+        ffmpeg_format, codec = self.EXPORT_FORMATS[output_format]
+        command = [AudioSegment.converter, "-y", "-nostdin", "-loglevel", "error", "-i", filepath,
+                   "-map", "0:a", "-map_metadata", "0", "-c:a", codec, "-b:a", f"{bitrate}k"]
+        if output_format == "mp3":
+            # Conservar la portada incrustada
+            command += ["-map", "0:v?", "-c:v", "copy", "-id3v2_version", "3"]
+        
+        tmp_file = filepath + ".part"
+        command += ["-f", ffmpeg_format, tmp_file]
+        with metrics.span("reencode"):
+            result = subprocess.run(command, capture_output=True, text=True,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        if result.returncode != 0:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "FFmpeg falló")
+        
+        os.replace(tmp_file, filepath)
+        stat = os.stat(filepath)
+        return stat.st_size, stat.st_mtime, bitrate
+    
+    def on_file_reencoded(self, filepath, size, mtime, bitrate):
+        """Actualiza el registro sin perder etiquetas ni características"""
+        record = self.library_index.get(filepath)
+        if record is None:
+            return
+        self.media_cache.discard(filepath)
+        # El contenido cambió: la suma de verificación anterior ya no vale
+        extra = dict(record.kept_extra() or {}, bitrate=bitrate)
+        self.library_index.upsert(Track(filepath, size, mtime, record.duration, record.added, record.group, extra))
+    
+    def on_reencode_complete(self, reencoded, failed):
+        self.library_index.save()
+        self.library_view.render()
+        self.update_status(f"Recodificados {reencoded} archivos, {failed} con error")
     
     # Funciones de la pestaña de colecciones
     def load_recent_collections(self):
@@ -1042,6 +4972,15 @@ class AudioManagerApp:
             collections = [f.replace('.json', '') for f in os.listdir(collections_path) if f.endswith('.json')]
             for collection in collections:
                 self.collections_listbox.insert(tk.END, collection)
+                
+                # Registrar las colecciones inteligentes en el índice
+                try:
+                    with open(os.path.join(collections_path, f"{collection}.json"), 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    if data.get("smart"):
+                        self.library_index.register_smart_collection(collection, data["rules"])
+                except Exception as e:
+                    print(f"Error al cargar la colección '{collection}': {e}")
     
     def create_collection(self):
         """Crea una nueva colección"""
@@ -1069,6 +5008,98 @@ class AudioManagerApp:
         
         self.update_status(f"Colección creada: {name}")
     
+    def create_smart_collection(self):
+        """Crea una colección basada en reglas sobre los metadatos de las pistas"""
+        name = self.collection_name_entry.get().strip()
+        
+        if not name:
+            messagebox.showwarning("Advertencia", "Por favor, introduce un nombre para la colección.")
+            return
+        
+        collection_file = os.path.join("collections", f"{name}.json")
+        if os.path.exists(collection_file):
+            messagebox.showwarning("Advertencia", f"La colección '{name}' ya existe.")
+            return
+        
+        # Campos disponibles: etiqueta -> (campo del índice, factor de conversión)
+        fields = {
+            "Nombre": ("name", None),
+            "Formato": ("format", None),
+            "Duración (min)": ("duration", 60),
+            "Tamaño (MB)": ("size", 1024 * 1024),
+            "Añadido": ("added", None),
+        }
+        rules = []
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Colección Inteligente: {name}")
+        dialog.geometry("500x350")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        rule_frame = ttk.Frame(dialog)
+        rule_frame.pack(fill=tk.X, padx=20, pady=(20, 5))
+        
+        field_var = tk.StringVar(value="Formato")
+        ttk.Combobox(rule_frame, textvariable=field_var, values=list(fields), state="readonly", width=14).pack(side=tk.LEFT)
+        op_var = tk.StringVar(value="=")
+        ttk.Combobox(rule_frame, textvariable=op_var, values=LibraryIndex.OPERATORS, state="readonly", width=12).pack(side=tk.LEFT, padx=5)
+        value_entry = ttk.Entry(rule_frame, width=15)
+        value_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        rules_listbox = tk.Listbox(dialog, height=8)
+        rules_listbox.pack(fill=tk.BOTH, expand=True, padx=20, pady=5)
+        
+        def add_rule():
+            label = field_var.get()
+            field, factor = fields[label]
+            op = op_var.get()
+            value = value_entry.get().strip()
+            if not value:
+                return
+            
+            if op == "últimos días" and field != "added":
+                messagebox.showwarning("Advertencia", "'últimos días' solo se aplica al campo 'Añadido'.")
+                return
+            if field == "added" and op != "últimos días":
+                messagebox.showwarning("Advertencia", "El campo 'Añadido' solo admite 'últimos días'.")
+                return
+            if field in LibraryIndex.NUMERIC_FIELDS:
+                try:
+                    value = float(value) * (factor or 1)
+                except ValueError:
+                    messagebox.showwarning("Advertencia", "El valor debe ser numérico.")
+                    return
+            
+            rules.append({"field": field, "op": op, "value": value})
+            rules_listbox.insert(tk.END, f"{label} {op} {value_entry.get().strip()}")
+            value_entry.delete(0, tk.END)
+        
+        ttk.Button(rule_frame, text="Añadir regla", command=add_rule).pack(side=tk.LEFT, padx=(5, 0))
+        
+        def save_collection():
+            if not rules:
+                messagebox.showwarning("Advertencia", "Añade al menos una regla.")
+                return
+            
+            data = {"name": name, "smart": True, "rules": rules, "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            with open(collection_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+            
+            self.library_index.register_smart_collection(name, rules)
+            self.collections_listbox.insert(tk.END, name)
+            self.collection_name_entry.delete(0, tk.END)
+            dialog.destroy()
+            
+            count = len(self.library_index.smart_collection_files(name))
+            self.update_status(f"Colección inteligente creada: {name} ({count} pistas)")
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(side=tk.BOTTOM, pady=10)
+        
+        ttk.Button(button_frame, text="Guardar", command=save_collection).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
+    
     def delete_collection(self):
         """Elimina la colección seleccionada"""
         selection = self.collections_listbox.curselection()
@@ -1084,6 +5115,7 @@ class AudioManagerApp:
             
             try:
                 os.remove(collection_file)
+                self.library_index.unregister_smart_collection(name)
                 self.collections_listbox.delete(selection[0])
                 self.collection_tree.delete(*self.collection_tree.get_children())
                 
@@ -1092,6 +5124,387 @@ class AudioManagerApp:
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo eliminar la colección: {str(e)}")
     
+    # Sincronización de colecciones con un dispositivo
+    def sync_collection_dialog(self):
+        """Configura el destino de la colección seleccionada y la sincroniza"""
+        selection = self.collections_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona una colección.")
+            return
+        name = self.collections_listbox.get(selection[0])
+        target = self.config.get("sync_targets", {}).get(name, {})
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Sincronizar '{name}'")
+        dialog.geometry("460x250")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text="Carpeta de destino (teléfono, memoria USB...):").pack(anchor="w", padx=20, pady=(20, 5))
+        destination_frame = ttk.Frame(dialog)
+        destination_frame.pack(fill=tk.X, padx=20)
+        destination_var = tk.StringVar(value=target.get("destination", ""))
+        ttk.Entry(destination_frame, textvariable=destination_var, width=40).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        def browse():
+            folder = filedialog.askdirectory(parent=dialog)
+            if folder:
+                destination_var.set(folder)
+        
+        ttk.Button(destination_frame, text="Examinar", command=browse).pack(side=tk.LEFT, padx=(5, 0))
+        
+        profile_frame = ttk.Frame(dialog)
+        profile_frame.pack(fill=tk.X, padx=20, pady=10)
+        ttk.Label(profile_frame, text="Formato:").pack(side=tk.LEFT)
+        format_var = tk.StringVar(value=target.get("format") or "original")
+        ttk.Combobox(profile_frame, textvariable=format_var, values=["original"] + list(self.EXPORT_FORMATS), state="readonly", width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Label(profile_frame, text="Calidad:").pack(side=tk.LEFT, padx=(10, 0))
+        bitrate_var = tk.StringVar(value=target.get("bitrate", self.config.get("bitrate", "128k")))
+        ttk.Combobox(profile_frame, textvariable=bitrate_var, values=["64k", "96k", "128k", "192k", "256k", "320k"], state="readonly", width=6).pack(side=tk.LEFT, padx=5)
+        
+        delete_var = tk.BooleanVar(value=target.get("delete_extra", True))
+        ttk.Checkbutton(dialog, text="Borrar del destino las pistas que ya no están en la colección", variable=delete_var).pack(anchor="w", padx=20)
+        
+        def start():
+            destination = destination_var.get().strip()
+            if not destination:
+                messagebox.showwarning("Advertencia", "Por favor, elige una carpeta de destino.", parent=dialog)
+                return
+            target = {"destination": destination, "format": "" if format_var.get() == "original" else format_var.get(),
+                      "bitrate": bitrate_var.get(), "delete_extra": delete_var.get()}
+            targets = dict(self.config.get("sync_targets", {}))
+            targets[name] = target
+            self.config.set("sync_targets", targets)
+            dialog.destroy()
+            self.start_sync_job(name, target)
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(side=tk.BOTTOM, pady=20)
+        ttk.Button(button_frame, text="Sincronizar", command=start).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=10)
+    
+    def start_sync_job(self, name, target):
+        """Lanza en segundo plano la copia de una colección a su destino"""
+        filepaths = [filepath for filepath in self.get_collection_files(name) if os.path.exists(filepath)]
+        # Sumas ya calculadas por la verificación, con el tamaño y la fecha a los que corresponden
+        checksums = {}
+        for filepath in filepaths:
+            record = self.library_index.get(filepath)
+            if record is not None and record.verified_checksum():
+                checksums[filepath] = (record.verified_checksum(), record.size, record.mtime)
+        
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        self.add_download_job(job_id, f"Sincronizar '{name}' → {target['destination']}")
+        threading.Thread(target=self._sync_thread, args=(name, target, filepaths, checksums, job_id), daemon=True).start()
+    
+    def _sync_thread(self, name, target, filepaths, checksums, job_id):
+        """Copia o convierte en paralelo solo las pistas nuevas o cambiadas y borra las que sobran"""
+        destination = target["destination"]
+        output_format = target.get("format", "")
+        manifest_file = os.path.join(destination, f".{name}.sync.json")
+        
+        start_time = time.perf_counter()
+        copied = skipped = removed = failed = 0
+        plan = []
+        manifest = None
+        
+        try:
+            os.makedirs(destination, exist_ok=True)
+            manifest = {}
+            if os.path.exists(manifest_file):
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            
+            # Nombre de cada pista en el destino (sin repetir)
+            used = set()
+            for source in filepaths:
+                base, extension = os.path.splitext(os.path.basename(source))
+                convert = bool(output_format) and extension[1:].lower() != output_format
+                if convert:
+                    extension = "." + output_format
+                target_name = base + extension
+                number = 2
+                while target_name.lower() in used:
+                    target_name = f"{base} ({number}){extension}"
+                    number += 1
+                used.add(target_name.lower())
+                plan.append((target_name, source, f"{output_format}:{target['bitrate']}" if convert else "copia"))
+            
+            # Pistas que ya no están en la colección
+            if target.get("delete_extra", True):
+                planned = {target_name for target_name, _, _ in plan}
+                for target_name in set(manifest) - planned:
+                    try:
+                        os.remove(os.path.join(destination, target_name))
+                    except FileNotFoundError:
+                        pass
+                    del manifest[target_name]
+                    removed += 1
+            
+            pending = []
+            for target_name, source, profile in plan:
+                if self.sync_is_current(source, os.path.join(destination, target_name), manifest.get(target_name),
+                                        profile, checksums):
+                    skipped += 1
+                else:
+                    pending.append((target_name, source, profile))
+            
+            workers = os.cpu_count() or 1
+            self.message_queue.put(("log", f"Sincronizando '{name}': {len(pending)} pistas por copiar, {skipped} al día, {removed} borradas"))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self.sync_file, source, os.path.join(destination, target_name), profile,
+                                           target["bitrate"]): (target_name, source, profile)
+                           for target_name, source, profile in pending}
+                for future in as_completed(futures):
+                    target_name, source, profile = futures[future]
+                    try:
+                        method = future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.message_queue.put(("log", f"Error al sincronizar {os.path.basename(source)}: {e}"))
+                        continue
+                    stat = os.stat(source)
+                    manifest[target_name] = {"source": source, "size": stat.st_size, "mtime": stat.st_mtime,
+                                             "profile": profile, "checksum": self.known_checksum(checksums, source, stat),
+                                             "method": method}
+                    copied += 1
+                    
+                    elapsed = max(time.perf_counter() - start_time, 1e-6)
+                    with self.job_progress_lock:
+                        self.job_progress[job_id] = (copied * 100 / len(pending), f"{copied / elapsed:.1f} arch/s")
+        except Exception as e:
+            self.message_queue.put(("log", f"Error al sincronizar '{name}': {e}"))
+        finally:
+            if manifest is None:
+                manifest = {}
+            else:
+                tmp_file = manifest_file + ".tmp"
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f)
+                os.replace(tmp_file, manifest_file)
+            
+            self.message_queue.put(("log", (
+                f"Sincronización de '{name}' terminada: {copied} copiadas, {skipped} al día, {removed} borradas, "
+                f"{failed} con error ({time.perf_counter() - start_time:.1f} s)"
+            )))
+            synced = [(target_name, source) for target_name, source, _ in plan if target_name in manifest]
+            self.message_queue.put(("sync_complete", (name, destination, synced)))
+            self.message_queue.put(("job_finished", job_id))
+    
+    @staticmethod
+    def known_checksum(checksums, source, stat):
+        """Suma del índice si sigue correspondiendo al archivo tal como está en disco"""
+        known = checksums.get(source)
+        if known is not None and known[1] == stat.st_size and known[2] == stat.st_mtime:
+            return known[0]
+        return None
+    
+    def sync_is_current(self, source, target_file, entry, profile, checksums):
+        """Indica si la copia del destino corresponde a la versión actual de la pista"""
+        if entry is None or entry.get("profile") != profile or not os.path.exists(target_file):
+            return False
+        stat = os.stat(source)
+        if entry["size"] != stat.st_size:
+            return False
+        # FAT/exFAT guardan las fechas con 2 segundos de resolución
+        if abs(entry["mtime"] - stat.st_mtime) <= 2:
+            return True
+        # Mismo tamaño pero distinta fecha (p. ej. la biblioteca se copió): comparar el contenido
+        if entry.get("checksum") is None:
+            return False
+        return entry["checksum"] == (self.known_checksum(checksums, source, stat) or self.file_checksum(source))
+    
+    def sync_file(self, source, target_file, profile, bitrate):
+        """Lleva una pista al destino convirtiéndola o clonándola; devuelve el método usado"""
+        if profile != "copia":
+            self.convert_file(source, target_file, profile.split(":")[0], bitrate)
+            return "conversión"
+        return self.clone_file(source, target_file)
+    
+    def clone_file(self, source, target_file):
+        """Copia un archivo usando reflink o enlace duro si ambos están en el mismo sistema de archivos"""
+        tmp_file = target_file + ".part"
+        if os.stat(source).st_dev == os.stat(os.path.dirname(target_file) or ".").st_dev:
+            if fcntl is not None:
+                try:
+                    with open(source, 'rb') as src, open(tmp_file, 'wb') as dst:
+                        fcntl.ioctl(dst.fileno(), self.FICLONE, src.fileno())
+                    shutil.copystat(source, tmp_file)
+                    os.replace(tmp_file, target_file)
+                    return "reflink"
+                except OSError:
+                    if os.path.exists(tmp_file):
+                        os.remove(tmp_file)
+            if os.path.exists(target_file) and os.path.samefile(source, target_file):
+                return "enlace"
+            try:
+                os.link(source, tmp_file)
+                os.replace(tmp_file, target_file)
+                return "enlace"
+            except OSError:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+        
+        shutil.copy2(source, tmp_file)
+        os.replace(tmp_file, target_file)
+        return "copia"
+    
+    def on_sync_complete(self, name, destination, synced):
+        """Escribe la lista M3U de la colección junto a las pistas copiadas"""
+        playlist_file = os.path.join(destination, f"{name}.m3u8")
+        try:
+            Playlists.write(playlist_file, [(os.path.join(destination, target_name), self.library_index.get(source))
+                                            for target_name, source in synced])
+        except OSError as e:
+            self.log_message(f"No se pudo escribir {playlist_file}: {e}")
+        self.update_status(f"Colección '{name}' sincronizada con {destination}")
+    
+    # Importación y exportación de listas de reproducción
+    def import_playlist(self):
+        """Importa una lista M3U/PLS/XSPF/JSON como colección (o la añade a la indicada en el nombre)"""
+        playlist_file = filedialog.askopenfilename(title="Importar lista de reproducción", filetypes=Playlists.FILETYPES)
+        if not playlist_file:
+            return
+        name = self.collection_name_entry.get().strip() or self.safe_filename(os.path.splitext(os.path.basename(playlist_file))[0])
+        if name in self.library_index.smart_rules:
+            messagebox.showwarning("Advertencia", f"'{name}' es una colección inteligente.")
+            return
+        self.update_status(f"Importando {os.path.basename(playlist_file)}...")
+        threading.Thread(target=self._import_playlist_thread, args=(playlist_file, name), daemon=True).start()
+    
+    def _import_playlist_thread(self, playlist_file, name):
+        """Lee la lista por streaming y resuelve todas sus entradas contra el índice de una vez"""
+        try:
+            with metrics.span("playlist_import"):
+                resolved, missing = self.library_index.resolve(Playlists.read(playlist_file))
+        except Exception as e:
+            self.message_queue.put(("log", f"Error al importar {playlist_file}: {e}"))
+            self.message_queue.put(("playlist_imported", (name, playlist_file, None, [])))
+            return
+        self.message_queue.put(("playlist_imported", (name, playlist_file, resolved, missing)))
+    
+    def on_playlist_imported(self, name, playlist_file, resolved, missing):
+        """Guarda las pistas encontradas en la colección con una sola escritura"""
+        if resolved is None:
+            self.update_status(f"No se pudo importar {os.path.basename(playlist_file)}")
+            return
+        added = self.add_files_to_collection(name, resolved)
+        if name not in self.collections_listbox.get(0, tk.END):
+            self.collections_listbox.insert(tk.END, name)
+        for location in missing[:50]:
+            self.log_message(f"No encontrada en la biblioteca: {location}")
+        if len(missing) > 50:
+            self.log_message(f"... y otras {len(missing) - 50} entradas no encontradas")
+        self.update_status(f"Importadas {added} pistas en '{name}' ({len(missing)} no encontradas)")
+    
+    def export_playlist(self, name, filepaths):
+        """Pide un archivo y escribe la lista en el formato de su extensión"""
+        playlist_file = filedialog.asksaveasfilename(title="Exportar lista de reproducción", initialfile=f"{name}.m3u8",
+                                                     defaultextension=".m3u8", filetypes=Playlists.FILETYPES)
+        if not playlist_file:
+            return
+        try:
+            Playlists.write(playlist_file, ((filepath, self.library_index.get(filepath)) for filepath in filepaths))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"No se pudo exportar la lista: {e}")
+            return
+        self.update_status(f"Lista exportada: {playlist_file}")
+    
+    def export_collection_playlist(self):
+        selection = self.collections_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona una colección.")
+            return
+        name = self.collections_listbox.get(selection[0])
+        self.export_playlist(name, self.get_collection_files(name))
+    
+    def export_queue_playlist(self):
+        if not len(self.play_queue):
+            messagebox.showwarning("Advertencia", "La cola de reproducción está vacía.")
+            return
+        self.export_playlist("cola", [self.play_queue.items[item_id]["path"] for item_id in self.play_queue.ids()])
+    
+    def get_collection_files(self, name):
+        """Devuelve las rutas de una colección estática o inteligente"""
+        if name in self.library_index.smart_rules:
+            return self.library_index.smart_collection_files(name)
+        
+        collection_file = os.path.join("collections", f"{name}.json")
+        if os.path.exists(collection_file):
+            with open(collection_file, 'r', encoding='utf-8') as f:
+                return json.load(f)["files"]
+        return []
+    
+    def enqueue_collection(self):
+        """Añade todas las pistas de la colección seleccionada a la cola"""
+        selection = self.collections_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona una colección.")
+            return
+        
+        name = self.collections_listbox.get(selection[0])
+        files = [filepath for filepath in self.get_collection_files(name) if os.path.exists(filepath)]
+        added = self.enqueue_files(files)
+        self.update_status(f"Añadidas {len(added)} pistas de '{name}' a la cola")
+    
+    def play_collection(self):
+        """Encola la colección seleccionada y empieza a reproducirla"""
+        selection = self.collections_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona una colección.")
+            return
+        
+        name = self.collections_listbox.get(selection[0])
+        self.play_files([filepath for filepath in self.get_collection_files(name) if os.path.exists(filepath)])
+    
+    def get_selected_collection_files(self):
+        """Rutas de las pistas seleccionadas en el contenido de la colección"""
+        # El identificador de cada fila es la ruta del archivo
+        return list(self.collection_tree.selection())
+    
+    def play_collection_selection(self):
+        """Reproduce las pistas seleccionadas de la colección"""
+        filepaths = self.get_selected_collection_files()
+        if not filepaths:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
+            return
+        self.play_files(filepaths)
+    
+    def enqueue_collection_selection(self):
+        """Añade a la cola las pistas seleccionadas de la colección"""
+        filepaths = self.get_selected_collection_files()
+        if not filepaths:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
+            return
+        added = self.enqueue_files(filepaths)
+        self.update_status(f"Añadidas {len(added)} pistas a la cola")
+    
+    def remove_from_collection(self):
+        """Quita las pistas seleccionadas de una colección estática con una sola escritura"""
+        selection = self.collections_listbox.curselection()
+        filepaths = self.get_selected_collection_files()
+        if not selection or not filepaths:
+            messagebox.showwarning("Advertencia", "Por favor, selecciona un archivo de audio.")
+            return
+        
+        name = self.collections_listbox.get(selection[0])
+        if name in self.library_index.smart_rules:
+            messagebox.showinfo("Información", "Las colecciones inteligentes se definen por reglas y no admiten cambios manuales.")
+            return
+        
+        collection_file = os.path.join("collections", f"{name}.json")
+        with open(collection_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        removed = set(filepaths)
+        data["files"] = [filepath for filepath in data["files"] if filepath not in removed]
+        with open(collection_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+        
+        self.collection_tree.delete(*filepaths)
+        self.update_status(f"Quitadas {len(filepaths)} pistas de '{name}'")
+    
     def load_collection_content(self, event):
         """Carga el contenido de la colección seleccionada"""
         selection = self.collections_listbox.curselection()
@@ -1099,39 +5512,27 @@ class AudioManagerApp:
             return
         
         name = self.collections_listbox.get(selection[0])
-        collection_file = os.path.join("collections", f"{name}.json")
         
         # Limpiar lista actual
         self.collection_tree.delete(*self.collection_tree.get_children())
         
-        if os.path.exists(collection_file):
-            with open(collection_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        # Mostrar archivos (las colecciones inteligentes se resuelven con el índice)
+        for filepath in self.get_collection_files(name):
+            record = self.library_index.get(filepath)
+            if record is None:
+                if not os.path.exists(filepath):
+                    continue
+                record = self.index_audio_file(filepath)
             
-            # Mostrar archivos
-            for i, filepath in enumerate(data["files"], 1):
-                if os.path.exists(filepath):
-                    filename = os.path.basename(filepath)
-                    
-                    # Obtener duración si es posible
-                    duration = "Desconocida"
-                    try:
-                        audio = MP3(filepath)
-                        duration_sec = audio.info.length
-                        duration = f"{int(duration_sec // 60)}:{int(duration_sec % 60):02d}"
-                    except:
-                        pass
-                    
-                    format_ext = os.path.splitext(filename)[1][1:].upper()
-                    
-                    self.collection_tree.insert("", tk.END, values=(filename, duration, format_ext))
+            if not self.collection_tree.exists(filepath):
+                self.collection_tree.insert("", tk.END, iid=filepath, values=(record.name, self.format_duration(record.duration), record.format))
     
     # Funciones del reproductor
     def toggle_play(self):
         """Alterna entre reproducir y pausar"""
         if not self.is_playing:
             # Si hay algo en la cola, reproducir
-            if self.playlist:
+            if len(self.play_queue):
                 self.play_next_in_queue()
             else:
                 messagebox.showinfo("Información", "No hay canciones en la cola de reproducción.")
@@ -1140,50 +5541,36 @@ class AudioManagerApp:
                 self.player.play()
                 self.is_paused = False
                 self.play_button.config(text="⏸")
+                self.schedule_progress_update()
             else:
                 self.player.pause()
                 self.is_paused = True
                 self.play_button.config(text="▶")
     
-    def play_next_in_queue(self):
+    def play_next_in_queue(self, auto=False):
         """Reproduce la siguiente canción en la cola"""
-        if not self.playlist:
+        item = self.play_queue.next_item(auto)
+        if item is None:
             return
         
-        self.current_index += 1
-        if self.current_index >= len(self.playlist):
-            self.current_index = 0
-        
-        next_file = self.playlist[self.current_index]
-        self.play_audio(next_file)
-        
-        # Resaltar en la lista de cola
-        for item in self.queue_tree.get_children():
-            values = self.queue_tree.item(item, "values")
-            if int(values[0]) == self.current_index + 1:
-                self.queue_tree.selection_set(item)
-                self.queue_tree.see(item)
-                break
+        self.play_audio(item["path"])
+        self.highlight_current_in_queue()
     
     def previous_track(self):
         """Reproduce la canción anterior"""
-        if not self.playlist:
+        item = self.play_queue.previous_item()
+        if item is None:
             return
         
-        self.current_index -= 1
-        if self.current_index < 0:
-            self.current_index = len(self.playlist) - 1
-        
-        prev_file = self.playlist[self.current_index]
-        self.play_audio(prev_file)
-        
-        # Resaltar en la lista de cola
-        for item in self.queue_tree.get_children():
-            values = self.queue_tree.item(item, "values")
-            if int(values[0]) == self.current_index + 1:
-                self.queue_tree.selection_set(item)
-                self.queue_tree.see(item)
-                break
+        self.play_audio(item["path"])
+        self.highlight_current_in_queue()
+    
+    def highlight_current_in_queue(self):
+        """Resalta el elemento actual de la cola"""
+        current_id = self.play_queue.current_id
+        if current_id and self.queue_tree.exists(current_id):
+            self.queue_tree.selection_set(current_id)
+            self.queue_tree.see(current_id)
     
     def next_track(self):
         """Reproduce la siguiente canción"""
@@ -1192,13 +5579,12 @@ class AudioManagerApp:
     def seek_track(self, value):
         """Busca una posición en la canción actual"""
         if self.is_playing and not self.is_paused:
-            # Convertir valor de escala a tiempo
-            media = self.player.get_media()
-            if media:
-                media.parse()  # Parsear para obtener duración
-                duration = media.get_duration() / 1000  # en segundos
-                seek_time = (float(value) / 100) * duration
-                self.player.set_time(int(seek_time * 1000))
+            # Convertir valor de escala a tiempo; la duración la da el reproductor sin analizar el medio
+            # (update_progress mueve la escala cada segundo y esto se llama desde la interfaz)
+            duration = self.player.get_length()  # en milisegundos
+            if duration <= 0:
+                return
+            self.player.set_time(int(float(value) / 100 * duration))
     
     def change_volume(self, value):
         """Cambia el volumen"""
@@ -1206,6 +5592,7 @@ class AudioManagerApp:
         self.player.audio_set_volume(int(self.volume * 100))
         self.config.set("volume", int(value))
     
+    @metrics.timed("ui_refresh")
     def update_progress(self):
         """Actualiza la barra de progreso y el tiempo"""
         if self.is_playing and not self.is_paused:
@@ -1214,8 +5601,8 @@ class AudioManagerApp:
             media = self.player.get_media()
             
             if media:
-                media.parse()
-                duration = media.get_duration() / 1000  # en segundos
+                # La duración la da el reproductor: analizar el medio bloquearía la interfaz
+                duration = self.player.get_length() / 1000  # en segundos
                 
                 if duration > 0:
                     # Actualizar barra de progreso
@@ -1231,63 +5618,63 @@ class AudioManagerApp:
             state = self.player.get_state()
             if state == vlc.State.Ended:
                 self.is_playing = False
-                self.play_next_in_queue()
+                self.play_next_in_queue(auto=True)
         
-        # Programar próxima actualización
-        self.root.after(1000, self.update_progress)
+        # Programar próxima actualización solo mientras haya reproducción activa
+        if self.is_playing and not self.is_paused:
+            self.root.after(1000, self.update_progress)
+        else:
+            self.progress_update_scheduled = False
     
-    def update_song_duration(self):
-        """Actualiza la duración de la canción actual"""
+    def schedule_progress_update(self):
+        """Inicia la actualización periódica del progreso si no está en marcha"""
+        if not self.progress_update_scheduled:
+            self.progress_update_scheduled = True
+            self.root.after(1000, self.update_progress)
+    
+    def update_song_duration(self, attempts=10):
+        """Actualiza la duración de la canción actual cuando VLC la conoce (sin bloquear)"""
         if self.is_playing:
             media = self.player.get_media()
             if media:
-                media.parse()
                 duration = media.get_duration() / 1000  # en segundos
                 if duration > 0:
                     duration_str = f"{int(duration // 60)}:{int(duration % 60):02d}"
                     self.time_label.config(text=f"00:00 / {duration_str}")
+                elif attempts > 0:
+                    if attempts == 10:
+                        media.parse_with_options(vlc.MediaParseFlag.local, 0)
+                    self.root.after(100, lambda: self.update_song_duration(attempts - 1))
     
-    def move_up_in_queue(self):
-        """Mueve hacia arriba la canción seleccionada en la cola"""
+    def queue_row_values(self, item, position):
+        """Valores de la fila de la cola para un elemento"""
+        return (position + 1, item["name"], self.format_duration(item["duration"]))
+    
+    def move_in_queue(self, offset):
+        """Mueve la canción seleccionada en la cola actualizando solo las filas afectadas"""
         selection = self.queue_tree.selection()
         if not selection:
             return
         
-        item = selection[0]
-        index = self.queue_tree.index(item)
+        item_id = selection[0]
+        other_id = self.play_queue.move(item_id, offset)
+        if other_id is None:
+            return
         
-        if index > 0:
-            # Mover en la lista de reproducción
-            self.playlist[index], self.playlist[index-1] = self.playlist[index-1], self.playlist[index]
-            
-            # Actualizar árbol
-            values = self.queue_tree.item(item, "values")
-            self.queue_tree.delete(item)
-            self.queue_tree.insert("", index-1, values=values)
-            
-            # Actualizar índices
-            self.update_queue_indices()
+        # Las filas del árbol no tienen huecos: los números salen de su posición en él
+        position = self.queue_tree.index(item_id)
+        target = self.queue_tree.index(other_id)
+        self.queue_tree.move(item_id, "", target)
+        self.queue_tree.set(item_id, "#", target + 1)
+        self.queue_tree.set(other_id, "#", position + 1)
+    
+    def move_up_in_queue(self):
+        """Mueve hacia arriba la canción seleccionada en la cola"""
+        self.move_in_queue(-1)
     
     def move_down_in_queue(self):
         """Mueve hacia abajo la canción seleccionada en la cola"""
-        selection = self.queue_tree.selection()
-        if not selection:
-            return
-        
-        item = selection[0]
-        index = self.queue_tree.index(item)
-        
-        if index < len(self.playlist) - 1:
-            # Mover en la lista de reproducción
-            self.playlist[index], self.playlist[index+1] = self.playlist[index+1], self.playlist[index]
-            
-            # Actualizar árbol
-            values = self.queue_tree.item(item, "values")
-            self.queue_tree.delete(item)
-            self.queue_tree.insert("", index+1, values=values)
-            
-            # Actualizar índices
-            self.update_queue_indices()
+        self.move_in_queue(1)
     
     def remove_from_queue(self):
         """Elimina la canción seleccionada de la cola"""
@@ -1295,30 +5682,25 @@ class AudioManagerApp:
         if not selection:
             return
         
-        item = selection[0]
-        index = self.queue_tree.index(item)
-        
-        # Eliminar de la lista de reproducción
-        if index < len(self.playlist):
-            removed_file = self.playlist.pop(index)
-            
-            # Si era la canción actual, reproducir la siguiente
-            if self.current_playing == removed_file:
-                self.player.stop()
-                self.play_next_in_queue()
+        item_id = selection[0]
+        was_current = item_id == self.play_queue.current_id
         
-        # Eliminar del árbol
-        self.queue_tree.delete(item)
+        # Eliminar de la cola y del árbol
+        position = self.queue_tree.index(item_id)
+        self.play_queue.remove(item_id)
+        self.queue_tree.delete(item_id)
+        self.update_queue_indices(position)
         
-        # Actualizar índices
-        self.update_queue_indices()
+        # Si era la canción actual, reproducir la siguiente
+        if was_current and self.is_playing:
+            self.player.stop()
+            self.play_next_in_queue()
     
     def clear_queue(self):
         """Limpia toda la cola de reproducción"""
         if messagebox.askyesno("Confirmar", "¿Estás seguro de que quieres limpiar toda la cola de reproducción?"):
-            self.playlist.clear()
+            self.play_queue.clear()
             self.queue_tree.delete(*self.queue_tree.get_children())
-            self.current_index = -1
             
             # Detener reproducción si está activa
             if self.is_playing:
@@ -1327,14 +5709,61 @@ class AudioManagerApp:
                 self.play_button.config(text="▶")
                 self.current_song_label.config(text="No hay ninguna canción en reproducción")
     
-    def update_queue_indices(self):
-        """Actualiza los índices en la cola de reproducción"""
-        for i, item in enumerate(self.queue_tree.get_children(), 1):
-            values = list(self.queue_tree.item(item, "values"))
-            values[0] = i
-            self.queue_tree.item(item, values=values)
+    def update_queue_indices(self, start=0):
+        """Renumera la cola desde una posición: al momento las filas visibles, el resto por lotes"""
+        rows = self.queue_tree.get_children()
+        total = len(rows)
+        first, last = self.queue_tree.yview()
+        for position in range(max(start, int(first * total)), min(total, int(last * total) + 1)):
+            self.queue_tree.set(rows[position], "#", position + 1)
+        
+        pending = self.queue_renumber_from
+        self.queue_renumber_from = start if pending is None else min(start, pending)
+        if pending is None:
+            self.root.after_idle(self.renumber_queue_batch)
+    
+    def renumber_queue_batch(self):
+        """Renumera un lote de filas de la cola y programa el siguiente si quedan"""
+        start = self.queue_renumber_from
+        rows = self.queue_tree.get_children()
+        end = min(len(rows), start + self.QUEUE_RENUMBER_BATCH)
+        for position in range(start, end):
+            self.queue_tree.set(rows[position], "#", position + 1)
+        if end < len(rows):
+            self.queue_renumber_from = end
+            self.root.after(10, self.renumber_queue_batch)
+        else:
+            self.queue_renumber_from = None
+    
+    def toggle_shuffle(self):
+        """Activa o desactiva el modo aleatorio"""
+        self.play_queue.set_shuffle(self.shuffle_var.get())
+    
+    def change_repeat_mode(self, event=None):
+        """Cambia el modo de repetición"""
+        for mode, label in self.repeat_labels.items():
+            if label == self.repeat_var.get():
+                self.play_queue.set_repeat(mode)
     
     # Funciones auxiliares
+    def open_arguments(self, args):
+        """Abre archivos o descarga URLs recibidos por línea de comandos o desde otra ejecución"""
+        urls = [arg for arg in args if arg.startswith(("http://", "https://"))]
+        filepaths = [arg for arg in args if not arg.startswith("-") and os.path.isfile(arg)]
+        for url in urls:
+            self.queue_download(url)
+        if filepaths:
+            if "--enqueue" in args:
+                added = self.enqueue_files(filepaths)
+                self.update_status(f"Añadidas {len(added)} pistas a la cola")
+            else:
+                self.play_files(filepaths)
+        
+        # Traer la ventana al frente
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+    
     def open_audio_file(self):
         """Abre un archivo de audio para reproducir"""
         filepath = filedialog.askopenfilename(
@@ -1355,17 +5784,35 @@ class AudioManagerApp:
 
 def main():
     """Función principal"""
+    # Instancia única: el socket se abre antes de crear la ventana, para que las ejecuciones
+    # que esperan el bloqueo puedan entregar sus argumentos cuanto antes
+    instance_server = InstanceServer()
+    try:
+        instance_server.start()
+    except OSError as e:
+        print(f"No se pudo iniciar el modo de instancia única: {e}")
+    
     root = tk.Tk()
     app = AudioManagerApp(root)
+    instance_server.set_handler(lambda args: app.message_queue.put(("open_arguments", args)))
     
     # Cargar archivos de audio al iniciar
     root.after(100, app.load_audio_files)
     
+    if len(sys.argv) > 1:
+        root.after(200, lambda: app.open_arguments(sys.argv[1:]))
+    
     # Manejar cierre de ventana
     def on_closing():
         # Detener reproducción
         if app.is_playing:
             app.player.stop()
+        app.tag_writer.close()
+        app.close_stream()
+        app.downloads.shutdown()
+        instance_server.close()
+        app.library_index.save()
+        app.play_queue.save()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
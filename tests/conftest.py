@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+# Dependencias que MusicApp importa al cargarse
+REQUIRED_MODULES = ("pytube", "pydub", "mutagen", "PIL", "vlc", "yt_dlp", "numpy")
+
+
+@pytest.fixture(scope="session")
+def music_app():
+    """Módulo de la aplicación; las pruebas se omiten si faltan dependencias"""
+    for name in REQUIRED_MODULES:
+        pytest.importorskip(name)
+    import MusicApp
+    return MusicApp
@@ -0,0 +1,69 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+SECONDS = 60
+
+
+def burst(sample_rate, length, decay, frequency=None, seed=0):
+    """Golpe corto: tono grave (bombo) o ruido (charles) con caída exponencial"""
+    t = np.arange(length) / sample_rate
+    if frequency is None:
+        source = np.random.default_rng(seed).standard_normal(length)
+    else:
+        source = np.sin(2 * np.pi * frequency * t)
+    return (source * np.exp(-t * decay)).astype(np.float32)
+
+
+def click_track(sample_rate, bpm, hat_gain=0.0, accent_every=1, accent_gain=1.0, beat_gain=1.0):
+    """Bombo en cada pulso (acentuado cada `accent_every`) y, opcionalmente, charles a contratiempo"""
+    signal = np.zeros(sample_rate * SECONDS, dtype=np.float32)
+    kick = burst(sample_rate, 2000, 30, frequency=60)
+    hat = burst(sample_rate, 1500, 200)
+    period = 60 / bpm
+    for number, beat in enumerate(np.arange(0, SECONDS - 0.2, period)):
+        start = int(beat * sample_rate)
+        gain = beat_gain * (accent_gain if number % accent_every == 0 else 1.0)
+        signal[start:start + len(kick)] += gain * kick
+        if hat_gain:
+            start = int((beat + period / 2) * sample_rate)
+            signal[start:start + len(hat)] += hat_gain * hat
+    signal += np.random.default_rng(1).standard_normal(len(signal)).astype(np.float32) * 0.001
+    return signal
+
+
+def assert_tempo(music_app, bpm, **pattern):
+    index = music_app.SimilarityIndex
+    _, detected = index.features(click_track(index.SAMPLE_RATE, bpm, **pattern))
+    assert detected == pytest.approx(bpm, rel=0.05)
+
+
+@pytest.mark.parametrize("bpm", [65, 70, 90, 100, 120, 140, 160, 180, 195])
+def test_plain_beat(music_app, bpm):
+    assert_tempo(music_app, bpm)
+
+
+@pytest.mark.parametrize("bpm", [70, 90, 120, 140, 160, 180])
+def test_backbeat_accents_do_not_halve_the_tempo(music_app, bpm):
+    assert_tempo(music_app, bpm, accent_every=2, accent_gain=2.0)
+
+
+@pytest.mark.parametrize("bpm", [80, 100])
+def test_quiet_off_beat_hats_do_not_double_the_tempo(music_app, bpm):
+    assert_tempo(music_app, bpm, hat_gain=0.15)
+
+
+@pytest.mark.parametrize("bpm", [120, 140])
+def test_accented_eighth_notes_give_the_beat(music_app, bpm):
+    # Corcheas con el pulso acentuado: ni 3:2 (120 -> 80) ni el doble
+    index = music_app.SimilarityIndex
+    signal = click_track(index.SAMPLE_RATE, bpm * 2, accent_every=2, accent_gain=2.0, beat_gain=0.5)
+    _, detected = index.features(signal)
+    assert detected == pytest.approx(bpm, rel=0.05)
+
+
+@pytest.mark.parametrize("bpm", [120, 140])
+def test_even_eighth_notes_give_the_beat(music_app, bpm):
+    index = music_app.SimilarityIndex
+    _, detected = index.features(click_track(index.SAMPLE_RATE, bpm * 2))
+    assert detected == pytest.approx(bpm, rel=0.05)
@@ -0,0 +1,48 @@
+import os
+
+
+def make_planner(music_app, tmp_path):
+    """AudioManagerApp sin interfaz, solo con el índice que usa el planificador"""
+    app = object.__new__(music_app.AudioManagerApp)
+    app.library_index = music_app.LibraryIndex(str(tmp_path / "library_index.json"))
+    return app
+
+
+def touch(path, mtime=None):
+    path.write_bytes(b"audio")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_second_run_reuses_existing_outputs(music_app, tmp_path):
+    app = make_planner(music_app, tmp_path)
+    sources = [touch(tmp_path / "x.wav", 1000), touch(tmp_path / "y.wav", 1000)]
+
+    first = app.plan_transcode_targets(sources, "mp3")
+    assert first == {sources[0]: str(tmp_path / "x.mp3"), sources[1]: str(tmp_path / "y.mp3")}
+
+    # Simula las salidas que escribió la primera ejecución
+    for output_file in first.values():
+        touch(tmp_path / os.path.basename(output_file), 2000)
+
+    second = app.plan_transcode_targets(sources, "mp3")
+    assert second == first
+    assert all(app.is_converted(source, second[source]) for source in sources)
+
+
+def test_unrelated_older_output_is_not_overwritten(music_app, tmp_path):
+    app = make_planner(music_app, tmp_path)
+    touch(tmp_path / "x.mp3", 1000)
+    source = touch(tmp_path / "x.wav", 2000)
+
+    assert app.plan_transcode_targets([source], "mp3") == {source: str(tmp_path / "x (2).mp3")}
+
+
+def test_sources_with_the_same_name_get_distinct_outputs(music_app, tmp_path):
+    app = make_planner(music_app, tmp_path)
+    sources = [touch(tmp_path / "x.wav"), touch(tmp_path / "x.flac"), touch(tmp_path / "y.mp3")]
+
+    targets = app.plan_transcode_targets(sources, "mp3")
+    assert targets[sources[2]] == sources[2]
+    assert sorted(os.path.basename(targets[source]) for source in sources[:2]) == ["x (2).mp3", "x.mp3"]